@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the Secure Audio Converter.
+
+Generates deterministic inputs with ffmpeg's lavfi sources (sine and noise
+audio at several durations, and MP4/MKV/MOV files with an audio track),
+then times convert_file and convert_batch across output formats, qualities
+and worker counts. Every scenario runs in a fresh Python process so its CPU
+time and peak RSS (ffmpeg children included) are measured in isolation.
+
+Usage:
+  python benchmark.py --output results.json
+  python benchmark.py --quick
+  python benchmark.py --compare baseline.json --threshold 0.15
+
+Results are written as JSON. With --compare, scenarios whose median wall time
+or peak RSS grew by more than the threshold are reported as regressions and
+the exit code is 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+script_dir = Path(__file__).parent / "src" / "script"
+sys.path.insert(0, str(script_dir))
+
+try:
+    import resource
+except ImportError:
+    # Windows: CPU time falls back to os.times(), peak RSS is not reported
+    resource = None
+
+DEFAULT_DURATIONS = [10, 60]
+DEFAULT_FORMATS = ['mp3', 'wav', 'm4a']
+DEFAULT_QUALITIES = ['high', 'low']
+DEFAULT_WORKERS = [1, 2, 4]
+DEFAULT_REPEATS = 3
+DEFAULT_THRESHOLD = 0.10
+
+# Seconds of each video container test file
+VIDEO_DURATION = 10
+VIDEO_CONTAINERS = ['mp4', 'mkv', 'mov']
+
+# lavfi audio sources (deterministic: fixed frequency, fixed noise seed)
+AUDIO_SOURCES = {
+    'sine': 'sine=frequency=440:sample_rate=44100',
+    'noise': 'anoisesrc=color=pink:seed=42:sample_rate=44100:amplitude=0.5',
+}
+
+
+def generate_inputs(ffmpeg_path, work_dir, durations):
+    """
+    Create the benchmark inputs with lavfi sources.
+
+    Args:
+        ffmpeg_path: ffmpeg executable
+        work_dir: Directory receiving the files
+        durations: Audio durations in seconds
+
+    Returns:
+        dict: Input name -> {'path', 'duration', 'kind'}
+    """
+    inputs = {}
+    bitexact = ['-fflags', '+bitexact', '-flags:a', '+bitexact', '-map_metadata', '-1']
+
+    def run(cmd):
+        subprocess.run([ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y'] + cmd,
+                       check=True, stdin=subprocess.DEVNULL)
+
+    for source, graph in AUDIO_SOURCES.items():
+        for duration in durations:
+            name = f"{source}_{duration}s.wav"
+            path = Path(work_dir) / name
+            run(['-f', 'lavfi', '-i', f"{graph}:duration={duration}", '-ac', '2',
+                 '-c:a', 'pcm_s16le', *bitexact, str(path)])
+            inputs[name] = {'path': str(path), 'duration': float(duration), 'kind': 'audio'}
+
+    for container in VIDEO_CONTAINERS:
+        name = f"video_{VIDEO_DURATION}s.{container}"
+        path = Path(work_dir) / name
+        run(['-f', 'lavfi', '-i', f"testsrc=size=320x240:rate=25:duration={VIDEO_DURATION}",
+             '-f', 'lavfi', '-i', f"{AUDIO_SOURCES['sine']}:duration={VIDEO_DURATION}",
+             '-c:v', 'mpeg4', '-q:v', '5', '-c:a', 'aac', '-b:a', '128k', '-ac', '2',
+             '-shortest', *bitexact, str(path)])
+        inputs[name] = {'path': str(path), 'duration': float(VIDEO_DURATION), 'kind': 'video'}
+
+    return inputs
+
+
+def build_scenarios(inputs, formats, qualities, workers):
+    """List the scenarios to measure (stable names are used to match baselines)."""
+    scenarios = []
+    for name, info in inputs.items():
+        for fmt in formats:
+            for quality in qualities:
+                scenarios.append({
+                    'name': f"file/{name}/{fmt}/{quality}",
+                    'kind': 'file',
+                    'inputs': [info['path']],
+                    'duration': info['duration'],
+                    'format': fmt,
+                    'quality': quality,
+                    'workers': 1,
+                })
+
+    audio = [info for info in inputs.values() if info['kind'] == 'audio']
+    for fmt in formats:
+        for quality in qualities:
+            for count in workers:
+                scenarios.append({
+                    'name': f"batch/{fmt}/{quality}/w{count}",
+                    'kind': 'batch',
+                    'inputs': [info['path'] for info in audio],
+                    'duration': sum(info['duration'] for info in audio),
+                    'format': fmt,
+                    'quality': quality,
+                    'workers': count,
+                })
+    return scenarios
+
+
+def _cpu_seconds():
+    """CPU time of this process and its waited-for children."""
+    if resource is not None:
+        total = 0.0
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+            usage = resource.getrusage(who)
+            total += usage.ru_utime + usage.ru_stime
+        return total
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _peak_rss_mb():
+    """Largest resident set of this process or any of its children, in MB."""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_scenario(scenario):
+    """
+    Run one scenario in the current process (called in a fresh worker process).
+
+    Returns:
+        dict: Wall and CPU seconds, peak RSS and success flag
+    """
+    import logging
+    logging.disable(logging.CRITICAL)
+    from converter_core import SecureAudioConverter
+
+    # No caches: every run must do the full work
+    converter = SecureAudioConverter(cache=None, probe_cache=None)
+    output_format = '.' + scenario['format']
+    output_dir = tempfile.mkdtemp(prefix='bench-out-')
+    try:
+        cpu_start = _cpu_seconds()
+        start = time.perf_counter()
+        if scenario['kind'] == 'file':
+            success = converter.convert_file(scenario['inputs'][0], output_format, output_dir,
+                                             quality=scenario['quality'])
+        else:
+            results = converter.convert_batch(scenario['inputs'], output_format, output_dir,
+                                              quality=scenario['quality'], max_workers=scenario['workers'])
+            success = all(results)
+        wall = time.perf_counter() - start
+        cpu = _cpu_seconds() - cpu_start
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    return {'wall_s': wall, 'cpu_s': cpu, 'peak_rss_mb': _peak_rss_mb(), 'success': bool(success)}
+
+
+def measure(scenario, repeats):
+    """Run a scenario repeats times, each in its own process, and summarise the runs."""
+    runs = []
+    for _ in range(repeats):
+        completed = subprocess.run(
+            [sys.executable, __file__, '--run-scenario', json.dumps(scenario)],
+            capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Scenario {scenario['name']} crashed: {completed.stderr.strip()}")
+        runs.append(json.loads(completed.stdout))
+
+    walls = [run['wall_s'] for run in runs]
+    wall = statistics.median(walls)
+    rss = [run['peak_rss_mb'] for run in runs if run['peak_rss_mb'] is not None]
+    return {
+        'name': scenario['name'],
+        'kind': scenario['kind'],
+        'format': scenario['format'],
+        'quality': scenario['quality'],
+        'workers': scenario['workers'],
+        'files': len(scenario['inputs']),
+        'media_seconds': scenario['duration'],
+        'repeats': repeats,
+        'wall_s': round(wall, 4),
+        'wall_min_s': round(min(walls), 4),
+        'cpu_s': round(statistics.median(run['cpu_s'] for run in runs), 4),
+        'realtime_factor': round(scenario['duration'] / wall, 2) if wall > 0 else None,
+        'peak_rss_mb': round(max(rss), 1) if rss else None,
+        'success': all(run['success'] for run in runs),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a baseline run.
+
+    Returns:
+        list: (name, metric, baseline value, current value, relative change) per regression
+    """
+    previous = {entry['name']: entry for entry in baseline['results']}
+    regressions = []
+    for entry in results['results']:
+        old = previous.get(entry['name'])
+        if old is None:
+            continue
+        for metric in ('wall_s', 'peak_rss_mb'):
+            before, after = old.get(metric), entry.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if change > threshold:
+                regressions.append((entry['name'], metric, before, after, change))
+        if old.get('success') and not entry['success']:
+            regressions.append((entry['name'], 'success', True, False, None))
+    return regressions
+
+
+def environment(ffmpeg_path):
+    """Describe the machine and ffmpeg build the results were taken on."""
+    version = subprocess.run([ffmpeg_path, '-version'], capture_output=True, text=True).stdout
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': version.splitlines()[0] if version else 'unknown',
+    }
+
+
+def parse_list(value, cast=str):
+    return [cast(item.strip()) for item in value.split(',') if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark convert_file and convert_batch")
+    parser.add_argument('--durations', type=lambda v: parse_list(v, int), default=DEFAULT_DURATIONS,
+                        help='Comma-separated audio durations in seconds (default: 10,60)')
+    parser.add_argument('--formats', type=parse_list, default=DEFAULT_FORMATS,
+                        help='Comma-separated output formats (default: mp3,wav,m4a)')
+    parser.add_argument('--qualities', type=parse_list, default=DEFAULT_QUALITIES,
+                        help='Comma-separated qualities (default: high,low)')
+    parser.add_argument('--workers', type=lambda v: parse_list(v, int), default=DEFAULT_WORKERS,
+                        help='Comma-separated batch worker counts (default: 1,2,4)')
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                        help='Runs per scenario; the median is reported (default: 3)')
+    parser.add_argument('--filter', default='', help='Only run scenarios whose name contains this text')
+    parser.add_argument('--quick', action='store_true',
+                        help='Small smoke run: 5s inputs, mp3 only, high quality, 1 and 2 workers, 1 repeat')
+    parser.add_argument('--output', '-o', help='Write the results JSON to this file (default: stdout)')
+    parser.add_argument('--compare', metavar='BASELINE', help='Flag regressions against a saved results file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Relative increase counted as a regression (default: 0.10)')
+    parser.add_argument('--run-scenario', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        print(json.dumps(run_scenario(json.loads(args.run_scenario))))
+        return 0
+
+    if args.quick:
+        args.durations, args.formats, args.qualities, args.workers, args.repeats = [5], ['mp3'], ['high'], [1, 2], 1
+
+    from converter_core import SecureAudioConverter
+    ffmpeg_path = SecureAudioConverter().ffmpeg_path
+
+    work_dir = tempfile.mkdtemp(prefix='bench-in-')
+    try:
+        print(f"Generating inputs in {work_dir}...", file=sys.stderr)
+        inputs = generate_inputs(ffmpeg_path, work_dir, args.durations)
+        scenarios = [s for s in build_scenarios(inputs, args.formats, args.qualities, args.workers)
+                     if args.filter in s['name']]
+
+        results = {'environment': environment(ffmpeg_path), 'results': []}
+        for index, scenario in enumerate(scenarios, 1):
+            entry = measure(scenario, args.repeats)
+            results['results'].append(entry)
+            print(f"[{index}/{len(scenarios)}] {entry['name']}: {entry['wall_s']:.3f}s wall, "
+                  f"{entry['cpu_s']:.3f}s CPU, {entry['realtime_factor']}x realtime, "
+                  f"{entry['peak_rss_mb']}MB peak RSS{'' if entry['success'] else ' (FAILED)'}",
+                  file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(report + '\n')
+    else:
+        print(report)
+
+    exit_code = 0 if all(entry['success'] for entry in results['results']) else 1
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, before, after, change in regressions:
+            if change is None:
+                print(f"REGRESSION {name}: conversion now fails", file=sys.stderr)
+            else:
+                print(f"REGRESSION {name}: {metric} {before} -> {after} (+{change:.0%})", file=sys.stderr)
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"No regressions beyond {args.threshold:.0%} against {args.compare}", file=sys.stderr)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
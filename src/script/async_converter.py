@@ -0,0 +1,506 @@
+"""
+asyncio-native conversion API.
+
+AsyncAudioConverter offers coroutine counterparts of SecureAudioConverter's
+convert_file and convert_batch. ffmpeg and ffprobe are driven through
+asyncio.create_subprocess_exec, so one event loop can supervise hundreds of
+in-flight conversions without a thread per call. Work that blocks (hashing,
+cache file copies, input validation, claiming the output name, probe cache
+lookups) is handed to the default executor so the loop never waits on disk
+or SQLite.
+
+Concurrency is bounded by a semaphore. Cancelling the task running a
+conversion terminates its ffmpeg process (killing it if it does not exit
+promptly) and removes the partial output. start_file()/start_batch() return an
+AsyncConversion handle that can be iterated for progress updates and awaited
+for the result:
+
+    conversion = converter.start_file('talk.mp4', '.mp3')
+    async for update in conversion:
+        print(update.message, update.percent)
+    result = await conversion   # ConversionResult, truthy on success
+
+Segment-parallel encoding of long inputs is only available in the blocking API.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import subprocess
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+from config import DEFAULT_MAX_WORKERS
+from conversion_cache import ConversionCache
+from conversion_result import ConversionResult
+from converter_core import SecureAudioConverter
+from ffmpeg_runner import (MAX_LINE_LENGTH, TERMINATE_GRACE, ProgressParser, StderrBuffer, TimeLimit,
+                           ffmpeg_base_args)
+from media_probe import MediaInfo, ffprobe_command
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressUpdate(NamedTuple):
+    """One progress report (same values as a progress_callback call)."""
+    message: str
+    percent: float
+
+
+class AsyncConversion:
+    """Handle to a conversion running as an asyncio task."""
+
+    def __init__(self, coroutine_factory):
+        """
+        Args:
+            coroutine_factory: Callable taking a progress callback and returning
+                the conversion coroutine
+        """
+        self._updates: asyncio.Queue = asyncio.Queue()
+        self._exhausted = False
+        self.task = asyncio.ensure_future(coroutine_factory(self._publish))
+        self.task.add_done_callback(lambda _: self._updates.put_nowait(None))
+
+    def _publish(self, message: str, percent: float):
+        self._updates.put_nowait(ProgressUpdate(message, percent))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ProgressUpdate:
+        if self._exhausted:
+            raise StopAsyncIteration
+        update = await self._updates.get()
+        if update is None:
+            self._exhausted = True
+            raise StopAsyncIteration
+        return update
+
+    def __await__(self):
+        return self.task.__await__()
+
+    def cancel(self) -> bool:
+        """Cancel the conversion (ffmpeg is stopped and partial output removed)."""
+        return self.task.cancel()
+
+    def done(self) -> bool:
+        """True once the conversion finished, failed or was cancelled."""
+        return self.task.done()
+
+
+async def _stop_process(process: asyncio.subprocess.Process):
+    """Terminate a subprocess, killing it if it does not exit within TERMINATE_GRACE."""
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), TERMINATE_GRACE)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+    except ProcessLookupError:
+        pass
+
+
+async def _drain_stderr(stream: asyncio.StreamReader, buffer: StderrBuffer):
+    """Read ffmpeg's log to EOF into a bounded buffer."""
+    pending = b''
+    while True:
+        chunk = await stream.read(MAX_LINE_LENGTH)
+        if not chunk:
+            break
+        *lines, pending = (pending + chunk).split(b'\n')
+        for line in lines:
+            buffer.append(line.decode('utf-8', errors='replace') + '\n')
+        if len(pending) >= MAX_LINE_LENGTH:
+            buffer.append(pending.decode('utf-8', errors='replace'))
+            pending = b''
+    if pending:
+        buffer.append(pending.decode('utf-8', errors='replace'))
+
+
+async def _claim_output(loop: asyncio.AbstractEventLoop, converter: SecureAudioConverter,
+                        input_path: Path, output_dir: Optional[str], output_format: str) -> Path:
+    """Claim the output path in the executor; a claim finishing after cancellation is given back."""
+    future = loop.run_in_executor(None, converter._sanitize_output_path, input_path, output_dir, output_format)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        def release(done):
+            if not done.cancelled() and done.exception() is None:
+                output_path = done.result()
+                output_path.unlink(missing_ok=True)
+                converter._release_output_path(output_path)
+        future.add_done_callback(release)
+        raise
+
+
+class AsyncAudioConverter:
+    """Coroutine-based front end for SecureAudioConverter."""
+
+    def __init__(self, converter: Optional[SecureAudioConverter] = None,
+                 max_concurrency: Optional[int] = None):
+        """
+        Args:
+            converter: Converter providing validation, command building and caches
+                (default: a new SecureAudioConverter)
+            max_concurrency: Maximum conversions in flight (default: CPU count)
+        """
+        self.converter = converter or SecureAudioConverter()
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_WORKERS
+        if self.max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _slots(self) -> asyncio.Semaphore:
+        """Semaphore bounding concurrent conversions (created inside the running loop)."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def probe(self, input_file: str, file_hash: Optional[str] = None) -> Optional[MediaInfo]:
+        """
+        Inspect a media file with ffprobe, using the converter's probe cache when available.
+
+        Args:
+            input_file: Path to the media file
+            file_hash: SHA-256 of the file, if already known
+
+        Returns:
+            MediaInfo: Container and audio stream metadata, or None if unavailable
+        """
+        loop = asyncio.get_running_loop()
+        path = Path(input_file).resolve()
+        probe_cache = self.converter.probe_cache
+        if probe_cache:
+            cached = await loop.run_in_executor(None, probe_cache.get, path, file_hash)
+            if cached is not None:
+                return cached
+
+        if not self.converter.ffprobe_path:
+            return None
+
+        process = await asyncio.create_subprocess_exec(
+            *ffprobe_command(self.converter.ffprobe_path, path),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), 30)
+        except BaseException:
+            await _stop_process(process)
+            raise
+
+        if process.returncode != 0:
+            logger.warning(f"ffprobe error (code {process.returncode}) for {path}: "
+                           f"{stderr.decode('utf-8', errors='replace').strip()}")
+            return None
+        try:
+            info = MediaInfo.from_ffprobe(json.loads(stdout))
+        except json.JSONDecodeError as e:
+            logger.warning(f"Could not parse ffprobe output for {path}: {e}")
+            return None
+
+        if probe_cache:
+            await loop.run_in_executor(None, probe_cache.put, path, info, file_hash)
+        return info
+
+    async def run_ffmpeg(self, cmd: List[str], duration: Optional[float] = None,
+                         progress_callback=None, timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """
+        Run an ffmpeg command as an asyncio subprocess, streaming its progress.
+
+        Args:
+            cmd: FFmpeg command (executable first)
+            duration: Probed input duration in seconds, used for percentages and the time limit
+            progress_callback: Optional callback(message, percent) for progress updates
+            timeout: Fixed time limit in seconds (default: derived from the duration
+                and the observed encode speed)
+
+        Returns:
+            subprocess.CompletedProcess: Exit code and captured stderr
+
+        Raises:
+            asyncio.CancelledError: If the calling task is cancelled (ffmpeg is stopped first)
+            subprocess.TimeoutExpired: If ffmpeg ran past its time limit or stalled
+        """
+        full_cmd = ffmpeg_base_args(cmd[0]) + list(cmd[1:])
+        with stage('spawn'):
+            process = await asyncio.create_subprocess_exec(
+                *full_cmd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        stderr_buffer = StderrBuffer()
+        stderr_task = asyncio.ensure_future(_drain_stderr(process.stderr, stderr_buffer))
+        time_limit = TimeLimit(duration, timeout)
+        parser = ProgressParser(duration)
+
+        try:
+            while True:
+                reason = time_limit.exceeded()
+                if reason:
+                    logger.warning(f"Stopping ffmpeg (pid {process.pid}): {reason} "
+                                   f"after {time_limit.elapsed:.0f}s")
+                    await _stop_process(process)
+                    await stderr_task
+                    raise subprocess.TimeoutExpired(full_cmd, time_limit.elapsed,
+                                                    stderr=stderr_buffer.getvalue())
+                try:
+                    line = await asyncio.wait_for(process.stdout.readline(),
+                                                  max(time_limit.remaining(), 0.01))
+                except asyncio.TimeoutError:
+                    continue
+                if not line:
+                    break
+                snapshot = parser.feed(line.decode('utf-8', errors='replace'))
+                if snapshot is None:
+                    continue
+                time_limit.update(snapshot)
+                if progress_callback and not snapshot.finished:
+                    percent = snapshot.percent
+                    # Without a known duration fall back to an indeterminate midpoint
+                    progress_callback(snapshot.describe(), percent if percent is not None else 50)
+
+            returncode = await process.wait()
+            await stderr_task
+        except BaseException:
+            # Cancellation (or any other error) must not leave ffmpeg running
+            await asyncio.shield(_stop_process(process))
+            stderr_task.cancel()
+            raise
+
+        return subprocess.CompletedProcess(full_cmd, returncode, '', stderr_buffer.getvalue())
+
+    async def convert_file(self, input_file: str, output_format: str = '.mp3',
+                           output_dir: Optional[str] = None, bitrate: str = '192k',
+                           quality: str = 'high', progress_callback=None) -> ConversionResult:
+        """
+        Convert a file to MP3, WAV or M4A format (coroutine version of convert_file).
+
+        Args:
+            input_file: Path to input file
+            output_format: Output format (.mp3, .wav or .m4a)
+            output_dir: Output directory (optional)
+            bitrate: Audio bitrate (default: 192k)
+            quality: Conversion quality (high, medium, low)
+            progress_callback: Optional callback for progress updates
+
+        Returns:
+            ConversionResult: Truthy if the conversion succeeded (see convert_file)
+
+        Raises:
+            asyncio.CancelledError: If the task is cancelled (partial output is removed)
+        """
+        async with self._slots():
+            return await self._convert_file(input_file, output_format, output_dir, bitrate,
+                                            quality, progress_callback)
+
+    def _validate(self, input_file: str, output_format: str) -> Tuple[Path, str, int]:
+        """Validated input path, output format and input size (blocking; run in the executor)."""
+        input_path = self.converter._validate_file_path(input_file)
+        output_format = self.converter._validate_output_format(output_format)
+        return input_path, output_format, input_path.stat().st_size
+
+    async def _convert_file(self, input_file, output_format, output_dir, bitrate, quality,
+                            progress_callback) -> ConversionResult:
+        converter = self.converter
+        loop = asyncio.get_running_loop()
+        result = ConversionResult(input_file, output_format)
+        timings = result.timings
+        output_path = None
+        hash_future = None
+        try:
+            with stage('validation', timings) as record:
+                # Validate inputs (stat() calls and file checks, off the loop)
+                input_path, output_format, input_size = await loop.run_in_executor(
+                    None, self._validate, input_file, output_format)
+                result.input_path, result.output_format = str(input_path), output_format
+                record.bytes = result.input_size = input_size
+
+                # Reject inputs without audio before doing any heavy work
+                media_info = result.media_info = await self.probe(input_path)
+                if media_info is not None and not media_info.has_audio:
+                    raise ValueError(f"Input file has no audio stream: {input_path.name}")
+
+            with stage('output_path', timings):
+                output_path = await _claim_output(loop, converter, input_path, output_dir, output_format)
+            work_path = converter._partial_path(output_path)
+            logger.info(f"Starting conversion: {input_path} -> {output_path}")
+
+            # Hashing is CPU-bound: run it in the executor (alongside ffmpeg when there is no cache)
+            hash_future = loop.run_in_executor(None, converter._get_file_hash, input_path, timings)
+            cache_key = None
+            if converter.cache:
+                input_hash = await hash_future
+                ffmpeg_version = await loop.run_in_executor(None, converter.get_ffmpeg_version)
+                cache_key = ConversionCache.make_key(input_hash, output_format, bitrate, quality, ffmpeg_version,
+                                                converter.allow_stream_copy)
+                if await loop.run_in_executor(None, converter.cache.restore, cache_key, output_format,
+                                              work_path):
+                    os.replace(work_path, output_path)
+                    logger.info(f"Conversion served from cache: {output_path}")
+                    if progress_callback:
+                        progress_callback("Conversion completed (cached result)", 100)
+                    result.input_hash = input_hash
+                    result.add_output(output_format, output_path, output_path.stat().st_size)
+                    result.success = result.cached = True
+                    return result
+
+            duration = media_info.duration if media_info else None
+            stream_copy = converter.allow_stream_copy and converter._can_stream_copy(
+                media_info, output_format, bitrate)
+            if stream_copy:
+                logger.info("Source audio already matches the requested output; copying stream")
+
+            if progress_callback:
+                progress_callback("Starting conversion...", 0)
+
+            with stage('encode', timings) as record:
+                cmd = converter._build_ffmpeg_command(input_path, work_path, output_format,
+                                                      bitrate, quality, stream_copy)
+                completed = await self.run_ffmpeg(cmd, duration, progress_callback)
+                if stream_copy and completed.returncode != 0:
+                    logger.warning(f"Stream copy failed (code {completed.returncode}), falling back to re-encoding")
+                    cmd = converter._build_ffmpeg_command(input_path, work_path, output_format,
+                                                          bitrate, quality, stream_copy=False)
+                    completed = await self.run_ffmpeg(cmd, duration, progress_callback)
+                if work_path.exists():
+                    record.bytes = work_path.stat().st_size
+            result.set_ffmpeg(completed)
+
+            result.input_hash = await hash_future
+            logger.info(f"Input file hash: {result.input_hash}")
+            if converter.probe_cache and media_info is not None:
+                await loop.run_in_executor(None, converter.probe_cache.put, input_path, media_info,
+                                           result.input_hash)
+
+            if completed.returncode != 0:
+                logger.error(f"FFmpeg error (code {completed.returncode}): {completed.stderr}")
+                result.error = f"FFmpeg error: {completed.stderr[:50]}..."
+                if progress_callback:
+                    progress_callback(result.error, 0)
+                return result
+
+            with stage('verification', timings) as record:
+                verified = work_path.exists() and work_path.stat().st_size > 0
+                if verified:
+                    os.replace(work_path, output_path)
+                    record.bytes = output_path.stat().st_size
+            if not verified:
+                logger.error("Conversion failed: Output file not created or empty")
+                result.error = "Conversion failed: Output file not created"
+                if progress_callback:
+                    progress_callback(result.error, 0)
+                return result
+
+            logger.info(f"Conversion successful: {output_path}")
+            if converter.cache and cache_key:
+                await loop.run_in_executor(None, converter.cache.put, cache_key, output_format, output_path)
+            if progress_callback:
+                progress_callback("Conversion completed successfully!", 100)
+            result.add_output(output_format, output_path, record.bytes)
+            result.success = True
+            return result
+
+        except asyncio.CancelledError:
+            logger.info(f"Conversion cancelled: {input_file}")
+            if progress_callback:
+                progress_callback("Conversion cancelled", 0)
+            raise
+        except subprocess.TimeoutExpired:
+            logger.error("Conversion timed out")
+            result.error = "Conversion timed out"
+            if progress_callback:
+                progress_callback(result.error, 0)
+            return result
+        except Exception as e:
+            logger.error(f"Conversion failed: {e}")
+            result.error = f"Error: {str(e)}"
+            if progress_callback:
+                progress_callback(result.error, 0)
+            return result
+        finally:
+            if hash_future is not None and not hash_future.done():
+                hash_future.cancel()
+            if output_path is not None:
+                converter._partial_path(output_path).unlink(missing_ok=True)
+                if not result.success:
+                    output_path.unlink(missing_ok=True)
+                converter._release_output_path(output_path)
+
+    async def convert_batch(self, input_files: List[str], output_format: str = '.mp3',
+                            output_dir: Optional[str] = None, bitrate: str = '192k',
+                            quality: str = 'high', progress_callback=None) -> List[ConversionResult]:
+        """
+        Convert multiple files concurrently (bounded by max_concurrency).
+
+        Args:
+            input_files: List of input file paths
+            output_format: Output format (.mp3, .wav or .m4a)
+            output_dir: Output directory (optional)
+            bitrate: Audio bitrate
+            quality: Conversion quality
+            progress_callback: Optional callback for progress updates
+
+        Returns:
+            List[ConversionResult]: Result for each file, in input order
+
+        Raises:
+            asyncio.CancelledError: If the task is cancelled (every running conversion is stopped)
+        """
+        total_files = len(input_files)
+        if total_files == 0:
+            return []
+        logger.info(f"Starting async batch of {total_files} files (max {self.max_concurrency} concurrent)")
+
+        # Per-file progress, aggregated into a single overall percentage
+        file_progress = [0.0] * total_files
+
+        def report(index: int, message: str, progress: float):
+            if not progress_callback:
+                return
+            file_progress[index] = max(file_progress[index], progress)
+            overall = sum(file_progress) / total_files
+            progress_callback(f"[{index + 1}/{total_files}] {Path(input_files[index]).name}: {message}", overall)
+
+        async def convert_one(index: int) -> ConversionResult:
+            result = await self.convert_file(
+                input_files[index], output_format, output_dir, bitrate, quality,
+                lambda message, progress: report(index, message, progress))
+            report(index, "Done" if result else "Failed", 100)
+            return result
+
+        tasks = [asyncio.ensure_future(convert_one(i)) for i in range(total_files)]
+        try:
+            results = list(await asyncio.gather(*tasks))
+        except BaseException:
+            # gather() returns as soon as one child is cancelled; wait until every
+            # ffmpeg process has been stopped and its partial output removed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        successful = sum(1 for result in results if result)
+        logger.info(f"Batch conversion complete: {successful}/{total_files} files converted successfully")
+        if progress_callback:
+            progress_callback(f"Batch complete: {successful}/{total_files} files converted", 100)
+        return results
+
+    def start_file(self, input_file: str, output_format: str = '.mp3', output_dir: Optional[str] = None,
+                   bitrate: str = '192k', quality: str = 'high') -> AsyncConversion:
+        """Start convert_file as a task; iterate the handle for progress and await it for the result."""
+        return AsyncConversion(lambda callback: self.convert_file(
+            input_file, output_format, output_dir, bitrate, quality, callback))
+
+    def start_batch(self, input_files: List[str], output_format: str = '.mp3',
+                    output_dir: Optional[str] = None, bitrate: str = '192k',
+                    quality: str = 'high') -> AsyncConversion:
+        """Start convert_batch as a task; iterate the handle for progress and await it for the results."""
+        return AsyncConversion(lambda callback: self.convert_batch(
+            input_files, output_format, output_dir, bitrate, quality, callback))
@@ -40,6 +40,50 @@ BITRATE_OPTIONS = ["128k", "192k", "256k", "320k"]
 MAX_FILE_SIZE_MB = 500
 MAX_BATCH_FILES = 50
 
+# Batch concurrency (simultaneous ffmpeg processes, defaults to CPU count)
+DEFAULT_MAX_WORKERS = os.cpu_count() or 1
+
+# Segment-parallel encoding of long inputs (seconds)
+SEGMENT_DURATION_THRESHOLD = 30 * 60
+SEGMENT_MIN_DURATION = 5 * 60
+
+# Conversion cache (outputs keyed by input hash and encode parameters)
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'secure-audio-converter')
+CACHE_MAX_SIZE_MB = 1024
+
+# ffprobe result cache (keyed by path + size + mtime, and by content hash)
+PROBE_CACHE_FILE = os.path.join(CACHE_DIR, 'probe_cache.sqlite3')
+PROBE_CACHE_MAX_ENTRIES = 10000
+
+# Durable batch job queue (resumable batches, shared by converter processes)
+JOB_STORE_FILE = os.path.join(CACHE_DIR, 'jobs.sqlite3')
+JOB_LEASE_TIMEOUT = 120      # Seconds without a heartbeat before a running job is reclaimed
+JOB_MAX_ATTEMPTS = 3         # Failed jobs are retried on resume until this many attempts
+
+# Watch-folder daemon (seconds)
+WATCH_SETTLE_TIME = 5.0      # Size and mtime must stay unchanged this long before converting
+WATCH_POLL_INTERVAL = 2.0    # Rescan interval when inotify is unavailable
+WATCH_HANDLED_MAX = 10000    # Converted files remembered in memory (older ones are checked against the manifest)
+
+# HTTP conversion service
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+SERVER_MAX_PENDING = 8       # Requests allowed to wait for a free worker before answering 503
+SERVER_QUEUE_TIMEOUT = 30    # Seconds a request may wait for a worker
+SERVER_RESULT_TTL = 3600     # Seconds finished jobs (and their output) are kept
+SERVER_SOCKET_TIMEOUT = 60   # Seconds of client inactivity before a connection is dropped
+
+# Metrics export
+METRICS_EXPORT_INTERVAL = 15.0   # Seconds between --metrics-file rewrites in daemon modes
+
+# Streamlit app
+SCHEDULER_MAX_QUEUED = 200              # Files allowed to wait for a worker across all sessions
+SCHEDULER_MAX_QUEUED_PER_SESSION = 50   # Files one session may have waiting (the batch limit)
+SESSION_WORKSPACE_TTL = 6 * 3600   # Seconds before an abandoned session's converted files are removed
+RESULT_CACHE_DIR = os.path.join(CACHE_DIR, 'streamlit-results')  # Outputs shared by all sessions
+RESULT_CACHE_MAX_SIZE_MB = 2048
+RESULT_CACHE_TTL = 24 * 3600       # Seconds an unused cached output is kept
+
 # UI settings
 WINDOW_SIZE = "800x600"
 THEME_COLOR = "#2C3E50"
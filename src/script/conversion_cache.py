@@ -0,0 +1,226 @@
+"""
+Content-addressed on-disk cache of converted audio files.
+
+Entries are keyed by the SHA-256 of the input plus every parameter that
+affects the encoded output (format, bitrate, quality, ffmpeg version), so a
+repeat conversion of the same upload can be served with a file copy instead
+of a full encode. The cache is bounded in size; least recently used entries
+(by file modification time, refreshed on every hit) are evicted first. An
+optional TTL also expires entries that have not been used for that long.
+
+Storing an entry does not walk the cache directory: a running total of the
+entry sizes is kept, and the directory is only scanned (expiring and
+evicting entries, and recounting the total) when that total goes over the
+limit, or every RESCAN_INTERVAL seconds to account for entries that other
+processes sharing the directory added or removed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _hard_link(source: Path, destination: Path) -> bool:
+    """Hard-link destination to source. Returns False if that fails (e.g. across filesystems)."""
+    try:
+        os.link(source, destination)
+    except OSError:
+        return False
+    return True
+
+
+class ConversionCache:
+    """Size-bounded LRU cache of conversion outputs stored on disk."""
+
+    TEMP_PREFIX = '.tmp-'
+
+    # Longest time between two scans of the cache directory while entries are stored
+    RESCAN_INTERVAL = 600
+
+    def __init__(self, cache_dir: str, max_size_bytes: int, ttl: Optional[float] = None):
+        """
+        Args:
+            cache_dir: Directory holding the cache entries
+            max_size_bytes: Total size the entries may use
+            ttl: Seconds since its last use after which an entry expires (None: never)
+        """
+        self.cache_dir = Path(cache_dir).expanduser().resolve()
+        self.max_size_bytes = max_size_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Total size of the entries as of the last scan plus later puts (None: not scanned yet)
+        self._total_size: Optional[int] = None
+        self._scanned_at = 0.0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(input_hash: str, output_format: str, bitrate: str,
+                 quality: str, ffmpeg_version: str, stream_copy: bool) -> str:
+        """Build the cache key for one conversion.
+
+        ``stream_copy`` is the converter's stream-copy policy, so outputs of a
+        re-encode-only converter are never served from stream-copied entries.
+        """
+        params = {
+            'input': input_hash,
+            'format': output_format,
+            'bitrate': bitrate,
+            'quality': quality,
+            'ffmpeg': ffmpeg_version,
+            'codec': 'copy' if stream_copy else 'encode',
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str, output_format: str) -> Path:
+        """Location of a cache entry (sharded by key prefix)."""
+        return self.cache_dir / key[:2] / f"{key}{output_format}"
+
+    def get(self, key: str, output_format: str) -> Optional[Path]:
+        """Return the cached file for a key, marking it as recently used."""
+        entry = self._entry_path(key, output_format)
+        try:
+            stat = entry.stat()
+            if self._expired(stat.st_mtime):
+                entry.unlink()
+                logger.info(f"Expired cache entry: {entry.name}")
+                self._account(-stat.st_size)
+                return None
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        return entry
+
+    def restore(self, key: str, output_format: str, destination: Path, link: bool = False) -> bool:
+        """
+        Copy a cached output to the destination. Returns False on a miss.
+
+        With link=True the destination is hard-linked to the entry when both are
+        on the same filesystem (no data is copied). Only use it for destinations
+        nobody modifies in place, since they share their contents with the cache.
+        """
+        entry = self.get(key, output_format)
+        if entry is None:
+            return False
+        try:
+            if not (link and _hard_link(entry, destination)):
+                shutil.copyfile(entry, destination)
+        except FileNotFoundError:
+            # Evicted by another process between lookup and copy
+            return False
+        logger.info(f"Cache hit: {key[:12]} -> {destination}")
+        return True
+
+    def put(self, key: str, output_format: str, source: Path) -> Optional[Path]:
+        """Store a converted file in the cache and evict old entries if needed."""
+        size = source.stat().st_size
+        if size > self.max_size_bytes:
+            logger.info(f"Not caching {source.name}: larger than the cache limit")
+            return None
+
+        entry = self._entry_path(key, output_format)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            replaced = entry.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+
+        # Write to a temporary name first so readers never see partial files
+        temp_path = entry.parent / f"{self.TEMP_PREFIX}{uuid.uuid4().hex}{output_format}"
+        try:
+            shutil.copyfile(source, temp_path)
+            os.replace(temp_path, entry)
+        except OSError as e:
+            logger.warning(f"Could not store cache entry for {source.name}: {e}")
+            temp_path.unlink(missing_ok=True)
+            return None
+
+        logger.info(f"Cached conversion output: {key[:12]} ({size / (1024*1024):.2f}MB)")
+        self._account(size - replaced)
+        with self._lock:
+            scan = (self._total_size is None or self._total_size > self.max_size_bytes
+                    or time.monotonic() - self._scanned_at > self.RESCAN_INTERVAL)
+        if scan:
+            self._evict()
+        return entry
+
+    def _account(self, delta: int):
+        """Adjust the running total after an entry was added, replaced or removed."""
+        with self._lock:
+            if self._total_size is not None:
+                self._total_size += delta
+
+    def _entries(self):
+        """Yield (path, size, mtime) for every cache entry."""
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith(self.TEMP_PREFIX) or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield Path(entry.path), stat.st_size, stat.st_mtime
+
+    def _expired(self, mtime: float) -> bool:
+        return self.ttl is not None and mtime < time.time() - self.ttl
+
+    def _evict(self):
+        """Remove expired entries, then least recently used ones until the cache fits its limit."""
+        with self._lock:
+            entries = []
+            for path, size, mtime in self._entries():
+                if self._expired(mtime):
+                    path.unlink(missing_ok=True)
+                    logger.info(f"Expired cache entry: {path.name}")
+                else:
+                    entries.append((path, size, mtime))
+            total_size = sum(size for _, size, _ in entries)
+            if total_size > self.max_size_bytes:
+                entries.sort(key=lambda item: item[2])
+                for path, size, _ in entries:
+                    if total_size <= self.max_size_bytes:
+                        break
+                    try:
+                        path.unlink()
+                        total_size -= size
+                        logger.info(f"Evicted cache entry: {path.name}")
+                    except FileNotFoundError:
+                        total_size -= size
+            self._total_size = total_size
+            self._scanned_at = time.monotonic()
+
+    def stats(self) -> dict:
+        """Summary of the cache contents."""
+        entries = list(self._entries())
+        return {
+            'path': str(self.cache_dir),
+            'entries': len(entries),
+            'size_bytes': sum(size for _, size, _ in entries),
+            'max_size_bytes': self.max_size_bytes,
+            'ttl': self.ttl,
+        }
+
+    def purge(self) -> int:
+        """Delete every cache entry. Returns the number of entries removed."""
+        removed = 0
+        with self._lock:
+            for path, _, _ in list(self._entries()):
+                try:
+                    path.unlink()
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+            self._total_size = None
+        logger.info(f"Purged {removed} cache entries from {self.cache_dir}")
+        return removed
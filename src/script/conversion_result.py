@@ -0,0 +1,119 @@
+"""
+Result of a conversion call.
+
+ConversionResult is truthy when the conversion succeeded, so callers that
+only need a yes/no (`if converter.convert_file(...)`, `all(results)`) keep
+working. It also carries what callers otherwise had to rediscover: the
+output path actually used (which may carry a _1 suffix), the input and
+output sizes, the input hash, the probe metadata, per-stage timings, and
+ffmpeg's exit code and the tail of its stderr. Results of stream conversions
+(convert_stream) carry the encoded audio as output_stream instead of a path.
+"""
+
+import os
+from typing import BinaryIO, Dict, Optional
+
+from media_probe import MediaInfo
+
+
+class ConversionResult:
+    """Outcome of converting one input file."""
+
+    __slots__ = ('input_path', 'output_format', 'success', 'output_path', 'outputs', 'input_size',
+                 'output_size', 'input_hash', 'media_info', 'timings', 'returncode', 'stderr',
+                 'error', 'cached', 'skipped', 'output_stream')
+
+    # Characters of ffmpeg's stderr kept (the end, where the error is)
+    STDERR_LIMIT = 2000
+
+    def __init__(self, input_path: Optional[str] = None, output_format: Optional[str] = None):
+        self.input_path = input_path
+        self.output_format = output_format
+        self.success = False
+        self.output_path: Optional[str] = None          # Primary output
+        self.outputs: Dict[str, str] = {}               # Output format -> path, for every output created
+        self.input_size: Optional[int] = None
+        self.output_size: Optional[int] = None          # Total bytes written
+        self.input_hash: Optional[str] = None
+        self.media_info: Optional[MediaInfo] = None
+        self.timings: Dict[str, float] = {}             # Stage name -> seconds
+        self.returncode: Optional[int] = None           # Exit code of the last ffmpeg run
+        self.stderr = ''
+        self.error: Optional[str] = None
+        self.cached = False                             # Output restored from the conversion cache
+        self.skipped = False                            # Output already up to date (incremental batch)
+        self.output_stream: Optional[BinaryIO] = None   # Encoded audio of a stream conversion
+
+    def __bool__(self) -> bool:
+        return self.success
+
+    def __repr__(self) -> str:
+        status = 'ok' if self.success else f'failed: {self.error}'
+        return f"ConversionResult({self.input_path!r} -> {self.output_path!r}, {status})"
+
+    def add_output(self, output_format: str, path, size: int):
+        """Record a verified output file."""
+        self.outputs[output_format] = str(path)
+        if self.output_path is None:
+            self.output_path = str(path)
+        self.output_size = (self.output_size or 0) + size
+
+    def set_ffmpeg(self, completed):
+        """Record the exit code and (truncated) stderr of an ffmpeg run."""
+        self.returncode = completed.returncode
+        stderr = completed.stderr or ''
+        self.stderr = stderr[-self.STDERR_LIMIT:]
+
+    @classmethod
+    def combine(cls, input_path: str, results: Dict[str, 'ConversionResult']) -> 'ConversionResult':
+        """Merge the per-format results of a multi-output conversion (succeeds if all did)."""
+        combined = cls(input_path)
+        combined.success = bool(results) and all(results.values())
+        for result in results.values():
+            for output_format, path in result.outputs.items():
+                combined.outputs[output_format] = path
+                if combined.output_path is None:
+                    combined.output_path = path
+            if result.output_size is not None:
+                combined.output_size = (combined.output_size or 0) + result.output_size
+            for name in ('input_size', 'input_hash', 'media_info', 'returncode'):
+                if getattr(result, name) is not None:
+                    setattr(combined, name, getattr(result, name))
+            combined.timings.update(result.timings)
+            combined.stderr = combined.stderr or result.stderr
+            combined.error = combined.error or result.error
+        combined.cached = bool(results) and all(result.cached for result in results.values())
+        return combined
+
+    @classmethod
+    def from_job_record(cls, record: dict) -> 'ConversionResult':
+        """Rebuild a (timing-less) result from a JobStore record, e.g. a job finished by an earlier run."""
+        formats = record['params'].get('formats') or []
+        result = cls(record['input_path'], formats[0] if len(formats) == 1 else None)
+        result.success = record['success']
+        result.input_hash = record['input_hash']
+        result.error = record['error']
+        for path in record['output_paths'] or []:
+            result.outputs[os.path.splitext(path)[1]] = path
+            if result.output_path is None:
+                result.output_path = path
+        return result
+
+    @classmethod
+    def from_manifest_entry(cls, input_path: str, entry) -> 'ConversionResult':
+        """Result for an input skipped because its OutputManifest entry is up to date."""
+        formats = list(entry.outputs)
+        result = cls(input_path, formats[0] if len(formats) == 1 else None)
+        result.success = result.skipped = True
+        result.input_size = entry.input_size
+        result.input_hash = entry.input_hash
+        for output_format, path in entry.outputs.items():
+            result.add_output(output_format, path, entry.output_sizes[path])
+        return result
+
+    def to_dict(self) -> dict:
+        """Plain-data view (media_info included as a dict, output_stream left out)."""
+        data = {name: getattr(self, name) for name in self.__slots__ if name != 'output_stream'}
+        if self.media_info is not None:
+            data['media_info'] = self.media_info._asdict()
+        return data
@@ -0,0 +1,327 @@
+"""
+Process-wide conversion scheduler shared by interactive sessions.
+
+A fixed number of worker threads, each owning its own converter (so
+cancelling a task stops exactly that task's ffmpeg), run tasks submitted by
+any number of sessions. The queue is fair between sessions: each session
+has its own FIFO, and workers take the next task from the sessions in
+round-robin order, so a session that queued fifty files delays a session
+that queued one by at most one task per worker.
+
+Admission is bounded. A submission that would exceed the global or
+per-session queue limit is rejected with SchedulerFull (all of a batch or
+none of it), instead of queueing work that would only wait. Because the
+worker count is fixed, throughput stays flat as more users arrive; extra
+load shows up as queue positions, not as more ffmpeg processes competing
+for the same cores.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from config import DEFAULT_MAX_WORKERS, SCHEDULER_MAX_QUEUED, SCHEDULER_MAX_QUEUED_PER_SESSION
+from converter_core import SecureAudioConverter
+from ffmpeg_runner import ConversionCancelled
+
+logger = logging.getLogger(__name__)
+
+# Task states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# Function run by a worker: (worker's converter, task) -> task result
+TaskFunction = Callable[[SecureAudioConverter, 'ScheduledTask'], Any]
+
+
+class SchedulerFull(Exception):
+    """The queue cannot take the submission (it should be retried later)."""
+
+
+class ScheduledTask:
+    """One unit of work and its live status."""
+
+    def __init__(self, session_id: str, function: TaskFunction, label: str = ''):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.label = label
+        self.function = function
+        self.state = QUEUED
+        self.message = 'Queued'
+        self.percent = 0.0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.converter: Optional[SecureAudioConverter] = None
+        self.cancel_requested = False
+        self._done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    def progress(self, message: str, percent: float):
+        """Progress callback for the converter."""
+        self.message = message
+        self.percent = percent
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the task finished. Returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def _finish(self, state: str, result: Any = None, error: Optional[str] = None):
+        self.state = state
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        self.function = None  # Drop references held by the closure (e.g. upload buffers)
+        self._done.set()
+
+
+class TaskGroup:
+    """The tasks of one submission (e.g. a session's batch), tracked together."""
+
+    def __init__(self, tasks: List[ScheduledTask]):
+        self.tasks = tasks
+        self.created_at = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return all(task.finished for task in self.tasks)
+
+    @property
+    def finished_count(self) -> int:
+        return sum(1 for task in self.tasks if task.finished)
+
+    @property
+    def finished_at(self) -> Optional[float]:
+        """When the last task finished (None while any is pending)."""
+        if not self.finished:
+            return None
+        return max((task.finished_at for task in self.tasks), default=self.created_at)
+
+    def current(self) -> Optional[ScheduledTask]:
+        """First unfinished task (running ones first), or None when all finished."""
+        pending = [task for task in self.tasks if not task.finished]
+        running = [task for task in pending if task.state == RUNNING]
+        return (running or pending or [None])[0]
+
+    def fraction(self) -> float:
+        """Overall progress in [0, 1], counting the progress of running tasks."""
+        if not self.tasks:
+            return 1.0
+        done = sum(1.0 if task.finished else task.percent / 100 for task in self.tasks)
+        return min(1.0, done / len(self.tasks))
+
+
+class ConversionScheduler:
+    """Fixed worker pool with a fair per-session queue."""
+
+    def __init__(self, converter_factory: Callable[[], SecureAudioConverter] = SecureAudioConverter,
+                 max_workers: Optional[int] = None, max_queued: int = SCHEDULER_MAX_QUEUED,
+                 max_queued_per_session: int = SCHEDULER_MAX_QUEUED_PER_SESSION):
+        """
+        Args:
+            converter_factory: Creates one converter per worker
+            max_workers: Tasks running at once (default: CPU count)
+            max_queued: Tasks allowed to wait across all sessions
+            max_queued_per_session: Tasks one session may have waiting
+        """
+        self.max_workers = max_workers or DEFAULT_MAX_WORKERS
+        if self.max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_queued = max_queued
+        self.max_queued_per_session = max_queued_per_session
+
+        self._condition = threading.Condition()
+        # Session id -> its waiting tasks; the first session is served next
+        self._queues: 'OrderedDict[str, Deque[ScheduledTask]]' = OrderedDict()
+        self._queued = 0
+        self._running: Dict[str, ScheduledTask] = {}
+        self._closed = False
+        self._workers = []
+        for index in range(self.max_workers):
+            worker = threading.Thread(target=self._work, args=(converter_factory(),),
+                                      name=f"scheduler-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, session_id: str, function: TaskFunction, label: str = '') -> ScheduledTask:
+        """Queue one task (raises SchedulerFull when the queue is full)."""
+        return self.submit_batch(session_id, [(function, label)])[0]
+
+    def submit_batch(self, session_id: str, functions: List[Tuple[TaskFunction, str]]) -> List[ScheduledTask]:
+        """
+        Queue several tasks for a session, all or none.
+
+        Args:
+            session_id: Session the tasks belong to (the unit of fairness)
+            functions: (function, label) pairs, run in this order for the session
+
+        Returns:
+            List[ScheduledTask]: The queued tasks
+
+        Raises:
+            SchedulerFull: If the tasks do not fit in the global or session queue
+        """
+        tasks = [ScheduledTask(session_id, function, label) for function, label in functions]
+        with self._condition:
+            if self._closed:
+                raise SchedulerFull("Scheduler is shut down")
+            session_queue = self._queues.get(session_id)
+            session_queued = len(session_queue) if session_queue else 0
+            if session_queued + len(tasks) > self.max_queued_per_session:
+                raise SchedulerFull(f"At most {self.max_queued_per_session} files can wait per session")
+            if self._queued + len(tasks) > self.max_queued:
+                raise SchedulerFull("Too many conversions are waiting")
+            if session_queue is None:
+                session_queue = self._queues[session_id] = deque()
+            session_queue.extend(tasks)
+            self._queued += len(tasks)
+            self._condition.notify(len(tasks))
+        logger.info(f"Session {session_id[:8]} queued {len(tasks)} task(s) ({self._queued} waiting)")
+        return tasks
+
+    def position(self, task: ScheduledTask) -> int:
+        """
+        Place of a queued task in the service order (1 = next to start).
+
+        Returns:
+            int: The position, or 0 if the task is not waiting
+        """
+        with self._condition:
+            if task.state != QUEUED:
+                return 0
+            session_ids = list(self._queues)
+            if task.session_id not in session_ids:
+                return 0
+            rank = session_ids.index(task.session_id)
+            try:
+                depth = self._queues[task.session_id].index(task)
+            except ValueError:
+                return 0
+            sessions = list(self._queues.values())
+            # Round-robin: every session contributes up to `depth` tasks before this one,
+            # and sessions ahead in the rotation one more
+            ahead = sum(min(len(other), depth + (1 if index < rank else 0))
+                        for index, other in enumerate(sessions) if index != rank)
+            return ahead + depth + 1
+
+    def cancel(self, task: ScheduledTask):
+        """Cancel a waiting task, or stop a running one."""
+        with self._condition:
+            task.cancel_requested = True
+            if task.state == QUEUED and self._remove_queued(task):
+                task._finish(CANCELLED, error="Conversion cancelled")
+                return
+            # Under the lock, so the converter cannot have moved on to another task
+            # (cancel() only signals the running ffmpeg processes and returns)
+            if task.state == RUNNING and task.converter is not None:
+                task.converter.cancel()
+
+    def cancel_session(self, session_id: str):
+        """Cancel every waiting and running task of a session."""
+        with self._condition:
+            waiting = list(self._queues.pop(session_id, ()))
+            self._queued -= len(waiting)
+            running = [task for task in self._running.values() if task.session_id == session_id]
+        for task in waiting:
+            task.cancel_requested = True
+            task._finish(CANCELLED, error="Conversion cancelled")
+        for task in running:
+            self.cancel(task)
+        if waiting or running:
+            logger.info(f"Session {session_id[:8]}: cancelled {len(waiting)} waiting and "
+                        f"{len(running)} running task(s)")
+
+    def stats(self) -> dict:
+        """Worker and queue usage."""
+        with self._condition:
+            return {
+                'workers': self.max_workers,
+                'running': len(self._running),
+                'queued': self._queued,
+                'max_queued': self.max_queued,
+                'sessions': len(self._queues),
+            }
+
+    def close(self):
+        """Cancel all waiting tasks and stop the workers once their current task ends."""
+        with self._condition:
+            self._closed = True
+            sessions = list(self._queues)
+            self._condition.notify_all()
+        for session_id in sessions:
+            self.cancel_session(session_id)
+
+    def _remove_queued(self, task: ScheduledTask) -> bool:
+        session_queue = self._queues.get(task.session_id)
+        if not session_queue:
+            return False
+        try:
+            session_queue.remove(task)
+        except ValueError:
+            return False
+        self._queued -= 1
+        if not session_queue:
+            del self._queues[task.session_id]
+        return True
+
+    def _next_task(self, converter: SecureAudioConverter) -> Optional[ScheduledTask]:
+        """Wait for the next task in round-robin order and assign it a converter (None once closed)."""
+        with self._condition:
+            while not self._queues:
+                if self._closed:
+                    return None
+                self._condition.wait()
+            session_id, session_queue = next(iter(self._queues.items()))
+            task = session_queue.popleft()
+            self._queued -= 1
+            # The session goes to the back of the rotation (or leaves it when drained)
+            if session_queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            task.state = RUNNING
+            task.message = 'Starting...'
+            task.started_at = time.time()
+            # A cancel() aimed at the converter's previous task must not stop this one
+            converter.reset_cancel()
+            task.converter = converter
+            self._running[task.id] = task
+            return task
+
+    def _work(self, converter: SecureAudioConverter):
+        while True:
+            task = self._next_task(converter)
+            if task is None:
+                return
+            try:
+                if task.cancel_requested:
+                    raise ConversionCancelled()
+                result = task.function(converter, task)
+            except ConversionCancelled:
+                state, result, error = CANCELLED, None, "Conversion cancelled"
+            except Exception as e:
+                logger.error(f"Task {task.label or task.id} failed: {e}")
+                state, result, error = FAILED, None, str(e)
+            else:
+                if task.cancel_requested:
+                    state, error = CANCELLED, "Conversion cancelled"
+                elif result is None:
+                    state, error = FAILED, "Conversion failed"
+                else:
+                    state, error = DONE, None
+            finally:
+                with self._condition:
+                    task.converter = None
+                    self._running.pop(task.id, None)
+            task._finish(state, result, error)
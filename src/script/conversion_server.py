@@ -0,0 +1,673 @@
+"""
+HTTP conversion service for machine clients.
+
+A small stdlib HTTP/1.1 server around SecureAudioConverter.convert_stream:
+
+    POST   /jobs?filename=talk.mp4&format=mp3[&bitrate=192k&quality=high]
+           Without a request body: creates a job awaiting its input and answers
+           201 with its status (id and upload_url) straight away.
+           With a request body (the input file, Content-Length or chunked):
+           creates the job and converts the body like PUT .../input below. A
+           client sending "Expect: 100-continue" gets the job id in the
+           X-Job-Id and Location headers of the 100 Continue response.
+    PUT    /jobs/<id>/input      Request body is the input file of a job created
+           without one. It is piped into ffmpeg as it arrives; the response (201,
+           or 422 if the conversion failed) is the job status once the
+           conversion finished, so progress and DELETE use the id from the POST.
+    GET    /jobs                 Status of every job
+    GET    /jobs/<id>            Status of one job (state, progress, size, error)
+    GET    /jobs/<id>/output     Converted audio, with single-range Range support
+    DELETE /jobs/<id>            Cancel a running job, or discard a finished one
+    GET    /health               Worker pool usage
+    GET    /metrics              Conversion stage metrics (Prometheus text format)
+
+Each worker slot owns its own converter, so a DELETE cancels exactly one
+job. Conversions are bounded by the worker pool; a limited number of
+requests may wait for a free worker, anything beyond that (or a request
+that waited too long) is answered with 503 and Retry-After before its body
+is read. Because the body is only read as fast as ffmpeg consumes it, slow
+encodes push back on uploaders through TCP flow control. In the other
+direction, a slow upload does not count as a stalled conversion; a client
+that stops sending altogether is dropped after SERVER_SOCKET_TIMEOUT.
+
+Finished jobs keep their output in an anonymous temporary file until they
+are deleted or their result TTL expires.
+"""
+
+import json
+import logging
+import queue
+import re
+import threading
+import time
+import uuid
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from config import (DEFAULT_BITRATE, DEFAULT_QUALITY, DEFAULT_MAX_WORKERS, SERVER_MAX_PENDING,
+                    SERVER_QUEUE_TIMEOUT, SERVER_RESULT_TTL, SERVER_SOCKET_TIMEOUT)
+from converter_core import SecureAudioConverter
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Job states
+AWAITING_INPUT = 'awaiting_input'
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+CONTENT_TYPES = {'.mp3': 'audio/mpeg', '.wav': 'audio/wav', '.m4a': 'audio/mp4'}
+
+# Size of the reads used to stream converted output to clients
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+_JOB_PATH = re.compile(r'^/jobs/([0-9a-f]{32})(/output|/input)?$')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RequestBodyError(Exception):
+    """The client sent a malformed or truncated request body."""
+
+
+class _LengthReader:
+    """Readable view of a request body with a Content-Length."""
+
+    def __init__(self, rfile, length: int):
+        self._rfile = rfile
+        self._remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining == 0:
+            return b''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        chunk = self._rfile.read(size)
+        if not chunk:
+            raise RequestBodyError("Request body ended before Content-Length bytes were received")
+        self._remaining -= len(chunk)
+        return chunk
+
+
+class _ChunkedReader:
+    """Readable view of a request body sent with Transfer-Encoding: chunked."""
+
+    # Bound on a chunk-size or trailer line
+    MAX_LINE = 4096
+
+    def __init__(self, rfile):
+        self._rfile = rfile
+        self._chunk_left = 0
+        self._finished = False
+
+    def _readline(self) -> bytes:
+        line = self._rfile.readline(self.MAX_LINE + 1)
+        if not line.endswith(b'\n'):
+            raise RequestBodyError("Malformed or truncated chunked request body")
+        return line
+
+    def read(self, size: int = -1) -> bytes:
+        if self._finished:
+            return b''
+        if self._chunk_left == 0:
+            try:
+                self._chunk_left = int(self._readline().split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise RequestBodyError("Invalid chunk size in request body")
+            if self._chunk_left == 0:
+                # Last chunk: skip the optional trailer section
+                while self._readline().strip():
+                    pass
+                self._finished = True
+                return b''
+        if size < 0 or size > self._chunk_left:
+            size = self._chunk_left
+        chunk = self._rfile.read(size)
+        if not chunk:
+            raise RequestBodyError("Request body ended in the middle of a chunk")
+        self._chunk_left -= len(chunk)
+        if self._chunk_left == 0 and self._rfile.read(2) != b'\r\n':
+            raise RequestBodyError("Missing CRLF after chunk data")
+        return chunk
+
+
+class ServerJob:
+    """State of one conversion submitted over HTTP."""
+
+    def __init__(self, filename: str, output_format: str, bitrate: str, quality: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.output_format = output_format
+        self.bitrate = bitrate
+        self.quality = quality
+        self.state = QUEUED
+        self.message = "Waiting for a worker"
+        self.percent = 0.0
+        self.error: Optional[str] = None
+        self.size: Optional[int] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+        self.converter: Optional[SecureAudioConverter] = None
+        self.output: Optional[BinaryIO] = None
+        # Serialises seek+read on the output shared by concurrent downloads
+        self.output_lock = threading.Lock()
+
+    def progress(self, message: str, percent: float):
+        """progress_callback for convert_stream."""
+        self.message = message
+        self.percent = percent
+
+    def read_output(self, offset: int, size: int) -> bytes:
+        """Read part of the converted output (safe across threads)."""
+        with self.output_lock:
+            self.output.seek(offset)
+            return self.output.read(size)
+
+    def close(self):
+        with self.output_lock:
+            if self.output is not None:
+                self.output.close()
+                self.output = None
+
+    @property
+    def output_name(self) -> str:
+        stem = self.filename.rsplit('.', 1)[0] or 'output'
+        return stem + self.output_format
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'format': self.output_format,
+            'bitrate': self.bitrate,
+            'quality': self.quality,
+            'state': self.state,
+            'message': self.message,
+            'percent': round(self.percent, 1),
+            'error': self.error,
+            'size': self.size,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'output_url': f'/jobs/{self.id}/output' if self.state == DONE else None,
+            'upload_url': f'/jobs/{self.id}/input' if self.state == AWAITING_INPUT else None,
+        }
+
+
+class ServiceBusy(Exception):
+    """No worker is available (the request should be retried later)."""
+
+
+class ConversionService:
+    """Worker pool and job registry behind the HTTP handlers."""
+
+    def __init__(self, converter_factory: Callable[[], SecureAudioConverter] = SecureAudioConverter,
+                 max_workers: Optional[int] = None, max_pending: int = SERVER_MAX_PENDING,
+                 queue_timeout: float = SERVER_QUEUE_TIMEOUT, result_ttl: float = SERVER_RESULT_TTL):
+        """
+        Args:
+            converter_factory: Creates one converter per worker slot
+            max_workers: Conversions running at once (default: CPU count)
+            max_pending: Requests allowed to wait for a worker before 503 is returned
+            queue_timeout: Seconds a request may wait for a worker before 503 is returned
+            result_ttl: Seconds finished jobs and their output are kept
+        """
+        self.max_workers = max_workers or DEFAULT_MAX_WORKERS
+        if self.max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_pending = max(0, max_pending)
+        self.queue_timeout = queue_timeout
+        self.result_ttl = result_ttl
+
+        self._idle: queue.Queue = queue.Queue()
+        for _ in range(self.max_workers):
+            self._idle.put(converter_factory())
+        self._admission = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+        self._jobs: Dict[str, ServerJob] = {}
+        self._lock = threading.Lock()
+
+    def _acquire_converter(self, job: ServerJob) -> SecureAudioConverter:
+        """Wait for a free worker slot, or raise ServiceBusy."""
+        if not self._admission.acquire(blocking=False):
+            raise ServiceBusy("Too many conversions in progress")
+        try:
+            converter = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            self._admission.release()
+            raise ServiceBusy("Timed out waiting for a free worker")
+        # A cancel() aimed at the worker's previous job must not stop this one
+        converter.reset_cancel()
+        with self._lock:
+            job.converter = converter
+        return converter
+
+    def _release_converter(self, job: ServerJob):
+        with self._lock:
+            converter, job.converter = job.converter, None
+        self._idle.put(converter)
+        self._admission.release()
+
+    def create_job(self, filename: str, output_format: str, bitrate: str, quality: str,
+                   reserve: bool = True) -> ServerJob:
+        """
+        Register a job.
+
+        Args:
+            reserve: Reserve a worker for it now (raises ServiceBusy when saturated);
+                otherwise the job awaits its input, see reserve()
+        """
+        self.expire()
+        job = ServerJob(filename, output_format, bitrate, quality)
+        if not reserve:
+            job.state, job.message = AWAITING_INPUT, "Waiting for the input upload"
+        with self._lock:
+            self._jobs[job.id] = job
+        if reserve:
+            try:
+                self._acquire_converter(job)
+            except ServiceBusy:
+                with self._lock:
+                    self._jobs.pop(job.id, None)
+                raise
+        return job
+
+    def reserve(self, job: ServerJob):
+        """
+        Reserve a worker for a job awaiting its input.
+
+        Raises:
+            ServiceBusy: If no worker is available (the job keeps awaiting its input)
+            ValueError: If the job is gone or its input was already sent
+        """
+        with self._lock:
+            if self._jobs.get(job.id) is not job or job.state != AWAITING_INPUT:
+                raise ValueError(f"Job is {job.state}, it does not accept input")
+            job.state, job.message = QUEUED, "Waiting for a worker"
+        try:
+            self._acquire_converter(job)
+        except ServiceBusy:
+            with self._lock:
+                job.state, job.message = AWAITING_INPUT, "Waiting for the input upload"
+            raise
+
+    def run_job(self, job: ServerJob, body) -> bool:
+        """
+        Convert the request body of a job created by create_job (releases its worker).
+
+        Args:
+            job: Job holding a reserved worker
+            body: Readable stream with the input file
+
+        Returns:
+            bool: True if the output is ready for download
+        """
+        result = None
+        try:
+            job.state = RUNNING
+            job.started_at = time.time()
+            if not job.cancel_requested:
+                result = job.converter.convert_stream(body, job.filename, job.output_format,
+                                                      job.bitrate, job.quality, progress_callback=job.progress)
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            job.error = f"Error: {e}"
+        finally:
+            self._release_converter(job)
+            job.finished_at = time.time()
+
+        if not result:
+            if job.cancel_requested:
+                job.state, job.error = CANCELLED, "Conversion cancelled"
+            else:
+                job.state = FAILED
+                job.error = job.error or (result.error if result is not None else None) or "Conversion failed"
+            return False
+
+        job.size = result.output_size
+        job.output = result.output_stream
+        job.state = DONE
+        return True
+
+    def get(self, job_id: str) -> Optional[ServerJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[ServerJob]:
+        self.expire()
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created_at)
+
+    def cancel(self, job_id: str) -> Optional[ServerJob]:
+        """
+        Cancel a queued or running job, or discard a finished job and its output.
+
+        Returns:
+            ServerJob: The job, or None if it does not exist
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.state in (QUEUED, RUNNING):
+                job.cancel_requested = True
+                # Under the lock, so the worker cannot have moved on to another job
+                if job.converter is not None:
+                    job.converter.cancel()
+            else:
+                del self._jobs[job_id]
+        if job.state not in (QUEUED, RUNNING):
+            job.close()
+        return job
+
+    def expire(self):
+        """Drop finished jobs, and jobs never sent their input, older than the result TTL."""
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if (job.finished_at is not None and job.finished_at < cutoff)
+                       or (job.state == AWAITING_INPUT and job.created_at < cutoff)]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            job.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            states: Dict[str, int] = {}
+            for job in self._jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+        return {
+            'workers': self.max_workers,
+            'idle_workers': self._idle.qsize(),
+            'max_pending': self.max_pending,
+            'jobs': states,
+        }
+
+    def close(self):
+        """Cancel running conversions and release all outputs."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+        for job in jobs:
+            if job.converter is not None:
+                job.cancel_requested = True
+                job.converter.cancel()
+            job.close()
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range Range header.
+
+    Returns:
+        Tuple[int, int]: Inclusive (start, end) byte positions, or None when the
+        header is not a single byte range (the whole body is then sent)
+
+    Raises:
+        ValueError: If the range cannot be satisfied
+    """
+    match = _RANGE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """Routes HTTP requests to the ConversionService of the server."""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'SecureAudioConverter'
+    timeout = SERVER_SOCKET_TIMEOUT
+
+    @property
+    def service(self) -> ConversionService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} - {format % args}")
+
+    def handle_expect_100(self):
+        # Answer "100 Continue" only once a worker is reserved (see do_POST),
+        # so a saturated server can refuse the upload before it is sent
+        return True
+
+    def _send_json(self, status: int, payload, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        self._send_json(status, {'error': message}, headers)
+
+    def _has_body(self) -> bool:
+        return 'chunked' in self.headers.get('Transfer-Encoding', '').lower() or \
+            int(self.headers.get('Content-Length') or 0) > 0
+
+    def _reject(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        """Answer without reading the request body (the connection cannot be reused)."""
+        if self._has_body():
+            self.close_connection = True
+        self._send_error(status, message, headers)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/health':
+            self._send_json(HTTPStatus.OK, self.service.stats())
+            return
+        if path == '/metrics':
+            body = REGISTRY.render_prometheus().encode('utf-8')
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+            return
+        if path == '/jobs':
+            self._send_json(HTTPStatus.OK, [job.to_dict() for job in self.service.list()])
+            return
+
+        match = _JOB_PATH.match(path)
+        job = self.service.get(match.group(1)) if match else None
+        if job is None:
+            self._send_error(HTTPStatus.NOT_FOUND, "No such job")
+        elif match.group(2) == '/input':
+            self._send_error(HTTPStatus.METHOD_NOT_ALLOWED, "Upload the input with PUT", {'Allow': 'PUT'})
+        elif match.group(2):
+            self._send_output(job)
+        else:
+            self._send_json(HTTPStatus.OK, job.to_dict())
+
+    do_HEAD = do_GET
+
+    def _send_output(self, job: ServerJob):
+        """Stream a job's output, honouring a single byte range."""
+        if job.state != DONE or job.output is None:
+            self._send_error(HTTPStatus.CONFLICT, f"Job is {job.state}, no output available")
+            return
+
+        size = job.size
+        start, end = 0, size - 1
+        status = HTTPStatus.OK
+        range_header = self.headers.get('Range')
+        if range_header:
+            try:
+                byte_range = _parse_range(range_header, size)
+            except ValueError:
+                self._send_error(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, "Range not satisfiable",
+                                 {'Content-Range': f'bytes */{size}'})
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                status = HTTPStatus.PARTIAL_CONTENT
+
+        self.send_response(status)
+        self.send_header('Content-Type', CONTENT_TYPES.get(job.output_format, 'application/octet-stream'))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Disposition', f'attachment; filename="{job.output_name}"')
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+
+        offset = start
+        while offset <= end:
+            try:
+                chunk = job.read_output(offset, min(DOWNLOAD_CHUNK_SIZE, end - offset + 1))
+            except (AttributeError, ValueError):
+                # Output discarded (DELETE or expiry) mid-download
+                chunk = b''
+            if not chunk:
+                self.close_connection = True
+                return
+            self.wfile.write(chunk)
+            offset += len(chunk)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/jobs':
+            self._reject(HTTPStatus.NOT_FOUND, "Not found")
+            return
+
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        filename = query.get('filename', '')
+        output_format = query.get('format', 'mp3').lower()
+        if not output_format.startswith('.'):
+            output_format = '.' + output_format
+        bitrate = query.get('bitrate', DEFAULT_BITRATE)
+        quality = query.get('quality', DEFAULT_QUALITY)
+
+        # Cheap checks first, so invalid uploads are refused before they are sent
+        if '.' + filename.rsplit('.', 1)[-1].lower() not in SecureAudioConverter.ALLOWED_INPUT_EXTENSIONS \
+                or '/' in filename or '\\' in filename:
+            self._reject(HTTPStatus.BAD_REQUEST, f"Unsupported or missing filename: {filename!r}")
+            return
+        if output_format not in SecureAudioConverter.ALLOWED_OUTPUT_EXTENSIONS:
+            self._reject(HTTPStatus.BAD_REQUEST, f"Unsupported output format: {output_format}")
+            return
+
+        if not self._has_body() and self.headers.get('Expect', '').lower() != '100-continue':
+            # Create-then-upload: the client learns the job id before sending the input
+            job = self.service.create_job(filename, output_format, bitrate, quality, reserve=False)
+            logger.info(f"Job {job.id}: {filename} -> {output_format}, awaiting input")
+            self._send_json(HTTPStatus.CREATED, job.to_dict(), {'Location': f'/jobs/{job.id}'})
+            return
+
+        body = self._request_body()
+        if body is None:
+            return
+        try:
+            job = self.service.create_job(filename, output_format, bitrate, quality)
+        except ServiceBusy as e:
+            self._reject(HTTPStatus.SERVICE_UNAVAILABLE, str(e), {'Retry-After': '5'})
+            return
+        logger.info(f"Job {job.id}: {filename} -> {output_format}")
+        self._convert_body(job, body)
+
+    def do_PUT(self):
+        match = _JOB_PATH.match(urlsplit(self.path).path)
+        if not match or match.group(2) != '/input':
+            self._reject(HTTPStatus.NOT_FOUND, "Not found")
+            return
+        job = self.service.get(match.group(1))
+        if job is None:
+            self._reject(HTTPStatus.NOT_FOUND, "No such job")
+            return
+
+        body = self._request_body()
+        if body is None:
+            return
+        try:
+            self.service.reserve(job)
+        except ServiceBusy as e:
+            self._reject(HTTPStatus.SERVICE_UNAVAILABLE, str(e), {'Retry-After': '5'})
+            return
+        except ValueError as e:
+            self._reject(HTTPStatus.CONFLICT, str(e))
+            return
+        logger.info(f"Job {job.id}: input upload started")
+        self._convert_body(job, body)
+
+    def _request_body(self):
+        """Readable view of the request body, or None once the request was refused."""
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            return _ChunkedReader(self.rfile)
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self._reject(HTTPStatus.LENGTH_REQUIRED, "Content-Length or chunked transfer encoding required")
+            return None
+        if length > SecureAudioConverter.MAX_FILE_SIZE:
+            self._reject(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "File too large")
+            return None
+        return _LengthReader(self.rfile, length)
+
+    def _convert_body(self, job: ServerJob, body):
+        """Convert the request body of a job holding a worker and send the final response."""
+        if self.headers.get('Expect', '').lower() == '100-continue':
+            # The id lets the client poll or cancel the job while it uploads
+            self.send_response_only(HTTPStatus.CONTINUE)
+            self.send_header('X-Job-Id', job.id)
+            self.send_header('Location', f'/jobs/{job.id}')
+            self.end_headers()
+
+        if self.service.run_job(job, body):
+            self._send_json(HTTPStatus.CREATED, job.to_dict(), {'Location': f'/jobs/{job.id}/output'})
+        else:
+            # The body may not have been read to the end
+            self.close_connection = True
+            self._send_json(HTTPStatus.UNPROCESSABLE_ENTITY, job.to_dict())
+
+    def do_DELETE(self):
+        match = _JOB_PATH.match(urlsplit(self.path).path)
+        job = self.service.cancel(match.group(1)) if match and not match.group(2) else None
+        if job is None:
+            self._send_error(HTTPStatus.NOT_FOUND, "No such job")
+        elif self.service.get(job.id) is job:
+            # Still running: it finishes as cancelled
+            self._send_json(HTTPStatus.ACCEPTED, job.to_dict())
+        else:
+            self.send_response(HTTPStatus.NO_CONTENT)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+
+class ConversionServer(ThreadingHTTPServer):
+    """Threaded HTTP server exposing a ConversionService."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], service: ConversionService):
+        self.service = service
+        super().__init__(address, ConversionRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.service.close()
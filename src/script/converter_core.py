@@ -5,29 +5,125 @@ Core converter module for secure audio conversion.
 import os
 import logging
 from pathlib import Path
-from typing import Optional, List
+from typing import BinaryIO, Dict, Optional, List, Union
 import subprocess
 import hashlib
+import mmap
 import shutil
+import struct
+import tempfile
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config import DEFAULT_MAX_WORKERS, SEGMENT_DURATION_THRESHOLD, SEGMENT_MIN_DURATION
+from conversion_cache import ConversionCache
+from conversion_result import ConversionResult
+from ffmpeg_runner import ConversionCancelled, JobGroup, run_ffmpeg
+from job_store import JobStore
+from media_probe import MediaInfo, ProbeCache, find_ffprobe, probe_media
+from metrics import ConversionTimer, stage
+from output_manifest import OutputManifest
+from output_naming import OutputNamer
+from segment_encoder import encode_segmented
 
 logger = logging.getLogger(__name__)
 
+
+class _SizeLimitedReader:
+    """Readable stream wrapper that refuses to read past a size limit."""
+    
+    def __init__(self, stream, limit: int):
+        self._stream = stream
+        self._limit = limit
+        self._consumed = 0
+    
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._stream.read(size)
+        self._consumed += len(chunk)
+        if self._consumed > self._limit:
+            raise ValueError(f"File too large. Maximum size: {self._limit / (1024*1024):.1f}MB")
+        return chunk
+
+
 class SecureAudioConverter:
     """Secure audio converter with input validation and safety checks."""
     
     # Allowed file extensions for security
     ALLOWED_INPUT_EXTENSIONS = {'.mp4', '.m4v', '.mov', '.avi', '.mkv', '.mp3', '.wav', '.m4a', '.aac', '.flac'}
-    ALLOWED_OUTPUT_EXTENSIONS = {'.mp3', '.wav'}
+    ALLOWED_OUTPUT_EXTENSIONS = {'.mp3', '.wav', '.m4a'}
+    
+    # Source codec each output format can carry without re-encoding
+    STREAM_COPY_CODECS = {'.mp3': 'mp3', '.wav': 'pcm_s16le', '.m4a': 'aac'}
+    WAV_SAMPLE_RATE = '44100'
+    
+    # Formats that support segment-parallel encoding
+    SEGMENTED_FORMATS = {'.mp3'}
+    
+    # MP4-family inputs can only be piped when the index (moov) precedes the media data
+    MP4_INPUT_EXTENSIONS = {'.mp4', '.m4v', '.mov', '.m4a'}
+    
+    # ffmpeg muxer for each output format, and the ones that must seek back to
+    # finish their header (written to a temporary file instead of stdout)
+    OUTPUT_MUXERS = {'.mp3': 'mp3', '.wav': 'wav', '.m4a': 'ipod'}
+    SEEKING_OUTPUT_FORMATS = {'.mp3', '.m4a'}
+    
+    # Encoded output kept in memory up to this size before spilling to disk
+    SPOOL_MAX_MEMORY = 32 * 1024 * 1024
     
     # Maximum file size (500MB)
     MAX_FILE_SIZE = 500 * 1024 * 1024
     
-    def __init__(self):
-        """Initialize the converter and check for ffmpeg availability."""
+    # Slice size fed to SHA-256 (large slices let hashlib release the GIL)
+    HASH_CHUNK_SIZE = 8 * 1024 * 1024
+    
+    def __init__(self, cache: Optional[ConversionCache] = None, concurrent_hashing: bool = True,
+                 allow_stream_copy: bool = True, probe_cache: Optional[ProbeCache] = None,
+                 segment_threshold: Optional[float] = SEGMENT_DURATION_THRESHOLD,
+                 segment_workers: Optional[int] = None, namer: Optional[OutputNamer] = None):
+        """
+        Initialize the converter and check for ffmpeg availability.
+        
+        Args:
+            cache: Optional conversion cache used to skip repeat encodes
+            concurrent_hashing: Hash inputs while ffmpeg runs instead of before it
+                (ignored when a cache is set, since the cache key needs the hash up front)
+            allow_stream_copy: Copy the source audio stream instead of re-encoding
+                when its codec, sample rate and bitrate already satisfy the request
+            probe_cache: Optional persistent cache of ffprobe results
+            segment_threshold: Input duration (seconds) from which MP3 encodes are split
+                into segments encoded in parallel; None or 0 disables segmenting
+            segment_workers: Maximum parallel segments per file (default: CPU count)
+            namer: Output naming template and claim index (default: input name,
+                with a _1, _2, ... suffix on collisions)
+        """
         self.ffmpeg_path = self._find_ffmpeg()
         if not self.ffmpeg_path:
             raise RuntimeError("FFmpeg not found. Please install FFmpeg and ensure it's in PATH.")
         
+        # ffprobe is optional; without it progress is reported without percentages
+        self.ffprobe_path = find_ffprobe(self.ffmpeg_path)
+        if not self.ffprobe_path:
+            logger.warning("ffprobe not found; conversion progress will not include percentages")
+        
+        self.cache = cache
+        self.concurrent_hashing = concurrent_hashing
+        self.allow_stream_copy = allow_stream_copy
+        self.probe_cache = probe_cache
+        self.segment_threshold = segment_threshold
+        self.segment_workers = segment_workers or DEFAULT_MAX_WORKERS
+        
+        # Number of conversions currently encoding (used to size segment parallelism)
+        self._active_lock = threading.Lock()
+        self._active_conversions = 0
+        self._ffmpeg_version = None
+        
+        # Running ffmpeg jobs, cancelled together by cancel()
+        self._jobs = JobGroup()
+        
+        # Output names are claimed through the namer (shared by batch workers)
+        self.namer = namer or OutputNamer()
+        
     def _find_ffmpeg(self) -> Optional[str]:
         """Find ffmpeg executable in system PATH."""
         # Try standard system PATH first
@@ -69,8 +165,7 @@ class SecureAudioConverter:
                 raise ValueError(f"File too large. Maximum size: {self.MAX_FILE_SIZE / (1024*1024):.1f}MB")
             
             # Check file extension
-            if path.suffix.lower() not in self.ALLOWED_INPUT_EXTENSIONS:
-                raise ValueError(f"Invalid input file type. Allowed: {', '.join(self.ALLOWED_INPUT_EXTENSIONS)}")
+            self._validate_input_name(path.name)
             
             return path
             
@@ -78,6 +173,13 @@ class SecureAudioConverter:
             logger.error(f"File validation failed: {e}")
             raise
     
+    def _validate_input_name(self, filename: str) -> str:
+        """Validate the extension of an input file name and return it (lowercase)."""
+        suffix = Path(filename).suffix.lower()
+        if suffix not in self.ALLOWED_INPUT_EXTENSIONS:
+            raise ValueError(f"Invalid input file type. Allowed: {', '.join(self.ALLOWED_INPUT_EXTENSIONS)}")
+        return suffix
+    
     def _validate_output_format(self, output_format: str) -> str:
         """Validate output format."""
         format_lower = output_format.lower()
@@ -89,8 +191,9 @@ class SecureAudioConverter:
         
         return format_lower
     
-    def _sanitize_output_path(self, input_path: Path, output_dir: Optional[str], output_format: str) -> Path:
-        """Create safe output path."""
+    def _sanitize_output_path(self, input_path: Path, output_dir: Optional[str], output_format: str,
+                              replace: Optional[str] = None) -> Path:
+        """Create and claim a safe output path (reusing `replace`, an earlier output of this input, when possible)."""
         if output_dir:
             output_directory = Path(output_dir).resolve()
             # Ensure output directory exists
@@ -98,171 +201,1062 @@ class SecureAudioConverter:
         else:
             output_directory = input_path.parent
         
-        # Create output filename
-        output_filename = input_path.stem + output_format
-        output_path = output_directory / output_filename
-        
-        # Prevent overwriting existing files without confirmation
-        if output_path.exists():
-            logger.warning(f"Output file already exists: {output_path}")
-            counter = 1
-            while output_path.exists():
-                output_filename = f"{input_path.stem}_{counter}{output_format}"
-                output_path = output_directory / output_filename
-                counter += 1
-            logger.info(f"Using alternative filename: {output_filename}")
-        
-        return output_path
+        # Never overwrites an existing file (or a name claimed by a parallel worker or process)
+        return self.namer.claim(input_path, output_directory, output_format, replace)
+    
+    @staticmethod
+    def _partial_path(output_path: Path) -> Path:
+        """Hidden sibling that ffmpeg writes to; renamed into place once the output is verified."""
+        return output_path.with_name(f".{output_path.stem}.part{output_path.suffix}")
+    
+    def _release_output_path(self, output_path: Path):
+        """Release an output path claimed by _sanitize_output_path."""
+        self.namer.release(output_path)
     
-    def _get_file_hash(self, file_path: Path) -> str:
+    def get_ffmpeg_version(self) -> str:
+        """Return the ffmpeg version banner (first line of `ffmpeg -version`)."""
+        if self._ffmpeg_version is None:
+            try:
+                result = subprocess.run([self.ffmpeg_path, '-version'], capture_output=True,
+                                        text=True, timeout=10, check=False)
+                self._ffmpeg_version = result.stdout.split('\n', 1)[0].strip() or 'unknown'
+            except (OSError, subprocess.TimeoutExpired) as e:
+                logger.warning(f"Could not determine ffmpeg version: {e}")
+                self._ffmpeg_version = 'unknown'
+        return self._ffmpeg_version
+    
+    def _get_file_hash(self, file_path: Path, timings: Optional[Dict[str, float]] = None) -> str:
         """Calculate SHA256 hash of the file for integrity check."""
         hash_sha256 = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_sha256.update(chunk)
+        with stage('hashing', timings) as record, open(file_path, "rb") as f:
+            record.bytes = os.fstat(f.fileno()).st_size
+            if record.bytes == 0:
+                return hash_sha256.hexdigest()
+            # Memory-map the file and hash it in large slices
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, len(view), self.HASH_CHUNK_SIZE):
+                        hash_sha256.update(view[offset:offset + self.HASH_CHUNK_SIZE])
+                finally:
+                    view.release()
         return hash_sha256.hexdigest()
     
+    def _start_background_hash(self, file_path: Path, timings: Optional[Dict[str, float]] = None) -> Future:
+        """Hash a file in a background thread; the digest is delivered via a Future."""
+        future = Future()
+        
+        def worker():
+            try:
+                future.set_result(self._get_file_hash(file_path, timings))
+            except Exception as e:
+                future.set_exception(e)
+        
+        threading.Thread(target=worker, name=f"hash-{file_path.name}", daemon=True).start()
+        return future
+    
+    def probe(self, input_file: str, file_hash: Optional[str] = None) -> Optional[MediaInfo]:
+        """
+        Inspect a media file with ffprobe, using the probe cache when available.
+        
+        Args:
+            input_file: Path to the media file
+            file_hash: SHA-256 of the file, if already known
+            
+        Returns:
+            MediaInfo: Container and audio stream metadata, or None if unavailable
+        """
+        path = Path(input_file).resolve()
+        
+        if self.probe_cache:
+            cached = self.probe_cache.get(path, file_hash)
+            if cached is not None:
+                return cached
+        
+        if not self.ffprobe_path:
+            return None
+        
+        info = probe_media(self.ffprobe_path, path)
+        if info is not None and self.probe_cache:
+            self.probe_cache.put(path, info, file_hash)
+        return info
+    
+    @staticmethod
+    def _parse_bitrate(value) -> Optional[int]:
+        """Parse a bitrate such as '192k' or '192000' into bits per second."""
+        if value is None:
+            return None
+        text = str(value).strip().lower()
+        multiplier = 1
+        if text.endswith('k'):
+            text, multiplier = text[:-1], 1000
+        elif text.endswith('m'):
+            text, multiplier = text[:-1], 1000000
+        try:
+            return int(float(text) * multiplier)
+        except ValueError:
+            return None
+    
+    def _can_stream_copy(self, media_info: Optional[MediaInfo], output_format: str, bitrate: str) -> bool:
+        """Check whether the source audio stream already satisfies the requested output."""
+        if not media_info or not media_info.has_audio:
+            return False
+        if media_info.audio_codec != self.STREAM_COPY_CODECS.get(output_format):
+            return False
+        
+        if output_format == '.wav':
+            return str(media_info.sample_rate) == self.WAV_SAMPLE_RATE
+        
+        # Lossy formats: re-encoding cannot improve a source at or below the requested bitrate
+        source_bitrate = media_info.audio_bitrate
+        requested_bitrate = self._parse_bitrate(bitrate)
+        if source_bitrate is None or requested_bitrate is None:
+            return False
+        return source_bitrate <= requested_bitrate * 1.02
+    
+    def _encode_options(self, output_format: str, bitrate: str, quality: str) -> List[str]:
+        """Codec options for encoding to the given output format."""
+        # Add format-specific options
+        if output_format == '.mp3':
+            options = [
+                '-acodec', 'libmp3lame',
+                '-ab', bitrate,
+            ]
+            
+            # Quality settings for MP3
+            if quality == 'high':
+                options.extend(['-q:a', '0'])
+            elif quality == 'medium':
+                options.extend(['-q:a', '2'])
+            else:  # low
+                options.extend(['-q:a', '4'])
+            return options
+            
+        if output_format == '.wav':
+            return [
+                '-acodec', 'pcm_s16le',
+                '-ar', self.WAV_SAMPLE_RATE,  # Sample rate
+            ]
+            
+        if output_format == '.m4a':
+            return [
+                '-acodec', 'aac',
+                '-ab', bitrate,
+            ]
+        
+        return []
+    
+    def _build_multi_output_command(self, input_path: Path, output_paths: Dict[str, Path],
+                                    output_formats: List[str], bitrate: str, quality: str,
+                                    copy_formats: set) -> List[str]:
+        """Build one ffmpeg command that writes several outputs from a single decode."""
+        cmd = [
+            self.ffmpeg_path,
+            '-i', str(input_path),
+            '-y',   # Overwrite output files
+        ]
+        for output_format in output_formats:
+            # Output options are per output file, so map the audio stream for each one
+            cmd.extend(['-map', '0:a:0', '-vn'])
+            if output_format in copy_formats:
+                cmd.extend(['-acodec', 'copy'])
+            else:
+                cmd.extend(self._encode_options(output_format, bitrate, quality))
+            cmd.append(str(output_paths[output_format]))
+        return cmd
+    
+    def _segment_count(self, duration: Optional[float], output_format: str) -> int:
+        """Number of parallel segments to encode a file with (0 or 1 = single pass)."""
+        if (not self.segment_threshold or not duration or duration < self.segment_threshold
+                or output_format not in self.SEGMENTED_FORMATS):
+            return 0
+        
+        # Share the cores with other conversions already running (e.g. batch workers)
+        with self._active_lock:
+            active = max(1, self._active_conversions)
+        workers = max(1, self.segment_workers // active)
+        return min(workers, int(duration // SEGMENT_MIN_DURATION) or 1)
+    
+    def _build_ffmpeg_command(self, input_path: Path, output_path: Path, output_format: str,
+                              bitrate: str, quality: str, stream_copy: bool = False) -> List[str]:
+        """Build the ffmpeg command for one conversion."""
+        # Build ffmpeg command with security considerations
+        cmd = [
+            self.ffmpeg_path,
+            '-i', str(input_path),
+            '-vn',  # No video
+            '-y',   # Overwrite output files
+        ]
+        
+        if stream_copy:
+            # Remux the first audio stream without decoding it
+            cmd.extend(['-map', '0:a:0', '-acodec', 'copy'])
+        else:
+            cmd.extend(self._encode_options(output_format, bitrate, quality))
+        
+        cmd.append(str(output_path))
+        return cmd
+    
     def convert_file(self, input_file: str, output_format: str = '.mp3', 
                     output_dir: Optional[str] = None, bitrate: str = '192k',
-                    quality: str = 'high', progress_callback=None) -> bool:
+                    quality: str = 'high', progress_callback=None,
+                    replace_output: Optional[str] = None,
+                    input_hash: Optional[str] = None) -> ConversionResult:
         """
-        Convert MP4 file to MP3 or WAV format securely.
+        Convert MP4 file to MP3, WAV or M4A format securely.
         
         Args:
             input_file: Path to input MP4 file
-            output_format: Output format (.mp3 or .wav)
+            output_format: Output format (.mp3, .wav or .m4a)
             output_dir: Output directory (optional)
             bitrate: Audio bitrate (default: 192k)
             quality: Conversion quality (high, medium, low)
             progress_callback: Optional callback for progress updates
+            replace_output: Earlier output of this input to overwrite instead of
+                writing a new _1, _2, ... file next to it (kept if the conversion fails)
+            input_hash: SHA-256 of the input if the caller already computed it
+                (e.g. while saving an upload); the input is then not hashed again
             
         Returns:
-            bool: True if conversion successful, False otherwise
+            ConversionResult: Truthy if the conversion succeeded; carries the output
+            path actually used, sizes, input hash, probe metadata, stage timings and
+            ffmpeg's exit code and stderr tail
         """
+        result = ConversionResult(input_file, output_format)
+        timings = result.timings
+        output_path = None
+        replacing = False
+        timer = ConversionTimer('convert_file')
         try:
-            # Validate inputs
-            input_path = self._validate_file_path(input_file)
-            output_format = self._validate_output_format(output_format)
-            output_path = self._sanitize_output_path(input_path, output_dir, output_format)
+            with stage('validation', timings) as record:
+                # Validate inputs
+                input_path = self._validate_file_path(input_file)
+                output_format = self._validate_output_format(output_format)
+                result.input_path, result.output_format = str(input_path), output_format
+                record.bytes = result.input_size = input_path.stat().st_size
+                
+                # Reject inputs without audio before doing any heavy work
+                media_info = result.media_info = self.probe(input_path)
+                if media_info is not None and not media_info.has_audio:
+                    raise ValueError(f"Input file has no audio stream: {input_path.name}")
             
-            logger.info(f"Starting conversion: {input_path} -> {output_path}")
-            logger.info(f"Input file hash: {self._get_file_hash(input_path)}")
+            with stage('output_path', timings):
+                output_path = self._sanitize_output_path(input_path, output_dir, output_format,
+                                                         replace_output)
+                replacing = replace_output is not None and output_path == Path(replace_output).resolve()
+            # Encode under a temporary name so a crash never leaves a truncated output behind
+            work_path = self._partial_path(output_path)
             
-            if progress_callback:
-                progress_callback("Starting conversion...", 10)
+            logger.info(f"Starting conversion: {input_path} -> {output_path}")
+            hash_future = None
+            if input_hash:
+                result.input_hash = input_hash
+                logger.info(f"Input file hash: {result.input_hash}")
+            elif self.cache or not self.concurrent_hashing:
+                result.input_hash = self._get_file_hash(input_path, timings)
+                logger.info(f"Input file hash: {result.input_hash}")
+            else:
+                # Hash while ffmpeg runs; the integrity record is logged once both finish
+                hash_future = self._start_background_hash(input_path, timings)
             
-            # Build ffmpeg command with security considerations
-            cmd = [
-                self.ffmpeg_path,
-                '-i', str(input_path),
-                '-vn',  # No video
-                '-y',   # Overwrite output files
-            ]
+            # Serve repeat conversions straight from the cache
+            cache_key = None
+            if self.cache:
+                cache_key = ConversionCache.make_key(result.input_hash, output_format, bitrate, quality,
+                                                     self.get_ffmpeg_version(), self.allow_stream_copy)
+                if self.cache.restore(cache_key, output_format, work_path):
+                    os.replace(work_path, output_path)
+                    logger.info(f"Conversion served from cache: {output_path}")
+                    if progress_callback:
+                        progress_callback("Conversion completed (cached result)", 100)
+                    result.add_output(output_format, output_path, output_path.stat().st_size)
+                    result.success = result.cached = True
+                    timer.result = 'cached'
+                    return result
             
-            # Add format-specific options
-            if output_format == '.mp3':
-                cmd.extend([
-                    '-acodec', 'libmp3lame',
-                    '-ab', bitrate,
-                ])
-                
-                # Quality settings for MP3
-                if quality == 'high':
-                    cmd.extend(['-q:a', '0'])
-                elif quality == 'medium':
-                    cmd.extend(['-q:a', '2'])
-                else:  # low
-                    cmd.extend(['-q:a', '4'])
-                    
-            elif output_format == '.wav':
-                cmd.extend([
-                    '-acodec', 'pcm_s16le',
-                    '-ar', '44100',  # Sample rate
-                ])
+            duration = media_info.duration if media_info else None
+            if duration:
+                logger.info(f"Input duration: {duration:.2f}s")
             
-            cmd.append(str(output_path))
+            # Copy the audio stream as-is when it already satisfies the request
+            stream_copy = self.allow_stream_copy and self._can_stream_copy(
+                media_info, output_format, bitrate)
+            if stream_copy:
+                logger.info("Source audio already matches the requested output; copying stream")
             
             if progress_callback:
-                progress_callback("Converting...", 50)
+                progress_callback("Starting conversion...", 0)
+            
+            # ffmpeg process start-up is recorded separately as the 'spawn' stage
+            with stage('encode', timings) as record:
+                with self._active_lock:
+                    self._active_conversions += 1
+                try:
+                    segment_count = 0 if stream_copy else self._segment_count(duration, output_format)
+                    if segment_count > 1:
+                        # Long input: encode frame-aligned segments in parallel and splice them
+                        completed = encode_segmented(
+                            self.ffmpeg_path, input_path, work_path,
+                            self._encode_options(output_format, bitrate, quality),
+                            duration, media_info.sample_rate, segment_count,
+                            progress_callback=progress_callback,
+                            group=self._jobs
+                        )
+                    else:
+                        cmd = self._build_ffmpeg_command(input_path, work_path, output_format,
+                                                         bitrate, quality, stream_copy)
+                        
+                        # Execute conversion, streaming ffmpeg's progress; the time limit
+                        # scales with the duration and the observed encode speed
+                        logger.info(f"Executing: {' '.join(cmd[:3])} ... {cmd[-1]}")
+                        
+                        completed = run_ffmpeg(
+                            cmd,
+                            duration=duration,
+                            progress_callback=progress_callback,
+                            group=self._jobs,
+                            timings=timings
+                        )
+                finally:
+                    with self._active_lock:
+                        self._active_conversions -= 1
+                
+                if stream_copy and completed.returncode != 0:
+                    logger.warning(f"Stream copy failed (code {completed.returncode}), falling back to re-encoding")
+                    cmd = self._build_ffmpeg_command(input_path, work_path, output_format,
+                                                     bitrate, quality, stream_copy=False)
+                    completed = run_ffmpeg(
+                        cmd,
+                        duration=duration,
+                        progress_callback=progress_callback,
+                        group=self._jobs,
+                        timings=timings
+                    )
+                if work_path.exists():
+                    record.bytes = work_path.stat().st_size
+            result.set_ffmpeg(completed)
             
-            # Execute conversion with timeout
-            logger.info(f"Executing: {' '.join(cmd[:3])} ... {cmd[-1]}")
+            if hash_future is not None:
+                result.input_hash = hash_future.result()
+                logger.info(f"Input file hash: {result.input_hash}")
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=300,  # 5 minute timeout
-                check=False
-            )
+            # Index the probe result by content hash as well
+            if self.probe_cache and media_info is not None:
+                self.probe_cache.put(input_path, media_info, result.input_hash)
             
             if progress_callback:
-                progress_callback("Finalizing...", 90)
+                progress_callback("Finalizing...", 99)
             
-            if result.returncode == 0:
+            if completed.returncode == 0:
                 # Verify output file was created
-                if output_path.exists() and output_path.stat().st_size > 0:
+                with stage('verification', timings) as record:
+                    verified = work_path.exists() and work_path.stat().st_size > 0
+                    if verified:
+                        os.replace(work_path, output_path)
+                        record.bytes = output_path.stat().st_size
+                if verified:
                     logger.info(f"Conversion successful: {output_path}")
-                    logger.info(f"Output file size: {output_path.stat().st_size / (1024*1024):.2f}MB")
+                    logger.info(f"Output file size: {record.bytes / (1024*1024):.2f}MB")
+                    if self.cache and cache_key:
+                        self.cache.put(cache_key, output_format, output_path)
                     if progress_callback:
                         progress_callback("Conversion completed successfully!", 100)
-                    return True
+                    result.add_output(output_format, output_path, record.bytes)
+                    result.success = True
+                    timer.result = 'success'
+                    return result
                 else:
                     logger.error("Conversion failed: Output file not created or empty")
+                    result.error = "Conversion failed: Output file not created"
                     if progress_callback:
-                        progress_callback("Conversion failed: Output file not created", 0)
-                    return False
+                        progress_callback(result.error, 0)
+                    return result
             else:
-                logger.error(f"FFmpeg error (code {result.returncode}): {result.stderr}")
+                logger.error(f"FFmpeg error (code {completed.returncode}): {completed.stderr}")
+                result.error = f"FFmpeg error: {completed.stderr[:50]}..."
                 if progress_callback:
-                    progress_callback(f"FFmpeg error: {result.stderr[:50]}...", 0)
-                return False
+                    progress_callback(result.error, 0)
+                return result
                 
+        except ConversionCancelled:
+            logger.info(f"Conversion cancelled: {input_file}")
+            timer.result = 'cancelled'
+            result.error = "Conversion cancelled"
+            if progress_callback:
+                progress_callback(result.error, 0)
+            return result
         except subprocess.TimeoutExpired:
             logger.error("Conversion timed out")
+            timer.result = 'timeout'
+            result.error = "Conversion timed out"
+            if progress_callback:
+                progress_callback(result.error, 0)
+            return result
+        except Exception as e:
+            logger.error(f"Conversion failed: {e}")
+            result.error = f"Error: {str(e)}"
+            if progress_callback:
+                progress_callback(result.error, 0)
+            return result
+        finally:
+            if output_path is not None:
+                # Never leave partial output from a failed, stopped or cancelled run
+                self._partial_path(output_path).unlink(missing_ok=True)
+                if not result.success and not replacing:
+                    output_path.unlink(missing_ok=True)
+                self._release_output_path(output_path)
+            timer.finish()
+    
+    def convert_multi(self, input_file: str, output_formats: List[str],
+                      output_dir: Optional[str] = None, bitrate: str = '192k',
+                      quality: str = 'high', progress_callback=None,
+                      replace_outputs: Optional[Dict[str, str]] = None) -> Dict[str, ConversionResult]:
+        """
+        Convert one input to several formats with a single ffmpeg pass.
+        
+        The input is demuxed and decoded once; ffmpeg feeds the decoded audio to
+        one encoder per output.
+        
+        Args:
+            input_file: Path to input file
+            output_formats: Output formats (e.g. ['.mp3', '.wav'])
+            output_dir: Output directory (optional)
+            bitrate: Audio bitrate (default: 192k)
+            quality: Conversion quality (high, medium, low)
+            progress_callback: Optional callback for progress updates
+            replace_outputs: Earlier outputs of this input (format -> path) to
+                overwrite, as for convert_file()
+            
+        Returns:
+            Dict[str, ConversionResult]: Result for each (normalized) output format
+        """
+        formats = []
+        output_paths = {}
+        replaced = set()
+        replace_outputs = replace_outputs or {}
+        try:
+            for output_format in output_formats:
+                output_format = self._validate_output_format(output_format)
+                if output_format not in formats:
+                    formats.append(output_format)
+        except Exception as e:
+            logger.error(f"Conversion failed: {e}")
+            if progress_callback:
+                progress_callback(f"Error: {str(e)}", 0)
+            return {}
+        
+        if len(formats) == 1:
+            return {formats[0]: self.convert_file(input_file, formats[0], output_dir, bitrate,
+                                                  quality, progress_callback,
+                                                  replace_outputs.get(formats[0]))}
+        
+        # The outputs share one ffmpeg run, so they share its timings and input details
+        timings: Dict[str, float] = {}
+        results = {}
+        for output_format in formats:
+            results[output_format] = ConversionResult(input_file, output_format)
+            results[output_format].timings = timings
+        
+        def record(**fields):
+            for result in results.values():
+                for name, value in fields.items():
+                    setattr(result, name, value)
+        
+        def fail(message: str):
+            for result in results.values():
+                if not result.success:
+                    result.error = message
+        
+        timer = ConversionTimer('convert_multi')
+        try:
+            with stage('validation', timings) as stage_record:
+                input_path = self._validate_file_path(input_file)
+                stage_record.bytes = input_path.stat().st_size
+                record(input_path=str(input_path), input_size=stage_record.bytes)
+                
+                # Reject inputs without audio before doing any heavy work
+                media_info = self.probe(input_path)
+                record(media_info=media_info)
+                if media_info is not None and not media_info.has_audio:
+                    raise ValueError(f"Input file has no audio stream: {input_path.name}")
+            
+            with stage('output_path', timings):
+                for output_format in formats:
+                    output_path = self._sanitize_output_path(input_path, output_dir, output_format,
+                                                             replace_outputs.get(output_format))
+                    output_paths[output_format] = output_path
+                    if output_format in replace_outputs and output_path == Path(replace_outputs[output_format]).resolve():
+                        replaced.add(output_format)
+            
+            logger.info(f"Starting multi-output conversion: {input_path} -> "
+                        f"{', '.join(str(path) for path in output_paths.values())}")
+            hash_future = None
+            if self.cache or not self.concurrent_hashing:
+                input_hash = self._get_file_hash(input_path, timings)
+                logger.info(f"Input file hash: {input_hash}")
+            else:
+                hash_future = self._start_background_hash(input_path, timings)
+            
+            # Outputs already in the cache are restored; the rest share one ffmpeg run
+            cache_keys = {}
+            pending = []
+            for output_format in formats:
+                if self.cache:
+                    cache_keys[output_format] = ConversionCache.make_key(
+                        input_hash, output_format, bitrate, quality, self.get_ffmpeg_version(),
+                        self.allow_stream_copy)
+                    output_path = output_paths[output_format]
+                    work_path = self._partial_path(output_path)
+                    if self.cache.restore(cache_keys[output_format], output_format, work_path):
+                        os.replace(work_path, output_path)
+                        results[output_format].add_output(output_format, output_path, output_path.stat().st_size)
+                        results[output_format].success = results[output_format].cached = True
+                        continue
+                pending.append(output_format)
+            
+            if pending:
+                duration = media_info.duration if media_info else None
+                copy_formats = {output_format for output_format in pending
+                                if self.allow_stream_copy
+                                and self._can_stream_copy(media_info, output_format, bitrate)}
+                
+                if progress_callback:
+                    progress_callback("Starting conversion...", 0)
+                
+                # Encode under temporary names, renamed once each output is verified
+                work_paths = {output_format: self._partial_path(output_paths[output_format])
+                              for output_format in pending}
+                with stage('encode', timings) as stage_record:
+                    cmd = self._build_multi_output_command(input_path, work_paths, pending,
+                                                           bitrate, quality, copy_formats)
+                    logger.info(f"Executing: {' '.join(cmd[:3])} ... ({len(pending)} outputs)")
+                    completed = run_ffmpeg(cmd, duration=duration, progress_callback=progress_callback,
+                                           group=self._jobs, timings=timings)
+                    
+                    if copy_formats and completed.returncode != 0:
+                        logger.warning(f"Stream copy failed (code {completed.returncode}), falling back to re-encoding")
+                        cmd = self._build_multi_output_command(input_path, work_paths, pending,
+                                                               bitrate, quality, set())
+                        completed = run_ffmpeg(cmd, duration=duration, progress_callback=progress_callback,
+                                               group=self._jobs, timings=timings)
+                    stage_record.bytes = sum(path.stat().st_size for path in work_paths.values()
+                                             if path.exists())
+                for output_format in pending:
+                    results[output_format].set_ffmpeg(completed)
+                
+                if completed.returncode != 0:
+                    logger.error(f"FFmpeg error (code {completed.returncode}): {completed.stderr}")
+                    fail(f"FFmpeg error: {completed.stderr[:50]}...")
+                else:
+                    # Validate each output separately
+                    with stage('verification', timings) as stage_record:
+                        for output_format in pending:
+                            output_path = output_paths[output_format]
+                            work_path = work_paths[output_format]
+                            if work_path.exists() and work_path.stat().st_size > 0:
+                                os.replace(work_path, output_path)
+                                size = output_path.stat().st_size
+                                stage_record.bytes += size
+                                results[output_format].add_output(output_format, output_path, size)
+                                results[output_format].success = True
+                                logger.info(f"Conversion successful: {output_path}")
+                                if self.cache:
+                                    self.cache.put(cache_keys[output_format], output_format, output_path)
+                            else:
+                                logger.error(f"Conversion failed: Output file not created or empty: {output_path}")
+                                results[output_format].error = "Conversion failed: Output file not created"
+            
+            if hash_future is not None:
+                input_hash = hash_future.result()
+                logger.info(f"Input file hash: {input_hash}")
+            record(input_hash=input_hash)
+            
+            successful = sum(1 for result in results.values() if result)
+            timer.result = 'success' if successful == len(formats) else 'failed'
+            if progress_callback:
+                progress_callback(f"{successful}/{len(formats)} outputs created", 100 if successful else 0)
+                
+        except ConversionCancelled:
+            logger.info(f"Conversion cancelled: {input_file}")
+            timer.result = 'cancelled'
+            fail("Conversion cancelled")
+            if progress_callback:
+                progress_callback("Conversion cancelled", 0)
+        except subprocess.TimeoutExpired:
+            logger.error("Conversion timed out")
+            timer.result = 'timeout'
+            fail("Conversion timed out")
             if progress_callback:
                 progress_callback("Conversion timed out", 0)
-            return False
         except Exception as e:
             logger.error(f"Conversion failed: {e}")
+            fail(f"Error: {str(e)}")
             if progress_callback:
                 progress_callback(f"Error: {str(e)}", 0)
-            return False
+        finally:
+            for output_format, output_path in output_paths.items():
+                self._partial_path(output_path).unlink(missing_ok=True)
+                if not results[output_format] and output_format not in replaced:
+                    output_path.unlink(missing_ok=True)
+                self._release_output_path(output_path)
+            timer.finish()
+        
+        return results
+    
+    def convert_stream(self, data, filename: str, output_format: str = '.mp3',
+                       bitrate: str = '192k', quality: str = 'high',
+                       progress_callback=None) -> ConversionResult:
+        """
+        Convert in-memory or streamed input, feeding ffmpeg over stdin/stdout.
+        
+        Inputs are piped to ffmpeg unless the container needs seeking (MP4-family
+        files whose index sits after the media data), in which case they are
+        spooled to a temporary file. WAV output is read from ffmpeg's stdout and
+        its header sizes are patched afterwards; MP3 and M4A output is written to
+        a temporary file because their muxers finish the header by seeking back.
+        
+        Args:
+            data: Bytes-like object or readable binary stream with the input file
+            filename: Original file name (used for the extension check)
+            output_format: Output format (.mp3, .wav or .m4a)
+            bitrate: Audio bitrate (default: 192k)
+            quality: Conversion quality (high, medium, low)
+            progress_callback: Optional callback for progress updates
+            
+        Returns:
+            ConversionResult: On success, output_stream is a readable stream positioned
+            at the start of the encoded audio (the caller closes it); on failure,
+            error holds the reason
+        """
+        result = ConversionResult(filename, output_format)
+        temp_paths = []
+        output = None
+        timer = ConversionTimer('convert_stream')
+        try:
+            # Validate inputs
+            suffix = self._validate_input_name(filename)
+            output_format = self._validate_output_format(output_format)
+            source = self._limit_input_size(data)
+            
+            media_info = None
+            if suffix in self.MP4_INPUT_EXTENSIONS and not self._mp4_index_first(data):
+                # The demuxer needs random access: spool the input to disk
+                input_path = self._spool_to_temp_file(source, suffix)
+                temp_paths.append(input_path)
+                media_info = result.media_info = self.probe(input_path)
+                if media_info is not None and not media_info.has_audio:
+                    raise ValueError(f"Input file has no audio stream: {filename}")
+                input_arg, input_stream = str(input_path), None
+            else:
+                input_arg, input_stream = 'pipe:0', source
+            
+            if output_format in self.SEEKING_OUTPUT_FORMATS:
+                fd, temp_name = tempfile.mkstemp(suffix=output_format)
+                os.close(fd)
+                temp_paths.append(Path(temp_name))
+                output_arg, output_stream = temp_name, None
+            else:
+                output = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_MEMORY)
+                output_arg, output_stream = 'pipe:1', output
+            
+            cmd = [
+                self.ffmpeg_path,
+                '-i', input_arg,
+                '-vn',  # No video
+                '-y',   # Overwrite output files
+                *self._encode_options(output_format, bitrate, quality),
+                '-f', self.OUTPUT_MUXERS[output_format],
+                output_arg,
+            ]
+            
+            logger.info(f"Starting stream conversion: {filename} -> {output_format} "
+                        f"(input via {'pipe' if input_stream is not None else 'temporary file'})")
+            if progress_callback:
+                progress_callback("Starting conversion...", 0)
+            
+            with stage('encode', result.timings):
+                completed = run_ffmpeg(
+                    cmd,
+                    duration=media_info.duration if media_info else None,
+                    progress_callback=progress_callback,
+                    input_stream=input_stream,
+                    output_stream=output_stream,
+                    group=self._jobs
+                )
+            result.set_ffmpeg(completed)
+            
+            if completed.returncode != 0:
+                logger.error(f"FFmpeg error (code {completed.returncode}): {completed.stderr}")
+                result.error = f"FFmpeg error: {completed.stderr[:50]}..."
+                if progress_callback:
+                    progress_callback(result.error, 0)
+                return result
+            
+            if output is None:
+                output = self._open_temp_output(temp_paths.pop())
+            elif output_format == '.wav':
+                self._fix_wav_header(output)
+            
+            output.seek(0, os.SEEK_END)
+            size = output.tell()
+            output.seek(0)
+            if size == 0:
+                logger.error("Conversion failed: Output is empty")
+                result.error = "Conversion failed: Output is empty"
+                if progress_callback:
+                    progress_callback(result.error, 0)
+                return result
+            
+            logger.info(f"Stream conversion successful: {filename} ({size / (1024*1024):.2f}MB)")
+            if progress_callback:
+                progress_callback("Conversion completed successfully!", 100)
+            result.output_stream, output = output, None
+            result.output_size = size
+            result.success = True
+            timer.result = 'success'
+            return result
+            
+        except ConversionCancelled:
+            logger.info(f"Conversion cancelled: {filename}")
+            timer.result = 'cancelled'
+            result.error = "Conversion cancelled"
+        except subprocess.TimeoutExpired:
+            logger.error("Conversion timed out")
+            timer.result = 'timeout'
+            result.error = "Conversion timed out"
+        except Exception as e:
+            logger.error(f"Conversion failed: {e}")
+            result.error = f"Error: {str(e)}"
+        finally:
+            if output is not None:
+                output.close()
+            for path in temp_paths:
+                path.unlink(missing_ok=True)
+            timer.finish()
+        
+        if progress_callback:
+            progress_callback(result.error, 0)
+        return result
     
-    def convert_batch(self, input_files: List[str], output_format: str = '.mp3',
+    def _limit_input_size(self, data):
+        """Enforce MAX_FILE_SIZE on a bytes-like object or readable stream."""
+        if hasattr(data, 'read'):
+            return _SizeLimitedReader(data, self.MAX_FILE_SIZE)
+        size = memoryview(data).nbytes
+        if size > self.MAX_FILE_SIZE:
+            raise ValueError(f"File too large. Maximum size: {self.MAX_FILE_SIZE / (1024*1024):.1f}MB")
+        return data
+    
+    @staticmethod
+    def _mp4_index_first(data) -> bool:
+        """Check whether an MP4-family file has its moov box before mdat (pipe-friendly)."""
+        if hasattr(data, 'read'):
+            if not (hasattr(data, 'seekable') and data.seekable()):
+                return False
+            start = data.tell()
+            
+            def read_at(offset, size):
+                data.seek(start + offset)
+                return data.read(size)
+        else:
+            view = memoryview(data).cast('B')
+            
+            def read_at(offset, size):
+                return bytes(view[offset:offset + size])
+        
+        try:
+            offset = 0
+            while True:
+                header = read_at(offset, 16)
+                if len(header) < 8:
+                    return False
+                box_size, box_type = struct.unpack('>I4s', header[:8])
+                if box_type == b'moov':
+                    return True
+                if box_type == b'mdat':
+                    return False
+                if box_size == 1 and len(header) == 16:
+                    box_size = struct.unpack('>Q', header[8:16])[0]
+                if box_size < 8:
+                    return False
+                offset += box_size
+        finally:
+            if hasattr(data, 'read'):
+                data.seek(start)
+    
+    @staticmethod
+    def _spool_to_temp_file(source, suffix: str) -> Path:
+        """Write input data to a named temporary file."""
+        fd, temp_name = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'wb') as f:
+            if hasattr(source, 'read'):
+                shutil.copyfileobj(source, f, 1024 * 1024)
+            else:
+                f.write(source)
+        return Path(temp_name)
+    
+    def _open_temp_output(self, path: Path) -> BinaryIO:
+        """Open a temporary output file as an anonymous stream."""
+        stream = open(path, 'rb')
+        try:
+            # POSIX: the open handle keeps the data alive, no copy needed
+            path.unlink()
+            return stream
+        except OSError:
+            # Windows cannot delete open files: copy into a spooled buffer instead
+            spooled = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_MEMORY)
+            with stream:
+                shutil.copyfileobj(stream, spooled, 1024 * 1024)
+            path.unlink(missing_ok=True)
+            spooled.seek(0)
+            return spooled
+    
+    @staticmethod
+    def _fix_wav_header(stream: BinaryIO):
+        """Fill in the RIFF and data chunk sizes ffmpeg cannot write to a pipe."""
+        stream.seek(0, os.SEEK_END)
+        total_size = stream.tell()
+        stream.seek(0)
+        header = stream.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            return
+        
+        stream.seek(4)
+        stream.write(struct.pack('<I', min(total_size - 8, 0xFFFFFFFF)))
+        
+        offset = 12
+        while offset + 8 <= total_size:
+            stream.seek(offset)
+            chunk_id, chunk_size = struct.unpack('<4sI', stream.read(8))
+            if chunk_id == b'data':
+                stream.seek(offset + 4)
+                stream.write(struct.pack('<I', min(total_size - offset - 8, 0xFFFFFFFF)))
+                break
+            offset += 8 + chunk_size + (chunk_size & 1)
+    
+    def cancel(self):
+        """
+        Cancel the conversions currently running on this converter.
+
+        Running ffmpeg processes are terminated (then killed if they do not exit
+        promptly), their partial outputs are removed, and files still queued in a
+        batch are skipped. Safe to call from any thread, e.g. a GUI stop button.
+        
+        The converter stays cancelled, including for conversions that start
+        after this call, until reset_cancel() is called. The caller that hands
+        the converter new work resets it, so a cancel that arrives just before
+        a conversion starts still stops that conversion.
+        """
+        logger.info(f"Cancelling conversions ({len(self._jobs)} running ffmpeg process(es))")
+        self._jobs.cancel()
+    
+    def reset_cancel(self):
+        """Allow conversions to run again after cancel()."""
+        self._jobs.reset()
+
+    def _resolve_worker_count(self, max_workers: Optional[int], total_files: int) -> int:
+        """Clamp the requested worker count to [1, total_files]."""
+        if max_workers is None:
+            max_workers = DEFAULT_MAX_WORKERS
+        if max_workers < 1:
+            raise ValueError("Number of workers must be at least 1")
+        return max(1, min(max_workers, total_files))
+    
+    def convert_batch(self, input_files: List[str], output_format: Union[str, List[str]] = '.mp3',
                      output_dir: Optional[str] = None, bitrate: str = '192k',
-                     quality: str = 'high', progress_callback=None) -> List[bool]:
+                     quality: str = 'high', progress_callback=None,
+                     max_workers: Optional[int] = None, job_store: Optional[JobStore] = None,
+                     batch_id: Optional[str] = None,
+                     manifest: Optional[OutputManifest] = None) -> List[ConversionResult]:
         """
-        Convert multiple files in batch.
+        Convert multiple files in batch, running several ffmpeg processes concurrently.
+        
+        With a job store, the batch is recorded as durable jobs: running the same
+        batch again (or from another process) resumes it, skipping files that
+        already finished.
+        
+        With a manifest, the batch is incremental: inputs whose size and mtime
+        match the manifest and whose recorded outputs are intact are skipped
+        without being read, and changed inputs overwrite their earlier outputs.
         
         Args:
             input_files: List of input file paths
-            output_format: Output format (.mp3 or .wav)
+            output_format: Output format (.mp3, .wav or .m4a), or a list of formats
+                to produce from a single decode of each input
             output_dir: Output directory (optional)
             bitrate: Audio bitrate
             quality: Conversion quality
             progress_callback: Optional callback for progress updates
+            max_workers: Number of parallel conversions (default: CPU count)
+            job_store: Optional persistent job queue for resumable batches
+            batch_id: Batch identifier in the job store (default: derived from the
+                input files and parameters)
+            manifest: Optional index of up-to-date outputs for incremental runs
             
         Returns:
-            List[bool]: Success status for each file
+            List[ConversionResult]: Result for each file, in input order (truthy on
+            success; with several formats, the outputs of a file are merged)
         """
-        results = []
         total_files = len(input_files)
+        if total_files == 0:
+            return []
         
-        for i, input_file in enumerate(input_files):
-            logger.info(f"Processing file {i + 1}/{total_files}: {input_file}")
+        workers = self._resolve_worker_count(max_workers, total_files)
+        logger.info(f"Starting batch of {total_files} files with {workers} worker(s)")
+        
+        manifest_params = None
+        if manifest is not None:
+            formats = output_format if isinstance(output_format, (list, tuple)) else [output_format]
+            try:
+                manifest_params = OutputManifest.make_params(
+                    [self._validate_output_format(fmt) for fmt in formats], output_dir, bitrate, quality)
+            except ValueError:
+                manifest = None  # Each conversion reports the invalid format
+        
+        # Per-file progress, aggregated into a single overall percentage
+        file_progress = [0.0] * total_files
+        progress_lock = threading.Lock()
+        
+        def report(index: int, message: str, progress: float):
+            if not progress_callback:
+                return
+            with progress_lock:
+                file_progress[index] = max(file_progress[index], progress)
+                overall = sum(file_progress) / total_files
+                progress_callback(f"[{index + 1}/{total_files}] {Path(input_files[index]).name}: {message}",
+                                  overall)
+        
+        def convert_one(index: int, input_file: str) -> ConversionResult:
+            logger.info(f"Processing file {index + 1}/{total_files}: {input_file}")
             
-            if progress_callback:
-                progress_callback(f"Processing file {i + 1}/{total_files}: {Path(input_file).name}", 
-                                (i / total_files) * 100)
+            def file_callback(message, progress):
+                report(index, message, progress)
+            
+            input_stat = None
+            previous_outputs = {}
+            if manifest is not None:
+                input_path = Path(input_file).resolve()
+                try:
+                    input_stat = input_path.stat()
+                except OSError:
+                    pass  # Reported by the conversion below
+                else:
+                    entry = manifest.get(input_path, manifest_params)
+                    if entry and manifest.is_current(input_path, manifest_params, entry, self._get_file_hash):
+                        logger.info(f"Up to date, skipping: {input_file}")
+                        report(index, "Up to date", 100)
+                        return ConversionResult.from_manifest_entry(input_file, entry)
+                    previous_outputs = manifest.outputs_of(input_path)
             
-            success = self.convert_file(input_file, output_format, output_dir, bitrate, quality)
-            results.append(success)
+            if isinstance(output_format, (list, tuple)):
+                outputs = self.convert_multi(input_file, output_format, output_dir, bitrate,
+                                             quality, file_callback, previous_outputs)
+                result = ConversionResult.combine(input_file, outputs)
+                if not outputs:
+                    result.error = "Invalid output formats"
+            else:
+                replace_output = (previous_outputs.get(self._validate_output_format(output_format))
+                                  if previous_outputs else None)
+                result = self.convert_file(input_file, output_format, output_dir, bitrate,
+                                           quality, file_callback, replace_output)
+            if result and input_stat is not None:
+                try:
+                    manifest.record(input_path, manifest_params, input_stat, result.input_hash,
+                                    result.outputs)
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning(f"Could not update the output manifest for {input_file}: {e}")
+            report(index, "Done" if result else "Failed", 100)
+            return result
+        
+        if job_store is not None:
+            results = self._run_stored_batch(job_store, batch_id, input_files, output_format, output_dir,
+                                             bitrate, quality, workers, convert_one, report)
+        else:
+            def run_queued(index: int) -> ConversionResult:
+                if self._jobs.cancelled:
+                    # Cancelled while queued: release the worker without starting ffmpeg
+                    report(index, "Cancelled", 100)
+                    result = ConversionResult(input_files[index])
+                    result.error = "Conversion cancelled"
+                    return result
+                return convert_one(index, input_files[index])
             
-        successful = sum(results)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="convert") as executor:
+                futures = [executor.submit(run_queued, i) for i in range(total_files)]
+                results = [future.result() for future in futures]
+        
+        successful = sum(1 for result in results if result)
         logger.info(f"Batch conversion complete: {successful}/{total_files} files converted successfully")
+        if manifest is not None:
+            skipped = sum(1 for result in results if result.skipped)
+            logger.info(f"{skipped} file(s) were already up to date")
         
         if progress_callback:
             progress_callback(f"Batch complete: {successful}/{total_files} files converted", 100)
         
         return results
+    
+    def _run_stored_batch(self, job_store: JobStore, batch_id: Optional[str], input_files: List[str],
+                          output_format: Union[str, List[str]], output_dir: Optional[str], bitrate: str,
+                          quality: str, workers: int, convert_one, report) -> List[ConversionResult]:
+        """Drain a batch through the persistent job queue and return its per-file results."""
+        formats = list(output_format) if isinstance(output_format, (list, tuple)) else [output_format]
+        params = {
+            'formats': formats,
+            'output_dir': str(Path(output_dir).resolve()) if output_dir else None,
+            'bitrate': bitrate,
+            'quality': quality,
+        }
+        if batch_id is None:
+            batch_id = JobStore.make_batch_id(input_files, params)
+        job_store.enqueue(batch_id, input_files, params)
+        
+        # Files finished by an earlier run are reported from their job records
+        results = [ConversionResult.from_job_record(record) for record in job_store.jobs(batch_id)]
+        for index, result in enumerate(results):
+            if result:
+                report(index, "Already converted", 100)
+        converted_here = set()
+        logger.info(f"Job batch {batch_id}: {job_store.counts(batch_id)}")
+        
+        # Keep the lease on claimed jobs alive while they convert
+        stop_heartbeat = threading.Event()
+        
+        def heartbeat():
+            while not stop_heartbeat.wait(job_store.lease_timeout / 3):
+                job_store.heartbeat()
+        
+        def drain():
+            while not self._jobs.cancelled:
+                job = job_store.claim(batch_id)
+                if job is None:
+                    return
+                try:
+                    result = convert_one(job.position, job.input_path)
+                except Exception as e:
+                    result = ConversionResult(job.input_path)
+                    result.error = str(e)
+                results[job.position] = result
+                converted_here.add(job.position)
+                if not result and self._jobs.cancelled:
+                    # Interrupted, not failed: leave it for the resumed batch
+                    job_store.release(job.id)
+                else:
+                    job_store.complete(job.id, result.success, result.input_hash,
+                                       list(result.outputs.values()) if result else None, result.error)
+        
+        heartbeat_thread = threading.Thread(target=heartbeat, name="job-heartbeat", daemon=True)
+        heartbeat_thread.start()
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="convert") as executor:
+                for future in [executor.submit(drain) for _ in range(workers)]:
+                    future.result()
+        finally:
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+        
+        # Jobs finished meanwhile by other processes sharing the queue
+        for index, record in enumerate(job_store.jobs(batch_id)):
+            if index not in converted_here:
+                results[index] = ConversionResult.from_job_record(record)
+        return results
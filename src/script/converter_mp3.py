@@ -8,44 +8,230 @@ Supports both GUI and command-line interfaces.
 import sys
 import argparse
 import logging
+import os
+import signal
+import threading
 from pathlib import Path
 
 # Add current directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 
 from converter_core import SecureAudioConverter
-from config import setup_logging, APP_NAME, APP_VERSION
+from conversion_cache import ConversionCache
+from media_probe import ProbeCache
+from job_store import JobStore
+from output_manifest import OutputManifest
+from output_naming import NAMING_TEMPLATES, OutputNamer
+from metrics import start_periodic_export, write_json_file, write_prometheus_file
+from config import (setup_logging, APP_NAME, APP_VERSION, CACHE_DIR, CACHE_MAX_SIZE_MB,
+                    PROBE_CACHE_FILE, PROBE_CACHE_MAX_ENTRIES, SEGMENT_DURATION_THRESHOLD,
+                    JOB_STORE_FILE, JOB_LEASE_TIMEOUT, JOB_MAX_ATTEMPTS, DEFAULT_MAX_WORKERS,
+                    WATCH_SETTLE_TIME, WATCH_POLL_INTERVAL, SERVER_HOST, SERVER_PORT,
+                    METRICS_EXPORT_INTERVAL)
 
 logger = logging.getLogger(__name__)
 
+OUTPUT_FORMATS = ['mp3', 'wav', 'm4a']
+
+
+def create_cache(args):
+    """Create the conversion cache from CLI arguments."""
+    return ConversionCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+
+def run_cache_command(args):
+    """Inspect or purge the conversion cache."""
+    try:
+        cache = create_cache(args)
+        if args.cache_purge:
+            removed = cache.purge()
+            print(f"Removed {removed} cached file(s) from {cache.cache_dir}")
+        if args.cache_info:
+            stats = cache.stats()
+            print(f"Cache directory: {stats['path']}")
+            print(f"Entries: {stats['entries']}")
+            print(f"Size: {stats['size_bytes'] / (1024*1024):.2f}MB "
+                  f"of {stats['max_size_bytes'] / (1024*1024):.0f}MB")
+        sys.exit(0)
+    except Exception as e:
+        logger.error(f"Cache error: {e}")
+        sys.exit(1)
+
+
+def create_converter(args):
+    """Create the converter (with its caches) from CLI arguments."""
+    cache = None if args.no_cache else create_cache(args)
+    probe_cache = None if args.no_cache else ProbeCache(PROBE_CACHE_FILE, PROBE_CACHE_MAX_ENTRIES)
+    return SecureAudioConverter(cache=cache, allow_stream_copy=not args.no_stream_copy,
+                                probe_cache=probe_cache,
+                                segment_threshold=args.segment_threshold,
+                                namer=create_namer(args))
+
+
+def create_namer(args):
+    """Create the output namer; {reldir} defaults to the inputs' common directory (or the watched one)."""
+    source_root = args.source_root
+    if source_root is None:
+        if args.watch:
+            directories = [os.path.abspath(path) for path in args.watch]
+        else:
+            directories = [os.path.dirname(os.path.abspath(path)) for path in args.input_files]
+        if directories:
+            source_root = os.path.commonpath(directories)
+    return OutputNamer(args.naming, source_root)
+
+
+def export_metrics(args):
+    """Write the metrics files requested on the command line."""
+    try:
+        if args.metrics_file:
+            write_prometheus_file(args.metrics_file)
+        if args.metrics_json:
+            write_json_file(args.metrics_json)
+    except OSError as e:
+        logger.error(f"Could not write metrics: {e}")
+
+
+def start_metrics_export(args):
+    """Keep --metrics-file current while a daemon mode runs (returns the stop event, or None)."""
+    if not args.metrics_file:
+        return None
+    return start_periodic_export(args.metrics_file, METRICS_EXPORT_INTERVAL)
+
 
 def run_cli(args):
     """Run the command-line interface."""
     try:
-        converter = SecureAudioConverter()
+        converter = create_converter(args)
         
-        if len(args.input_files) == 1:
+        output_formats = [f'.{fmt}' for fmt in args.format]
+        job_store = JobStore(args.job_db, JOB_LEASE_TIMEOUT, JOB_MAX_ATTEMPTS) if args.resume else None
+        # The manifest sits in the output directory (or the current one when outputs go next to their inputs)
+        manifest = (OutputManifest.for_output_dir(args.output_dir or '.', args.check_hash)
+                    if args.incremental else None)
+        
+        if job_store is None and manifest is None and len(args.input_files) == 1 and len(output_formats) == 1:
             success = converter.convert_file(
                 args.input_files[0],
-                f'.{args.format}',
+                output_formats[0],
                 args.output_dir,
                 args.bitrate,
                 args.quality
             )
             sys.exit(0 if success else 1)
+        elif job_store is None and manifest is None and len(args.input_files) == 1:
+            # Several formats from one decode of the input
+            results = converter.convert_multi(
+                args.input_files[0],
+                output_formats,
+                args.output_dir,
+                args.bitrate,
+                args.quality
+            )
+            sys.exit(0 if results and all(results.values()) else 1)
         else:
             results = converter.convert_batch(
                 args.input_files,
-                f'.{args.format}',
+                output_formats if len(output_formats) > 1 else output_formats[0],
                 args.output_dir,
                 args.bitrate,
-                args.quality
+                args.quality,
+                max_workers=args.jobs,
+                job_store=job_store,
+                manifest=manifest
             )
             sys.exit(0 if all(results) else 1)
             
     except Exception as e:
         logger.error(f"Application error: {e}")
         sys.exit(1)
+    finally:
+        export_metrics(args)
+
+
+def run_watch(args):
+    """Run the watch-folder daemon until interrupted."""
+    try:
+        from folder_watcher import FolderWatcher
+        
+        watcher = FolderWatcher(
+            create_converter(args),
+            args.watch,
+            args.output_dir,
+            [f'.{fmt}' for fmt in args.format],
+            args.bitrate,
+            args.quality,
+            max_workers=args.jobs or DEFAULT_MAX_WORKERS,
+            settle_time=args.settle_time,
+            poll_interval=WATCH_POLL_INTERVAL
+        )
+        
+        # Stop cleanly on SIGTERM as well as Ctrl+C
+        signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+        metrics_export = start_metrics_export(args)
+        try:
+            watcher.run()
+        finally:
+            if metrics_export is not None:
+                metrics_export.set()
+            export_metrics(args)
+        sys.exit(0)
+    except Exception as e:
+        logger.error(f"Watch error: {e}")
+        sys.exit(1)
+
+
+def run_server(args):
+    """Run the HTTP conversion service until interrupted."""
+    try:
+        from conversion_server import ConversionServer, ConversionService
+        
+        host, port = args.serve
+        service = ConversionService(lambda: create_converter(args), max_workers=args.jobs)
+        server = ConversionServer((host, port), service)
+        logger.info(f"Serving on http://{host}:{server.server_port} ({service.max_workers} worker(s))")
+        
+        # Stop cleanly on SIGTERM as well as Ctrl+C
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        metrics_export = start_metrics_export(args)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Server interrupted; stopping")
+        finally:
+            server.server_close()
+            if metrics_export is not None:
+                metrics_export.set()
+            export_metrics(args)
+        sys.exit(0)
+    except Exception as e:
+        logger.error(f"Server error: {e}")
+        sys.exit(1)
+
+
+def parse_address(value):
+    """Parse a [HOST:]PORT listen address."""
+    host, _, port = value.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid address '{value}' (expected [HOST:]PORT)")
+    if not 0 <= port <= 65535:
+        raise argparse.ArgumentTypeError(f"invalid port {port}")
+    return host or SERVER_HOST, port
+
+
+def parse_formats(value):
+    """Parse a comma-separated list of output formats (e.g. 'mp3,wav')."""
+    formats = []
+    for fmt in value.split(','):
+        fmt = fmt.strip().lower().lstrip('.')
+        if fmt not in OUTPUT_FORMATS:
+            raise argparse.ArgumentTypeError(
+                f"invalid format '{fmt}' (choose from {', '.join(OUTPUT_FORMATS)})")
+        if fmt not in formats:
+            formats.append(fmt)
+    return formats
 
 
 def run_gui():
@@ -74,7 +260,7 @@ def run_gui():
 def main():
     """Main function with interface selection."""
     parser = argparse.ArgumentParser(
-        description=f"{APP_NAME} v{APP_VERSION} - Secure MP4 to MP3/WAV converter",
+        description=f"{APP_NAME} v{APP_VERSION} - Secure MP4 to MP3/WAV/M4A converter",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 GUI Mode (default):
@@ -84,32 +270,119 @@ GUI Mode (default):
 CLI Examples:
   python converter_mp3.py input.mp4
   python converter_mp3.py input.mp4 --format wav --bitrate 320k
+  python converter_mp3.py input.mp4 --format mp3,wav
   python converter_mp3.py *.mp4 --output-dir ./converted --quality high
+  python converter_mp3.py *.mp4 --output-dir ./converted --jobs 4
+  python converter_mp3.py *.mp4 --output-dir ./converted --resume
+  python converter_mp3.py *.flac --output-dir ./converted --incremental
+
+Watch-folder daemon:
+  python converter_mp3.py --watch ./incoming --output-dir ./converted
+
+HTTP service:
+  python converter_mp3.py --serve 8765 --jobs 2
+
+Cache:
+  python converter_mp3.py --cache-info
+  python converter_mp3.py --cache-purge
         """
     )
     
     parser.add_argument('input_files', nargs='*', help='Input MP4 file(s) (CLI mode)')
     parser.add_argument('--gui', action='store_true', help='Launch GUI interface (default if no files specified)')
-    parser.add_argument('--format', '-f', choices=['mp3', 'wav'], default='mp3',
-                       help='Output format (default: mp3) [CLI only]')
+    parser.add_argument('--format', '-f', type=parse_formats, default=['mp3'],
+                       help='Output format(s): mp3, wav, m4a, or a comma-separated list such as '
+                            'mp3,wav to produce several outputs from one decode (default: mp3) [CLI only]')
     parser.add_argument('--output-dir', '-o', help='Output directory [CLI only]')
     parser.add_argument('--bitrate', '-b', default='192k',
                        help='Audio bitrate (default: 192k) [CLI only]')
     parser.add_argument('--quality', '-q', choices=['high', 'medium', 'low'], 
                        default='high', help='Conversion quality (default: high) [CLI only]')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                       help='Number of files to convert in parallel (default: CPU count) [CLI only]')
+    parser.add_argument('--segment-threshold', type=float, default=SEGMENT_DURATION_THRESHOLD,
+                       metavar='SECONDS',
+                       help=f'Split MP3 encodes of inputs at least this long into parallel segments '
+                            f'(default: {SEGMENT_DURATION_THRESHOLD}, 0 disables) [CLI only]')
+    parser.add_argument('--resume', action='store_true',
+                       help='Record the batch in a persistent job queue; re-running the same command '
+                            'resumes it and skips finished files, and several processes can share it [CLI only]')
+    parser.add_argument('--job-db', default=JOB_STORE_FILE, metavar='PATH',
+                       help=f'Job queue database used with --resume (default: {JOB_STORE_FILE}) [CLI only]')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Skip inputs whose outputs are up to date according to a manifest kept in the '
+                            'output directory; changed inputs overwrite their earlier outputs [CLI only]')
+    parser.add_argument('--check-hash', action='store_true',
+                       help='With --incremental, hash inputs whose mtime changed but size did not, and '
+                            'skip them if the content is unchanged [CLI only]')
+    parser.add_argument('--naming', default='default', metavar='TEMPLATE',
+                       help=f'Output naming: {", ".join(NAMING_TEMPLATES)}, or a template using '
+                            '{stem}, {hash}, {timestamp} and {reldir} (default: default)')
+    parser.add_argument('--source-root', metavar='DIR',
+                       help='Directory that --naming mirror ({reldir}) is relative to '
+                            '(default: common directory of the inputs)')
+    parser.add_argument('--watch', nargs='+', metavar='DIR',
+                       help='Run as a daemon converting files dropped into these directories '
+                            '(requires --output-dir)')
+    parser.add_argument('--serve', nargs='?', const=(SERVER_HOST, SERVER_PORT), type=parse_address,
+                       metavar='[HOST:]PORT',
+                       help=f'Run the HTTP conversion service (default: {SERVER_HOST}:{SERVER_PORT}); '
+                            'uses --jobs workers')
+    parser.add_argument('--settle-time', type=float, default=WATCH_SETTLE_TIME, metavar='SECONDS',
+                       help=f'With --watch, wait until a file is unchanged this long before converting it '
+                            f'(default: {WATCH_SETTLE_TIME})')
+    parser.add_argument('--metrics-file', metavar='PATH',
+                       help='Write per-stage metrics in Prometheus text format to PATH (at exit, and '
+                            'every few seconds in --watch/--serve mode)')
+    parser.add_argument('--metrics-json', metavar='PATH',
+                       help='Dump per-stage metrics as JSON to PATH when the run ends')
+    parser.add_argument('--no-stream-copy', action='store_true',
+                       help='Always re-encode, even when the source audio already matches [CLI only]')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Disable the conversion and probe caches. The cache is on by default and '
+                            'needs each input hash before converting; without it, hashing '
+                            'overlaps with ffmpeg [CLI only]')
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                       help=f'Conversion cache directory (default: {CACHE_DIR})')
+    parser.add_argument('--cache-size', type=int, default=CACHE_MAX_SIZE_MB, metavar='MB',
+                       help=f'Maximum cache size in MB (default: {CACHE_MAX_SIZE_MB})')
+    parser.add_argument('--cache-info', action='store_true',
+                       help='Show conversion cache statistics and exit')
+    parser.add_argument('--cache-purge', action='store_true',
+                       help='Delete all cached conversion outputs and exit')
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='Enable verbose logging')
     
     args = parser.parse_args()
     
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.watch and not args.output_dir:
+        parser.error("--watch requires --output-dir")
+    if args.check_hash and not args.incremental:
+        parser.error("--check-hash requires --incremental")
+    try:
+        OutputNamer(args.naming)
+    except ValueError as e:
+        parser.error(str(e))
+    
     # Setup logging
     log_level = logging.DEBUG if args.verbose else logging.INFO
     setup_logging(log_level)
     
     logger.info(f"Starting {APP_NAME} v{APP_VERSION}")
     
+    if args.cache_info or args.cache_purge:
+        run_cache_command(args)
+    
     # Determine interface mode
-    if args.gui or not args.input_files:
+    if args.serve:
+        logger.info("Running in server mode")
+        run_server(args)
+    elif args.watch:
+        logger.info("Running in watch mode")
+        run_watch(args)
+    elif args.gui or not args.input_files:
         # GUI mode
         logger.info("Launching GUI interface")
         run_gui()
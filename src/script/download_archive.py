@@ -0,0 +1,55 @@
+"""
+ZIP packaging of converted outputs for bulk downloads.
+
+Outputs are streamed from disk into an on-disk archive, one file at a time
+(zipfile copies each member in small chunks), so building the archive never
+holds more than a chunk of any output in memory. Formats that are already
+compressed are STORED: deflating an MP3 or AAC stream costs CPU and saves
+next to nothing. Uncompressed formats (WAV) are still deflated.
+"""
+
+import logging
+import os
+import zipfile
+from typing import Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Output formats whose payload is already compressed
+STORED_FORMATS = {'.mp3', '.m4a', '.aac'}
+
+
+def compression_for(filename: str) -> int:
+    """ZIP compression method for a member name."""
+    if os.path.splitext(filename)[1].lower() in STORED_FORMATS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def write_zip(files: Iterable[Tuple[str, str]], destination: str) -> int:
+    """
+    Write a ZIP archive of files on disk.
+
+    Args:
+        files: (path, name in the archive) pairs; missing paths are skipped
+        destination: Archive path (written to a temporary name, then renamed)
+
+    Returns:
+        int: Size of the archive in bytes
+    """
+    temp_path = destination + '.part'
+    try:
+        with zipfile.ZipFile(temp_path, 'w') as archive:
+            for path, arcname in files:
+                if not os.path.exists(path):
+                    logger.warning(f"Skipping missing output in archive: {path}")
+                    continue
+                archive.write(path, arcname, compress_type=compression_for(arcname))
+        os.replace(temp_path, destination)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    size = os.path.getsize(destination)
+    logger.info(f"Created archive {destination} ({size / (1024*1024):.2f}MB)")
+    return size
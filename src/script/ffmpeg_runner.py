@@ -0,0 +1,634 @@
+"""
+FFmpeg process runner with real-time progress reporting.
+
+FFmpeg is started with ``-progress pipe:1`` so that it writes machine-readable
+``key=value`` blocks to stdout while encoding. Each block is turned into a
+progress snapshot (percentage, speed, ETA) and forwarded to the caller. When
+stdout carries encoded audio instead, progress is read from stderr.
+
+Each run is owned by an FFmpegJob, whose time limit scales with the input
+duration and the encode speed ffmpeg reports, and which can be cancelled from
+any thread.
+
+ffmpeg runs with an explicit log level and without its banner, and its log is
+read as it is produced into a StderrBuffer. The buffer keeps only the last lines
+plus lines that look like errors, so memory per job stays bounded however
+much ffmpeg writes.
+"""
+
+import logging
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Union
+
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Minimum wall-clock budget for a job whose input duration is known (seconds)
+DEFAULT_TIMEOUT = 300
+
+# Allowance for opening inputs and starting encoders (seconds)
+STARTUP_TIMEOUT = 60
+
+# Encode speed (multiple of realtime) assumed until ffmpeg reports one
+MIN_ASSUMED_SPEED = 0.5
+
+# Headroom applied to the ETA computed from the observed encode speed
+SPEED_SLACK = 3.0
+
+# A job whose output position does not advance for this long is considered stuck
+STALL_TIMEOUT = 120
+
+# Time allowed between terminate() and kill() when stopping a job
+TERMINATE_GRACE = 5
+
+# How often the watchdog checks deadlines
+WATCHDOG_INTERVAL = 0.5
+
+
+class ConversionCancelled(Exception):
+    """Raised when an ffmpeg job is cancelled before it finishes."""
+
+
+class FFmpegProgress(NamedTuple):
+    """One progress snapshot parsed from ffmpeg's -progress output."""
+    out_time: float                 # Seconds of output written so far
+    duration: Optional[float]       # Probed input duration, if known
+    speed: Optional[float]          # Encode speed as a multiple of realtime
+    finished: bool                  # True for the final (progress=end) block
+
+    @property
+    def percent(self) -> Optional[float]:
+        """Completion percentage, or None when the duration is unknown."""
+        if self.finished:
+            return 100.0
+        if not self.duration:
+            return None
+        return max(0.0, min(99.9, self.out_time / self.duration * 100))
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds remaining, or None when it cannot be computed."""
+        if self.finished:
+            return 0.0
+        if not self.duration or not self.speed:
+            return None
+        return max(0.0, (self.duration - self.out_time) / self.speed)
+
+    def describe(self) -> str:
+        """Human-readable progress message for progress callbacks."""
+        parts = []
+        if self.percent is not None:
+            parts.append(f"{self.percent:.1f}%")
+        else:
+            parts.append(f"{_format_seconds(self.out_time)} processed")
+        if self.speed:
+            parts.append(f"speed {self.speed:.1f}x")
+        if self.eta is not None:
+            parts.append(f"ETA {_format_seconds(self.eta)}")
+        return "Converting... " + ", ".join(parts)
+
+
+def _format_seconds(seconds: float) -> str:
+    """Format seconds as H:MM:SS."""
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+
+
+def _parse_out_time(values: dict) -> Optional[float]:
+    """Extract the output position in seconds from a progress block."""
+    # out_time_ms is (despite its name) also in microseconds
+    for key in ('out_time_us', 'out_time_ms'):
+        value = values.get(key)
+        if value and value != 'N/A':
+            try:
+                return int(value) / 1_000_000
+            except ValueError:
+                pass
+    value = values.get('out_time')
+    if value and value != 'N/A':
+        try:
+            hours, minutes, seconds = value.split(':')
+            return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        except ValueError:
+            pass
+    return None
+
+
+def _parse_speed(value: Optional[str]) -> Optional[float]:
+    """Parse a speed value such as '12.3x'."""
+    if not value or value == 'N/A':
+        return None
+    try:
+        return float(value.rstrip('x'))
+    except ValueError:
+        return None
+
+
+class ProgressParser:
+    """Incremental parser for ffmpeg's -progress key=value stream."""
+
+    def __init__(self, duration: Optional[float] = None):
+        self.duration = duration
+        self._values = {}
+        self._out_time = 0.0
+
+    def feed(self, line: str) -> Optional[FFmpegProgress]:
+        """Consume one line; return a snapshot when a block is complete."""
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return None
+        self._values[key] = value.strip()
+        if key != 'progress':
+            return None
+
+        out_time = _parse_out_time(self._values)
+        if out_time is not None:
+            self._out_time = out_time
+        snapshot = FFmpegProgress(
+            out_time=self._out_time,
+            duration=self.duration,
+            speed=_parse_speed(self._values.get('speed')),
+            finished=(value.strip() == 'end'),
+        )
+        self._values = {}
+        return snapshot
+
+
+# Matches the key=value lines of a -progress block (some values are padded, e.g. "speed=  15x")
+_PROGRESS_LINE = re.compile(r'^[a-z0-9_]+=.*$')
+
+# Chunk size used when piping data into or out of ffmpeg
+PIPE_CHUNK_SIZE = 1024 * 1024
+
+# ffmpeg log level: errors only (progress is reported separately through -progress)
+FFMPEG_LOGLEVEL = 'error'
+
+# Longest line read from an ffmpeg pipe at once (longer lines are split)
+MAX_LINE_LENGTH = 4096
+
+# Lines of ffmpeg's log that look like errors (kept even when they scroll out of the tail)
+_ERROR_LINE = re.compile(r'error|invalid|fail|could not|cannot|unable|no such|not found|'
+                         r'unsupported|corrupt|denied|broken|truncat', re.IGNORECASE)
+
+
+class StderrBuffer:
+    """
+    Bounded capture of ffmpeg's log output.
+
+    Keeps the last tail_lines lines plus up to error_lines earlier lines that
+    match error patterns; everything else is counted and dropped.
+    """
+
+    TAIL_LINES = 40
+    ERROR_LINES = 20
+
+    def __init__(self, tail_lines: int = TAIL_LINES, error_lines: int = ERROR_LINES):
+        self._tail = deque(maxlen=tail_lines)
+        self._errors = deque(maxlen=error_lines)
+        self._line_number = 0
+        self._lock = threading.Lock()
+
+    def append(self, line: str):
+        with self._lock:
+            self._line_number += 1
+            if len(self._tail) == self._tail.maxlen:
+                # The oldest tail line is about to be dropped: keep it if it reports an error
+                number, oldest = self._tail[0]
+                if _ERROR_LINE.search(oldest):
+                    self._errors.append((number, oldest))
+            self._tail.append((self._line_number, line))
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines seen (kept or not)."""
+        return self._line_number
+
+    def getvalue(self) -> str:
+        """Kept lines in order, with a marker where lines were dropped."""
+        with self._lock:
+            kept = list(self._errors) + list(self._tail)
+        parts = []
+        expected = 1
+        for number, line in kept:
+            if number > expected:
+                parts.append(f"[... {number - expected} line(s) omitted ...]\n")
+            parts.append(line if line.endswith('\n') else line + '\n')
+            expected = number + 1
+        return ''.join(parts)
+
+
+def _decode_lines(stream):
+    """Yield decoded text lines from a binary pipe (split at MAX_LINE_LENGTH bytes)."""
+    for raw in iter(lambda: stream.readline(MAX_LINE_LENGTH), b''):
+        yield raw.decode('utf-8', errors='replace')
+
+
+def _drain_stream(stream, buffer: StderrBuffer):
+    """Read a pipe to EOF so ffmpeg never blocks on a full buffer."""
+    for line in _decode_lines(stream):
+        buffer.append(line)
+
+
+def _copy_output(stream, output_stream: BinaryIO):
+    """Copy ffmpeg's stdout into the caller's output stream."""
+    for chunk in iter(lambda: stream.read(PIPE_CHUNK_SIZE), b''):
+        output_stream.write(chunk)
+
+
+def _feed_input(stdin, input_stream: Union[bytes, bytearray, memoryview, BinaryIO], errors: List[BaseException],
+                time_limit: Optional['TimeLimit'] = None):
+    """Write the input data to ffmpeg's stdin, then close it."""
+    try:
+        if hasattr(input_stream, 'read'):
+            while True:
+                # A slow input (e.g. an upload) must not look like a stalled ffmpeg
+                if time_limit is not None:
+                    time_limit.input_wait()
+                try:
+                    chunk = input_stream.read(PIPE_CHUNK_SIZE)
+                finally:
+                    if time_limit is not None:
+                        time_limit.input_received()
+                if not chunk:
+                    break
+                stdin.write(chunk)
+        else:
+            view = memoryview(input_stream)
+            for offset in range(0, len(view), PIPE_CHUNK_SIZE):
+                stdin.write(view[offset:offset + PIPE_CHUNK_SIZE])
+    except BrokenPipeError:
+        # ffmpeg stopped reading (error or enough data); its exit code tells the story
+        pass
+    except Exception as e:
+        errors.append(e)
+    finally:
+        try:
+            stdin.close()
+        except OSError:
+            pass
+
+
+def ffmpeg_base_args(ffmpeg_path: str, progress_target: str = 'pipe:1') -> List[str]:
+    """Executable plus the logging and progress options every run uses."""
+    return [ffmpeg_path, '-hide_banner', '-loglevel', FFMPEG_LOGLEVEL,
+            '-progress', progress_target, '-nostats']
+
+
+class TimeLimit:
+    """
+    Time limit of one ffmpeg run.
+
+    Without a fixed timeout the limit follows the work: it starts from the
+    probed duration at a conservative assumed speed and is re-estimated from
+    the speed ffmpeg reports. Independently, a run whose output position stops
+    advancing for stall_timeout is considered stuck. Time spent waiting for
+    input data (e.g. an upload arriving slowly) does not count towards a stall:
+    ffmpeg cannot make progress on data it has not received yet, and a client
+    that stops sending is the concern of whoever owns the input stream.
+    """
+
+    def __init__(self, duration: Optional[float] = None, timeout: Optional[float] = None,
+                 stall_timeout: float = STALL_TIMEOUT):
+        self.duration = duration
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self._lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        """(Re)start the clock, e.g. when the process is launched."""
+        now = time.monotonic()
+        with self._lock:
+            self.started_at = now
+            self._last_advance = now
+            self._input_wait_started: Optional[float] = None
+            self._out_time = 0.0
+            if self.timeout is not None:
+                self._deadline = now + self.timeout
+            elif self.duration:
+                budget = STARTUP_TIMEOUT + self.duration / MIN_ASSUMED_SPEED
+                self._deadline = now + max(DEFAULT_TIMEOUT, budget)
+            else:
+                # Unknown length: rely on stall detection alone
+                self._deadline = None
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since start()."""
+        return time.monotonic() - self.started_at
+
+    def update(self, snapshot: FFmpegProgress):
+        """Track output progress and re-estimate the deadline from the encode speed."""
+        now = time.monotonic()
+        with self._lock:
+            if snapshot.out_time > self._out_time:
+                self._out_time = snapshot.out_time
+                self._last_advance = now
+            eta = snapshot.eta
+            if self.timeout is None and eta is not None:
+                self._deadline = now + eta * SPEED_SLACK + STARTUP_TIMEOUT
+
+    def input_wait(self):
+        """The input stream is being read: stop the stall clock until input_received()."""
+        with self._lock:
+            self._input_wait_started = time.monotonic()
+
+    def input_received(self):
+        """A read of the input stream returned; the time it took is not stall time."""
+        now = time.monotonic()
+        with self._lock:
+            if self._input_wait_started is not None:
+                self._last_advance += now - self._input_wait_started
+                self._input_wait_started = None
+
+    def _stall_clock(self, now: float) -> float:
+        """Last output advance, not counting time spent waiting for input (call with the lock held)."""
+        if self._input_wait_started is not None:
+            return self._last_advance + now - self._input_wait_started
+        return self._last_advance
+
+    def remaining(self) -> float:
+        """Seconds until the deadline or the stall limit is reached (whichever is first)."""
+        now = time.monotonic()
+        with self._lock:
+            remaining = self._stall_clock(now) + self.stall_timeout - now
+            if self._deadline is not None:
+                remaining = min(remaining, self._deadline - now)
+        return remaining
+
+    def exceeded(self) -> Optional[str]:
+        """'timeout' or 'stalled' once the limit is exceeded, else None."""
+        now = time.monotonic()
+        with self._lock:
+            if self._deadline is not None and now > self._deadline:
+                return 'timeout'
+            if now - self._stall_clock(now) > self.stall_timeout:
+                return 'stalled'
+        return None
+
+
+class JobGroup:
+    """Set of running ffmpeg jobs that can be cancelled together."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = set()
+        self._cancelled = False
+
+    @property
+    def cancelled(self) -> bool:
+        """True once cancel() was called (until reset())."""
+        return self._cancelled
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+    def add(self, job: 'FFmpegJob'):
+        """Track a job; it is cancelled straight away if the group already is."""
+        with self._lock:
+            self._jobs.add(job)
+            cancelled = self._cancelled
+        if cancelled:
+            job.cancel()
+
+    def discard(self, job: 'FFmpegJob'):
+        """Stop tracking a finished job."""
+        with self._lock:
+            self._jobs.discard(job)
+
+    def cancel(self):
+        """Cancel every running job, and any job added until reset()."""
+        with self._lock:
+            self._cancelled = True
+            jobs = list(self._jobs)
+        for job in jobs:
+            job.cancel()
+
+    def reset(self):
+        """Allow new jobs to run again after cancel()."""
+        with self._lock:
+            self._cancelled = False
+
+
+class FFmpegJob:
+    """
+    Handle owning a single ffmpeg process.
+
+    A watchdog thread enforces the job's TimeLimit (scaled with the input and
+    the observed encode speed, plus stall detection). cancel() can be called
+    from any thread; the process is terminated, then killed if it does not
+    exit within TERMINATE_GRACE.
+    """
+
+    def __init__(self, cmd: List[str], duration: Optional[float] = None,
+                 progress_callback=None, timeout: Optional[float] = None,
+                 input_stream=None, output_stream: Optional[BinaryIO] = None,
+                 group: Optional[JobGroup] = None, stall_timeout: float = STALL_TIMEOUT,
+                 timings: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            cmd: FFmpeg command (executable first)
+            duration: Probed input duration in seconds, used for percentages, ETA and the time limit
+            progress_callback: Optional callback(message, percent) for progress updates
+            timeout: Fixed time limit in seconds (default: derived from duration and speed)
+            input_stream: Optional bytes-like object or readable binary stream fed to
+                ffmpeg's stdin (the command should read from pipe:0)
+            output_stream: Optional writable binary stream receiving ffmpeg's stdout
+                (the command should write to pipe:1)
+            group: Optional JobGroup the job registers with while it runs
+            stall_timeout: Seconds without output progress after which the job is stopped
+                (time spent waiting for input_stream data is not counted)
+            timings: Optional dict receiving the seconds spent spawning ffmpeg ('spawn')
+        """
+        self.cmd = cmd
+        self.duration = duration
+        self.progress_callback = progress_callback
+        self.timeout = timeout
+        self.input_stream = input_stream
+        self.output_stream = output_stream
+        self.group = group
+        self.timings = timings
+        self.time_limit = TimeLimit(duration, timeout, stall_timeout)
+        self.process: Optional[subprocess.Popen] = None
+        self.stop_reason: Optional[str] = None  # 'cancelled', 'timeout' or 'stalled'
+
+        self._cancel_requested = threading.Event()
+        self._finished = threading.Event()
+        self._wake = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        """True if the job was (or is being) cancelled."""
+        return self._cancel_requested.is_set()
+
+    def cancel(self):
+        """Request cancellation; returns immediately."""
+        self._cancel_requested.set()
+        self._wake.set()
+
+    def _stop(self, reason: str):
+        """Terminate the process, killing it if it ignores the request."""
+        self.stop_reason = reason
+        if reason == 'cancelled':
+            logger.info(f"Cancelling ffmpeg (pid {self.process.pid})")
+        else:
+            logger.warning(f"Stopping ffmpeg (pid {self.process.pid}): {reason} "
+                           f"after {self.time_limit.elapsed:.0f}s")
+        if self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=TERMINATE_GRACE)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+    def _watch(self):
+        """Watchdog thread: enforce cancellation, the deadline and stall detection."""
+        while True:
+            self._wake.wait(WATCHDOG_INTERVAL)
+            if self._finished.is_set():
+                return
+            if self._cancel_requested.is_set():
+                self._stop('cancelled')
+                return
+            reason = self.time_limit.exceeded()
+            if reason:
+                self._stop(reason)
+                return
+
+    def run(self) -> subprocess.CompletedProcess:
+        """
+        Run ffmpeg to completion, streaming its progress to the callback.
+
+        Returns:
+            subprocess.CompletedProcess: Exit code and captured stderr
+
+        Raises:
+            ConversionCancelled: If the job was cancelled
+            subprocess.TimeoutExpired: If the job ran past its time limit or stalled
+        """
+        if self.group is not None:
+            self.group.add(self)
+        try:
+            if self.cancelled:
+                raise ConversionCancelled("Conversion cancelled")
+            return self._run()
+        finally:
+            if self.group is not None:
+                self.group.discard(self)
+
+    def _run(self) -> subprocess.CompletedProcess:
+        # Progress goes to stdout unless stdout carries the encoded output
+        output_stream = self.output_stream
+        progress_target = 'pipe:2' if output_stream is not None else 'pipe:1'
+        full_cmd = ffmpeg_base_args(self.cmd[0], progress_target) + list(self.cmd[1:])
+
+        with stage('spawn', self.timings):
+            self.process = process = subprocess.Popen(
+                full_cmd,
+                stdin=subprocess.PIPE if self.input_stream is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        self.time_limit.start()
+
+        threads = []
+        feed_errors: List[BaseException] = []
+        if self.input_stream is not None:
+            threads.append(threading.Thread(target=_feed_input,
+                                            args=(process.stdin, self.input_stream, feed_errors,
+                                                  self.time_limit),
+                                            daemon=True))
+
+        stderr_buffer = StderrBuffer()
+        if output_stream is not None:
+            threads.append(threading.Thread(target=_copy_output, args=(process.stdout, output_stream),
+                                            daemon=True))
+            progress_pipe = process.stderr
+        else:
+            threads.append(threading.Thread(target=_drain_stream, args=(process.stderr, stderr_buffer),
+                                            daemon=True))
+            progress_pipe = process.stdout
+
+        watchdog = threading.Thread(target=self._watch, daemon=True)
+        for thread in threads + [watchdog]:
+            thread.start()
+
+        parser = ProgressParser(self.duration)
+        progress_callback = self.progress_callback
+        try:
+            for line in _decode_lines(progress_pipe):
+                if output_stream is not None and not _PROGRESS_LINE.match(line.strip()):
+                    # Progress shares stderr with ffmpeg's log output
+                    stderr_buffer.append(line)
+                    continue
+                snapshot = parser.feed(line)
+                if snapshot is None:
+                    continue
+                self.time_limit.update(snapshot)
+                logger.debug(f"ffmpeg progress: out_time={snapshot.out_time:.2f}s speed={snapshot.speed}")
+                if progress_callback and not snapshot.finished and not self.cancelled:
+                    percent = snapshot.percent
+                    # Without a known duration fall back to an indeterminate midpoint
+                    progress_callback(snapshot.describe(), percent if percent is not None else 50)
+            process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            self._finished.set()
+            self._wake.set()
+            watchdog.join()
+            for thread in threads:
+                # A stopped job must not wait on an input stream that is itself stuck
+                thread.join(WATCHDOG_INTERVAL if self.stop_reason else None)
+
+        stderr = stderr_buffer.getvalue()
+        if self.stop_reason == 'cancelled':
+            raise ConversionCancelled("Conversion cancelled")
+        if self.stop_reason is not None:
+            raise subprocess.TimeoutExpired(full_cmd, self.time_limit.elapsed, stderr=stderr)
+        if feed_errors:
+            raise feed_errors[0]
+
+        return subprocess.CompletedProcess(full_cmd, process.returncode, '', stderr)
+
+
+def run_ffmpeg(cmd: List[str], duration: Optional[float] = None,
+               progress_callback=None, timeout: Optional[float] = None,
+               input_stream=None, output_stream: Optional[BinaryIO] = None,
+               group: Optional[JobGroup] = None,
+               timings: Optional[Dict[str, float]] = None) -> subprocess.CompletedProcess:
+    """
+    Run an ffmpeg command, streaming its progress to a callback.
+
+    Args:
+        cmd: FFmpeg command (executable first)
+        duration: Probed input duration in seconds, used for percentages and ETA
+        progress_callback: Optional callback(message, percent) for progress updates
+        timeout: Fixed time limit in seconds (default: derived from the duration
+            and the observed encode speed, see FFmpegJob)
+        input_stream: Optional bytes-like object or readable binary stream fed to
+            ffmpeg's stdin (the command should read from pipe:0)
+        output_stream: Optional writable binary stream receiving ffmpeg's stdout
+            (the command should write to pipe:1)
+        group: Optional JobGroup through which the run can be cancelled
+        timings: Optional dict receiving the seconds spent spawning ffmpeg ('spawn')
+
+    Returns:
+        subprocess.CompletedProcess: Exit code and captured stderr
+
+    Raises:
+        ConversionCancelled: If the run was cancelled through its group
+        subprocess.TimeoutExpired: If ffmpeg ran past its time limit or stalled
+    """
+    job = FFmpegJob(cmd, duration=duration, progress_callback=progress_callback, timeout=timeout,
+                    input_stream=input_stream, output_stream=output_stream, group=group,
+                    timings=timings)
+    return job.run()
@@ -0,0 +1,335 @@
+"""
+Watch-folder daemon: convert files as they are dropped into input directories.
+
+On Linux the directories are watched with inotify (through ctypes, no extra
+dependencies); elsewhere, or if inotify is unavailable, they are polled with
+os.scandir. Either way a new or changed file is only queued once its size and
+mtime have stayed the same for the settle time, so files that are still being
+copied in are never converted half-written. Stable files are converted by a
+worker pool sharing one SecureAudioConverter, and outputs go to the target
+directory. Conversions are recorded in the output directory's manifest, so
+after a restart files whose outputs are up to date are not converted again,
+and a file that changed overwrites its earlier outputs.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import WATCH_HANDLED_MAX
+from output_manifest import OutputManifest
+
+logger = logging.getLogger(__name__)
+
+# inotify event flags (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+# struct inotify_event header: wd, mask, cookie, len
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _scan(directories: List[Path]) -> Set[Path]:
+    """List the regular files directly inside the watched directories."""
+    files = set()
+    for directory in directories:
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False):
+                        files.add(Path(entry.path))
+        except OSError as e:
+            logger.warning(f"Cannot scan {directory}: {e}")
+    return files
+
+
+class PollingBackend:
+    """Change source that rescans the directories at a fixed interval."""
+
+    name = 'polling'
+
+    def __init__(self, directories: List[Path], interval: float):
+        self.directories = directories
+        self.interval = interval
+        self._next_scan = 0.0
+
+    def wait(self, timeout: float) -> Set[Path]:
+        """Return candidate files, waiting at most timeout seconds."""
+        now = time.monotonic()
+        if now < self._next_scan:
+            time.sleep(min(timeout, self._next_scan - now))
+            if time.monotonic() < self._next_scan:
+                return set()
+        self._next_scan = time.monotonic() + self.interval
+        return _scan(self.directories)
+
+    def close(self):
+        pass
+
+
+class InotifyBackend:
+    """Change source fed by Linux inotify events."""
+
+    name = 'inotify'
+
+    def __init__(self, directories: List[Path]):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._libc = libc
+        self.directories = directories
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches: Dict[int, Path] = {}
+        try:
+            for directory in directories:
+                wd = libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+                if wd < 0:
+                    errno = ctypes.get_errno()
+                    raise OSError(errno, f"inotify_add_watch failed for {directory}: {os.strerror(errno)}")
+                self._watches[wd] = directory
+        except Exception:
+            os.close(self._fd)
+            raise
+
+    def wait(self, timeout: float) -> Set[Path]:
+        """Return files named in inotify events, waiting at most timeout seconds."""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped: fall back to a full scan
+                logger.warning("inotify queue overflowed; rescanning watched directories")
+                return _scan(self.directories)
+            if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                directory = self._watches.pop(wd, None)
+                if directory is not None:
+                    logger.warning(f"Watched directory is gone: {directory}")
+                continue
+            directory = self._watches.get(wd)
+            if directory is not None and name:
+                changed.add(directory / os.fsdecode(name))
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def create_backend(directories: List[Path], poll_interval: float):
+    """Use inotify where available, falling back to scandir polling."""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyBackend(directories)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify unavailable ({e}); falling back to polling")
+    return PollingBackend(directories, poll_interval)
+
+
+class FolderWatcher:
+    """Long-running daemon that converts files dropped into watched directories."""
+
+    def __init__(self, converter, directories: List[str], output_dir: str, output_formats: List[str],
+                 bitrate: str = '192k', quality: str = 'high', max_workers: int = 1,
+                 settle_time: float = 5.0, poll_interval: float = 2.0,
+                 manifest: Optional[OutputManifest] = None, max_handled: int = WATCH_HANDLED_MAX):
+        """
+        Args:
+            converter: SecureAudioConverter shared by all workers
+            directories: Input directories to watch (not recursive)
+            output_dir: Directory receiving converted files
+            output_formats: Output formats (e.g. ['.mp3'] or ['.mp3', '.wav'])
+            bitrate: Audio bitrate
+            quality: Conversion quality
+            max_workers: Number of files converted in parallel
+            settle_time: Seconds a file's size and mtime must stay unchanged before it is converted
+            poll_interval: Rescan interval when inotify is not available
+            manifest: Index of up-to-date outputs (default: the manifest kept in output_dir)
+            max_handled: Converted files remembered in memory to ignore repeat events
+        """
+        self.converter = converter
+        self.directories = [Path(directory).resolve() for directory in directories]
+        self.output_dir = Path(output_dir).resolve()
+        self.output_formats = output_formats
+        self.bitrate = bitrate
+        self.quality = quality
+        self.max_workers = max_workers
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+
+        for directory in self.directories:
+            if not directory.is_dir():
+                raise ValueError(f"Watch directory does not exist: {directory}")
+            if directory == self.output_dir:
+                raise ValueError("The output directory must differ from the watched directories")
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest = manifest or OutputManifest.for_output_dir(str(self.output_dir))
+        self._manifest_params = OutputManifest.make_params(
+            output_formats, str(self.output_dir), bitrate, quality)
+        self.max_handled = max_handled
+
+        self._stop = threading.Event()
+        # Files waiting to settle: path -> (size, mtime_ns, unchanged since)
+        self._pending: Dict[Path, Tuple[int, int, float]] = {}
+        # Files already handed to a worker: path -> (size, mtime_ns), least recently handled first
+        self._handled: 'OrderedDict[Path, Tuple[int, int]]' = OrderedDict()
+        self._in_flight: Set[Path] = set()
+        self._lock = threading.Lock()
+
+    def stop(self):
+        """Ask the daemon to stop; running conversions are cancelled."""
+        self._stop.set()
+        self.converter.cancel()
+
+    def _accepts(self, path: Path) -> bool:
+        """Skip hidden/temporary files and unsupported extensions."""
+        if path.name.startswith('.') or path.name.endswith(('~', '.tmp', '.part')):
+            return False
+        return path.suffix.lower() in self.converter.ALLOWED_INPUT_EXTENSIONS
+
+    def _outputs_current(self, path: Path) -> bool:
+        """True if the manifest records up-to-date outputs of the file (e.g. after a restart)."""
+        entry = self.manifest.get(path, self._manifest_params)
+        return entry is not None and self.manifest.is_current(path, self._manifest_params, entry)
+
+    def _observe(self, path: Path, now: float):
+        """Record a candidate file, restarting its settle timer if it changed."""
+        if not self._accepts(path):
+            return
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self._pending.pop(path, None)
+            with self._lock:
+                self._handled.pop(path, None)
+            return
+        signature = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if path in self._in_flight or self._handled.get(path) == signature:
+                return
+        previous = self._pending.get(path)
+        if previous is None or previous[:2] != signature:
+            self._pending[path] = (*signature, now)
+
+    def _collect_stable(self, now: float) -> List[Tuple[Path, Tuple[int, int]]]:
+        """Re-check pending files and return the ones that have settled, with their (size, mtime_ns)."""
+        ready = []
+        for path, (size, mtime_ns, since) in list(self._pending.items()):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self._pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+            elif now - since >= self.settle_time and size > 0:
+                del self._pending[path]
+                ready.append((path, (size, mtime_ns)))
+        return ready
+
+    def _remember(self, path: Path, signature: Tuple[int, int]):
+        """Mark a file as handled, forgetting the oldest files beyond max_handled (call with the lock held)."""
+        self._handled[path] = signature
+        self._handled.move_to_end(path)
+        while len(self._handled) > self.max_handled:
+            self._handled.popitem(last=False)
+
+    def _convert(self, path: Path, signature: Tuple[int, int]):
+        """Worker: convert one settled file."""
+        if self._stop.is_set():
+            # Queued before stop(): leave it for the next run
+            with self._lock:
+                self._in_flight.discard(path)
+            return
+        try:
+            output_format = self.output_formats[0] if len(self.output_formats) == 1 else self.output_formats
+            result = self.converter.convert_batch([str(path)], output_format, str(self.output_dir),
+                                                  self.bitrate, self.quality, max_workers=1,
+                                                  manifest=self.manifest)[0]
+            if result.skipped:
+                logger.info(f"Watch: {path.name} already converted, skipping")
+            elif result:
+                logger.info(f"Watch: converted {path.name}")
+            elif self._stop.is_set():
+                logger.info(f"Watch: cancelled {path.name}")
+            else:
+                logger.error(f"Watch: conversion failed for {path.name}")
+        except Exception as e:
+            logger.error(f"Watch: error converting {path.name}: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(path)
+                # Failed files are not retried until they change
+                self._remember(path, signature)
+
+    def run(self):
+        """Watch until stop() is called (or KeyboardInterrupt)."""
+        backend = create_backend(self.directories, self.poll_interval)
+        logger.info(f"Watching {', '.join(str(d) for d in self.directories)} ({backend.name}), "
+                    f"writing {', '.join(self.output_formats)} to {self.output_dir}")
+
+        # Files already present are handled like new arrivals (unless converted before)
+        now = time.monotonic()
+        for path in _scan(self.directories):
+            self._observe(path, now)
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="watch")
+        try:
+            while not self._stop.is_set():
+                # Wake up often enough to notice files settling
+                timeout = min(self.settle_time, 0.5) if self._pending else self.poll_interval
+                changed = backend.wait(timeout)
+                now = time.monotonic()
+                for path in changed:
+                    self._observe(path, now)
+
+                for path, signature in self._collect_stable(now):
+                    if self._outputs_current(path):
+                        logger.info(f"Watch: {path.name} already converted, skipping")
+                        with self._lock:
+                            self._remember(path, signature)
+                        continue
+                    with self._lock:
+                        self._in_flight.add(path)
+                    logger.info(f"Watch: queueing {path.name}")
+                    executor.submit(self._convert, path, signature)
+        except KeyboardInterrupt:
+            logger.info("Watch interrupted; stopping")
+            self.stop()
+        finally:
+            backend.close()
+            # Files still waiting for a worker are dropped; running ones were cancelled by stop()
+            executor.shutdown(wait=True, cancel_futures=True)
+        logger.info("Watch stopped")
@@ -21,6 +21,7 @@ class ConverterGUI:
     def __init__(self, root):
         self.root = root
         self.converter = None
+        self.stop_requested = False
         self.setup_window()
         self.setup_variables()
         self.setup_widgets()
@@ -245,6 +246,8 @@ class ConverterGUI:
             return
         
         # Disable UI during conversion
+        self.stop_requested = False
+        self.converter.reset_cancel()
         self.convert_btn.config(state="disabled")
         self.stop_btn.config(state="normal")
         
@@ -276,6 +279,8 @@ class ConverterGUI:
                 
                 if success:
                     self.progress_queue.put(("complete", "Conversion completed successfully!", 100))
+                elif self.stop_requested:
+                    self.progress_queue.put(("warning", "Conversion cancelled", 0))
                 else:
                     self.progress_queue.put(("error", "Conversion failed", 0))
             else:
@@ -289,11 +294,13 @@ class ConverterGUI:
                     progress_callback
                 )
                 
-                successful = sum(results)
+                successful = sum(1 for result in results if result)
                 total = len(results)
                 
                 if successful == total:
                     self.progress_queue.put(("complete", f"All {total} files converted successfully!", 100))
+                elif self.stop_requested:
+                    self.progress_queue.put(("warning", f"Cancelled: {successful}/{total} files converted", 100))
                 else:
                     self.progress_queue.put(("warning", f"{successful}/{total} files converted", 100))
         
@@ -304,9 +311,11 @@ class ConverterGUI:
     
     def stop_conversion(self):
         """Stop the conversion process."""
-        # Note: This is a simplified implementation
-        # In a real application, you'd need to properly terminate the ffmpeg process
-        self.log_info("Stop requested - conversion will finish current file")
+        self.stop_requested = True
+        if self.converter:
+            # Terminates running ffmpeg processes and skips files still queued
+            self.converter.cancel()
+        self.log_info("Stop requested - cancelling running conversions")
         self.stop_btn.config(state="disabled")
     
     def check_progress_queue(self):
@@ -0,0 +1,213 @@
+"""
+Durable SQLite-backed job queue for batch conversions.
+
+Every file of a batch is recorded as a job with its parameters, state, input
+hash, outputs, timings and error. A batch is identified by a hash of its file
+list and parameters, so re-running the same batch after a crash or restart
+resumes it: finished files are skipped and interrupted ones are picked up
+again. Jobs are claimed inside an IMMEDIATE transaction, so several converter
+processes on the same host can drain one queue without duplicating work.
+
+A claimed job is owned by its process until it finishes. Owners refresh a
+heartbeat while they work; a running job whose owner stopped heartbeating
+(or whose owner process no longer exists on this host) is returned to the
+queue.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from process_owner import current_owner, owner_alive
+
+logger = logging.getLogger(__name__)
+
+# Job states
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Job(NamedTuple):
+    """One claimed job."""
+    id: int
+    batch_id: str
+    position: int          # Index of the file in the batch's input list
+    input_path: str
+    params: dict           # formats, output_dir, bitrate, quality
+    attempts: int
+
+
+class JobStore:
+    """Persistent queue of per-file conversion jobs."""
+
+    def __init__(self, db_path: str, lease_timeout: float = 120, max_attempts: int = 3):
+        self.db_path = Path(db_path).expanduser()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.owner = f"{current_owner()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        # Autocommit mode: transactions are opened explicitly where they matter
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " batch_id TEXT NOT NULL,"
+                " position INTEGER NOT NULL,"
+                " input_path TEXT NOT NULL,"
+                " params TEXT NOT NULL,"
+                " state TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " owner TEXT,"
+                " heartbeat_at REAL,"
+                " input_hash TEXT,"
+                " output_paths TEXT,"
+                " error TEXT,"
+                " created_at REAL NOT NULL,"
+                " started_at REAL,"
+                " finished_at REAL,"
+                " UNIQUE (batch_id, position))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (batch_id, state, position)")
+
+    @staticmethod
+    def make_batch_id(input_files: List[str], params: dict) -> str:
+        """Identify a batch by its (resolved) input files and conversion parameters."""
+        payload = {
+            'inputs': [str(Path(path).resolve()) for path in input_files],
+            'params': params,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+    def enqueue(self, batch_id: str, input_files: List[str], params: dict):
+        """
+        Record the jobs of a batch (idempotent).
+
+        Jobs that already exist keep their state; failed jobs that still have
+        attempts left are queued again so a resumed batch retries them.
+        """
+        now = time.time()
+        params_json = json.dumps(params, sort_keys=True)
+        rows = [(batch_id, position, str(Path(path).resolve()), params_json, PENDING, now)
+                for position, path in enumerate(input_files)]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO jobs (batch_id, position, input_path, params, state, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)", rows)
+                self._conn.execute(
+                    "UPDATE jobs SET state = ?, owner = NULL WHERE batch_id = ? AND state = ? AND attempts < ?",
+                    (PENDING, batch_id, FAILED, self.max_attempts))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _recover_abandoned(self, batch_id: str, now: float):
+        """Return running jobs of dead or silent owners to the queue (inside a transaction)."""
+        rows = self._conn.execute(
+            "SELECT id, owner, heartbeat_at FROM jobs WHERE batch_id = ? AND state = ?",
+            (batch_id, RUNNING)).fetchall()
+        for job_id, owner, heartbeat_at in rows:
+            expired = heartbeat_at is None or now - heartbeat_at > self.lease_timeout
+            if expired or not owner or not owner_alive(owner):
+                logger.warning(f"Reclaiming job {job_id} abandoned by {owner}")
+                self._conn.execute("UPDATE jobs SET state = ?, owner = NULL WHERE id = ?",
+                                   (PENDING, job_id))
+
+    def claim(self, batch_id: str) -> Optional[Job]:
+        """Atomically claim the next pending job of a batch, or return None when none is left."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._recover_abandoned(batch_id, now)
+                row = self._conn.execute(
+                    "SELECT id, position, input_path, params, attempts FROM jobs"
+                    " WHERE batch_id = ? AND state = ? ORDER BY position LIMIT 1",
+                    (batch_id, PENDING)).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET state = ?, owner = ?, heartbeat_at = ?, started_at = ?,"
+                        " finished_at = NULL, error = NULL, attempts = attempts + 1 WHERE id = ?",
+                        (RUNNING, self.owner, now, now, row[0]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job_id, position, input_path, params, attempts = row
+        return Job(job_id, batch_id, position, input_path, json.loads(params), attempts + 1)
+
+    def heartbeat(self):
+        """Refresh the lease on every job this store currently owns."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND state = ?",
+                               (time.time(), self.owner, RUNNING))
+
+    def complete(self, job_id: int, success: bool, input_hash: Optional[str] = None,
+                 output_paths: Optional[List[str]] = None, error: Optional[str] = None):
+        """Record the result of a claimed job."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, input_hash = ?, output_paths = ?, error = ?,"
+                " finished_at = ? WHERE id = ? AND owner = ?",
+                (DONE if success else FAILED, input_hash,
+                 json.dumps(output_paths) if output_paths is not None else None,
+                 None if success else error, time.time(), job_id, self.owner))
+
+    def release(self, job_id: int):
+        """Return a claimed job to the queue without counting the attempt (e.g. on cancel)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, attempts = MAX(attempts - 1, 0)"
+                " WHERE id = ? AND owner = ?",
+                (PENDING, job_id, self.owner))
+
+    def results(self, batch_id: str) -> List[bool]:
+        """Success status of every job in a batch, in input order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state FROM jobs WHERE batch_id = ? ORDER BY position", (batch_id,)).fetchall()
+        return [state == DONE for state, in rows]
+
+    def counts(self, batch_id: str) -> Dict[str, int]:
+        """Number of jobs in each state for a batch."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) FROM jobs WHERE batch_id = ? GROUP BY state", (batch_id,)).fetchall()
+        return dict(rows)
+
+    def jobs(self, batch_id: str) -> List[dict]:
+        """Full records of a batch's jobs, in input order ('success' is True for jobs that succeeded)."""
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE batch_id = ? ORDER BY position", (batch_id,))
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        records = []
+        for row in rows:
+            record = dict(zip(columns, row))
+            record['params'] = json.loads(record['params'])
+            record['success'] = record['state'] == DONE
+            if record['output_paths'] is not None:
+                record['output_paths'] = json.loads(record['output_paths'])
+            records.append(record)
+        return records
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
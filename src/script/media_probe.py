@@ -0,0 +1,201 @@
+"""
+Media inspection helpers backed by ffprobe.
+
+Probe results are summarised into a compact MediaInfo record and can be kept
+in a persistent ProbeCache, keyed by path + size + mtime (and by content hash
+when it is known), so repeated probes of the same file skip ffprobe entirely.
+"""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def find_ffprobe(ffmpeg_path: str) -> Optional[str]:
+    """Find the ffprobe executable, preferring the one next to ffmpeg."""
+    ffmpeg = Path(ffmpeg_path)
+    sibling = ffmpeg.with_name('ffprobe' + ffmpeg.suffix)
+    if sibling.exists():
+        return str(sibling)
+    return shutil.which('ffprobe')
+
+
+def ffprobe_command(ffprobe_path: str, file_path: Path) -> List[str]:
+    """Build the ffprobe command that prints a file's format and streams as JSON."""
+    return [
+        ffprobe_path,
+        '-v', 'error',
+        '-print_format', 'json',
+        '-show_format',
+        '-show_streams',
+        str(file_path),
+    ]
+
+
+def run_ffprobe(ffprobe_path: str, file_path: Path, timeout: float = 30) -> Optional[dict]:
+    """Run ffprobe on a file and return its parsed JSON output."""
+    cmd = ffprobe_command(ffprobe_path, file_path)
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, check=False)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"ffprobe failed for {file_path}: {e}")
+        return None
+
+    if result.returncode != 0:
+        logger.warning(f"ffprobe error (code {result.returncode}) for {file_path}: {result.stderr.strip()}")
+        return None
+
+    try:
+        return json.loads(result.stdout)
+    except json.JSONDecodeError as e:
+        logger.warning(f"Could not parse ffprobe output for {file_path}: {e}")
+        return None
+
+
+def parse_duration(data: Optional[dict]) -> Optional[float]:
+    """Extract the container duration in seconds from ffprobe output."""
+    if not data:
+        return None
+    try:
+        return float(data['format']['duration'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def first_audio_stream(data: Optional[dict]) -> Optional[dict]:
+    """Return the first audio stream from ffprobe output, if any."""
+    if not data:
+        return None
+    for stream in data.get('streams', []):
+        if stream.get('codec_type') == 'audio':
+            return stream
+    return None
+
+
+def _to_int(value) -> Optional[int]:
+    """Convert an ffprobe numeric string to int, or None."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class MediaInfo(NamedTuple):
+    """Compact summary of a media file's container and first audio stream."""
+    duration: Optional[float]
+    format_name: Optional[str]
+    stream_count: int
+    audio_stream_count: int
+    audio_codec: Optional[str]
+    sample_rate: Optional[int]
+    channels: Optional[int]
+    channel_layout: Optional[str]
+    audio_bitrate: Optional[int]
+
+    @property
+    def has_audio(self) -> bool:
+        """True if the file contains at least one audio stream."""
+        return self.audio_stream_count > 0
+
+    @classmethod
+    def from_ffprobe(cls, data: dict) -> 'MediaInfo':
+        """Build a MediaInfo record from ffprobe's JSON output."""
+        streams = data.get('streams', [])
+        audio = first_audio_stream(data) or {}
+        return cls(
+            duration=parse_duration(data),
+            format_name=data.get('format', {}).get('format_name'),
+            stream_count=len(streams),
+            audio_stream_count=sum(1 for stream in streams if stream.get('codec_type') == 'audio'),
+            audio_codec=audio.get('codec_name'),
+            sample_rate=_to_int(audio.get('sample_rate')),
+            channels=_to_int(audio.get('channels')),
+            channel_layout=audio.get('channel_layout'),
+            audio_bitrate=_to_int(audio.get('bit_rate')),
+        )
+
+    def to_json(self) -> str:
+        """Serialize the record for the probe cache."""
+        return json.dumps(self._asdict())
+
+    @classmethod
+    def from_json(cls, text: str) -> 'MediaInfo':
+        """Restore a record serialized with to_json."""
+        return cls(**json.loads(text))
+
+
+def probe_media(ffprobe_path: str, file_path: Path) -> Optional[MediaInfo]:
+    """Probe a media file, returning None if ffprobe cannot read it."""
+    data = run_ffprobe(ffprobe_path, file_path)
+    if data is None:
+        return None
+    return MediaInfo.from_ffprobe(data)
+
+
+class ProbeCache:
+    """Persistent SQLite-backed cache of MediaInfo records."""
+
+    def __init__(self, db_path: str, max_entries: int = 10000):
+        self.db_path = Path(db_path).expanduser()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS probes ("
+                " identity TEXT PRIMARY KEY,"
+                " file_hash TEXT,"
+                " info TEXT NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS probes_hash ON probes (file_hash)")
+
+    @staticmethod
+    def _identity(path: Path, stat: os.stat_result) -> str:
+        """Cache identity of a file: resolved path, size and mtime."""
+        return f"{path}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def get(self, path: Path, file_hash: Optional[str] = None) -> Optional[MediaInfo]:
+        """Look up a file by identity, falling back to its content hash."""
+        identity = self._identity(path, path.stat())
+        with self._lock:
+            row = self._conn.execute("SELECT info FROM probes WHERE identity = ?", (identity,)).fetchone()
+            if row is None and file_hash:
+                row = self._conn.execute(
+                    "SELECT info FROM probes WHERE file_hash = ? LIMIT 1", (file_hash,)).fetchone()
+        if row is None:
+            return None
+        return MediaInfo.from_json(row[0])
+
+    def put(self, path: Path, info: MediaInfo, file_hash: Optional[str] = None):
+        """Store (or refresh) the probe result for a file."""
+        identity = self._identity(path, path.stat())
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO probes (identity, file_hash, info, last_used) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(identity) DO UPDATE SET"
+                " file_hash = COALESCE(excluded.file_hash, probes.file_hash),"
+                " info = excluded.info, last_used = excluded.last_used",
+                (identity, file_hash, info.to_json(), time.time()),
+            )
+            # Keep the cache bounded, dropping the least recently stored entries
+            self._conn.execute(
+                "DELETE FROM probes WHERE identity IN ("
+                " SELECT identity FROM probes ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,338 @@
+"""
+In-process metrics registry for conversion stages.
+
+Counters, gauges and histograms keyed by label values, exportable in the
+Prometheus text exposition format or as JSON. The converter records every
+stage of a conversion (validation, hashing, output path resolution, ffmpeg
+spawn, encode, output verification) into the process-wide REGISTRY through
+stage():
+
+    with stage('hashing') as record:
+        digest = hash_file(path)
+        record.bytes = path.stat().st_size
+
+which observes the stage duration, adds its byte count, tracks how many
+stages are in flight and counts the ones that raised.
+"""
+
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets (seconds) spanning quick stages up to long encodes
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0, 120.0, 300.0, 600.0, math.inf)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class: one metric family with a value per label set."""
+
+    type_name = ''
+
+    def __init__(self, name: str, help_text: str, lock: threading.Lock):
+        self.name = name
+        self.help = help_text
+        self._lock = lock
+        self._values: Dict[LabelKey, float] = {}
+
+    def _samples(self) -> List[Tuple[str, LabelKey, float]]:
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            samples = [{'labels': dict(key), 'value': value} for key, value in sorted(self._values.items())]
+        return {'type': self.type_name, 'help': self.help, 'samples': samples}
+
+
+class Counter(_Metric):
+    """Monotonically increasing total."""
+
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down (e.g. work in flight)."""
+
+    type_name = 'gauge'
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed cumulative buckets."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help_text: str, lock: threading.Lock, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, lock)
+        self.buckets = tuple(sorted(set(buckets) | {math.inf}))
+        # label set -> (per-bucket counts, sum, count)
+        self._series: Dict[LabelKey, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts, total, count = self._series.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._series[key] = (counts, total + value, count + 1)
+
+    def _samples(self) -> List[Tuple[str, LabelKey, float]]:
+        samples = []
+        with self._lock:
+            series = sorted((key, (list(counts), total, count))
+                            for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', key + (('le', _format_value(bound)),), cumulative))
+            samples.append((f'{self.name}_sum', key, total))
+            samples.append((f'{self.name}_count', key, count))
+        return samples
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            series = sorted((key, (list(counts), total, count))
+                            for key, (counts, total, count) in self._series.items())
+        samples = []
+        for key, (counts, total, count) in series:
+            cumulative, buckets = 0, {}
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                buckets[_format_value(bound)] = cumulative
+            samples.append({'labels': dict(key), 'count': count, 'sum': total,
+                            'mean': total / count if count else None, 'buckets': buckets})
+        return {'type': self.type_name, 'help': self.help, 'samples': samples}
+
+
+class MetricsRegistry:
+    """Named collection of metrics (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get_or_create(self, cls, name: str, help_text: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, threading.Lock(), **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            for name, key, value in metric._samples():
+                lines.append(f'{name}{_format_labels(key)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self) -> dict:
+        """All metrics as plain data (for JSON dumps)."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return {metric.name: metric.to_dict() for metric in metrics}
+
+    def reset(self):
+        """Drop every recorded value (metric definitions are kept)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            with metric._lock:
+                metric._values.clear()
+                if isinstance(metric, Histogram):
+                    metric._series.clear()
+
+
+# Process-wide registry used by the converter
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'converter_stage_duration_seconds', 'Time spent in each conversion stage')
+STAGE_BYTES = REGISTRY.counter(
+    'converter_stage_bytes_total', 'Bytes processed by each conversion stage')
+STAGE_IN_PROGRESS = REGISTRY.gauge(
+    'converter_stage_in_progress', 'Conversion stages currently running')
+STAGE_ERRORS = REGISTRY.counter(
+    'converter_stage_errors_total', 'Conversion stages that raised an error')
+CONVERSIONS = REGISTRY.counter(
+    'converter_conversions_total', 'Finished conversions by method and result')
+CONVERSION_SECONDS = REGISTRY.histogram(
+    'converter_conversion_duration_seconds', 'End-to-end conversion time by method')
+CONVERSIONS_IN_PROGRESS = REGISTRY.gauge(
+    'converter_conversions_in_progress', 'Conversions currently running by method')
+
+
+class StageRecord:
+    """Mutable record yielded by stage(); set bytes to count the data the stage handled."""
+
+    __slots__ = ('name', 'bytes')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.bytes = 0
+
+
+@contextmanager
+def stage(name: str, timings: Optional[Dict[str, float]] = None) -> Iterator[StageRecord]:
+    """
+    Time one conversion stage and record its byte count (see module docstring).
+
+    Args:
+        name: Stage name (the 'stage' label)
+        timings: Optional per-call dict that also receives the stage's seconds
+            (added up when the stage runs several times)
+    """
+    record = StageRecord(name)
+    STAGE_IN_PROGRESS.inc(stage=name)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        STAGE_IN_PROGRESS.dec(stage=name)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+        if record.bytes:
+            STAGE_BYTES.inc(record.bytes, stage=name)
+
+
+class ConversionTimer:
+    """Tracks one conversion call: in-flight gauge, duration and result counters."""
+
+    def __init__(self, method: str):
+        self.method = method
+        self.result = 'failed'
+        self._start = time.perf_counter()
+        CONVERSIONS_IN_PROGRESS.inc(method=method)
+
+    def finish(self):
+        CONVERSIONS_IN_PROGRESS.dec(method=self.method)
+        CONVERSION_SECONDS.observe(time.perf_counter() - self._start, method=self.method)
+        CONVERSIONS.inc(method=self.method, result=self.result)
+
+
+def _write_atomic(path: str, text: str):
+    """Replace a file's contents atomically (readers never see a partial file)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_name, path)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+
+def write_prometheus_file(path: str, registry: Optional[MetricsRegistry] = None):
+    """Write the registry in Prometheus text format (e.g. for the node_exporter textfile collector)."""
+    _write_atomic(path, (registry or REGISTRY).render_prometheus())
+
+
+def write_json_file(path: str, registry: Optional[MetricsRegistry] = None):
+    """Dump the registry as JSON."""
+    _write_atomic(path, json.dumps((registry or REGISTRY).to_dict(), indent=2) + '\n')
+
+
+def start_periodic_export(path: str, interval: float = 15.0,
+                          registry: Optional[MetricsRegistry] = None) -> threading.Event:
+    """
+    Rewrite a Prometheus text file every interval seconds from a daemon thread.
+
+    A failed periodic write (full disk, missing directory, ...) is logged and
+    retried at the next interval; only the first write raises.
+
+    Returns:
+        threading.Event: Set it to stop the exporter (a final write is made)
+    """
+    stop = threading.Event()
+
+    def write():
+        try:
+            write_prometheus_file(path, registry)
+        except OSError as e:
+            logger.error(f"Failed to write metrics to {path}: {e}")
+
+    def export():
+        while not stop.wait(interval):
+            write()
+        write()
+
+    write_prometheus_file(path, registry)
+    threading.Thread(target=export, name='metrics-export', daemon=True).start()
+    return stop
@@ -0,0 +1,175 @@
+"""
+Manifest of converted outputs for incremental batches.
+
+The manifest lives in the output directory and maps each input (resolved
+path) and its conversion parameters to the identity the input had when it
+was converted (size, mtime and, when known, content hash) and to the outputs
+that were written. An incremental batch consults it before converting a
+file: if the input's size and mtime are unchanged and the recorded outputs
+are still on disk with their recorded sizes, the file is skipped after a
+handful of stat() calls and one primary-key lookup, without hashing,
+probing or starting ffmpeg.
+
+When an input did change (or is converted with other parameters), its
+recorded outputs are overwritten in place rather than written next to them
+under a new _1, _2, ... name.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = '.converter-manifest.sqlite3'
+
+
+class ManifestEntry(NamedTuple):
+    """What a file looked like when it was last converted, and what it produced."""
+    input_size: int
+    input_mtime_ns: int
+    input_hash: Optional[str]
+    outputs: Dict[str, str]        # Output format -> path
+    output_sizes: Dict[str, int]   # Output path -> size in bytes
+    converted_at: float
+
+
+class OutputManifest:
+    """Persistent SQLite-backed index of up-to-date outputs."""
+
+    def __init__(self, db_path: str, check_hash: bool = False):
+        """
+        Open (or create) a manifest.
+
+        Args:
+            db_path: Manifest database file
+            check_hash: When an input's mtime changed but its size did not, hash it
+                and treat it as unchanged if the content hash still matches
+                (e.g. after a copy or touch that did not preserve timestamps)
+        """
+        self.db_path = Path(db_path).expanduser()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.check_hash = check_hash
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            # One small commit per converted file; WAL keeps those cheap
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS outputs ("
+                " input_path TEXT NOT NULL,"
+                " params TEXT NOT NULL,"
+                " input_size INTEGER NOT NULL,"
+                " input_mtime_ns INTEGER NOT NULL,"
+                " input_hash TEXT,"
+                " outputs TEXT NOT NULL,"
+                " output_sizes TEXT NOT NULL,"
+                " converted_at REAL NOT NULL,"
+                " PRIMARY KEY (input_path, params))"
+            )
+
+    @classmethod
+    def for_output_dir(cls, output_dir: str, check_hash: bool = False) -> 'OutputManifest':
+        """Open the manifest kept in an output directory."""
+        return cls(os.path.join(output_dir, MANIFEST_FILENAME), check_hash)
+
+    @staticmethod
+    def make_params(formats: List[str], output_dir: Optional[str], bitrate: str, quality: str) -> str:
+        """Canonical form of the parameters an output depends on."""
+        return json.dumps({
+            'formats': sorted(formats),
+            'output_dir': str(Path(output_dir).resolve()) if output_dir else None,
+            'bitrate': bitrate,
+            'quality': quality,
+        }, sort_keys=True)
+
+    def get(self, input_path: Path, params: str) -> Optional[ManifestEntry]:
+        """Return the recorded entry for an input and parameters, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT input_size, input_mtime_ns, input_hash, outputs, output_sizes, converted_at"
+                " FROM outputs WHERE input_path = ? AND params = ?",
+                (str(input_path), params)).fetchone()
+        if row is None:
+            return None
+        return ManifestEntry(row[0], row[1], row[2], json.loads(row[3]), json.loads(row[4]), row[5])
+
+    def outputs_of(self, input_path: Path) -> Dict[str, str]:
+        """Latest recorded output (format -> path) of an input, whatever parameters produced it."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT outputs FROM outputs WHERE input_path = ? ORDER BY converted_at",
+                (str(input_path),)).fetchall()
+        outputs = {}
+        for (row,) in rows:
+            outputs.update(json.loads(row))
+        return outputs
+
+    def is_current(self, input_path: Path, params: str, entry: ManifestEntry,
+                   hash_file: Optional[Callable[[Path], str]] = None) -> bool:
+        """
+        Check whether an entry still describes the input and its outputs.
+
+        Args:
+            input_path: Resolved input path
+            params: Parameters from make_params()
+            entry: Entry returned by get()
+            hash_file: Function computing the input's content hash, used when
+                check_hash is enabled and only the mtime differs
+
+        Returns:
+            bool: True if the recorded outputs are up to date
+        """
+        try:
+            stat = input_path.stat()
+            for path, size in entry.output_sizes.items():
+                if os.stat(path).st_size != size:
+                    return False
+        except OSError:
+            return False
+        if stat.st_size != entry.input_size:
+            return False
+        if stat.st_mtime_ns == entry.input_mtime_ns:
+            return True
+        if not (self.check_hash and hash_file and entry.input_hash):
+            return False
+        if hash_file(input_path) != entry.input_hash:
+            return False
+        # Same content under a new timestamp: remember it so the next run stays O(1)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outputs SET input_mtime_ns = ? WHERE input_path = ? AND params = ?",
+                (stat.st_mtime_ns, str(input_path), params))
+        return True
+
+    def record(self, input_path: Path, params: str, input_stat: os.stat_result,
+               input_hash: Optional[str], outputs: Dict[str, str]):
+        """
+        Record the outputs of a successful conversion.
+
+        Args:
+            input_path: Resolved input path
+            params: Parameters from make_params()
+            input_stat: stat() of the input taken before it was converted (so a
+                file modified during the conversion is converted again next time)
+            input_hash: Content hash of the input, if known
+            outputs: Output format -> path of every output written
+        """
+        output_sizes = {path: os.stat(path).st_size for path in outputs.values()}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO outputs (input_path, params, input_size, input_mtime_ns,"
+                " input_hash, outputs, output_sizes, converted_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(input_path), params, input_stat.st_size, input_stat.st_mtime_ns, input_hash,
+                 json.dumps(outputs), json.dumps(output_sizes), time.time()))
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,307 @@
+"""
+Collision-free output file naming.
+
+OutputNamer turns an input path into an output path from a naming template
+and claims it atomically: the name is created with O_CREAT | O_EXCL as a
+small placeholder, which the finished output later replaces (os.replace).
+Exclusive creation is what makes claims safe between threads and between
+processes writing into the same directory. Whoever creates the file owns
+the name, and everyone else moves on to the next candidate.
+
+Finding the next free name does not stat one file per existing duplicate.
+The first claim in a directory reads it with a single scandir() into an
+in-memory index (names present, and the highest _N suffix used for each
+base name). Later claims check the index and continue from the remembered
+suffix, so a claim costs one set lookup and one open() however many files
+or duplicates the directory holds. The index is only a hint. A name another
+process created after the scan is caught by O_EXCL and skipped. Only the
+most recently used directories are indexed, so a long-lived process that
+writes into many directories (e.g. one workspace per web session) does not
+keep an index of each forever.
+
+A placeholder records the host and process that claimed it. If that process
+died before finishing (a crash or kill), the placeholder is stale and the
+name is reclaimed, so a resumed batch writes to the same name as the
+interrupted one instead of moving on to a _1 name.
+
+Templates are str.format() strings rendered to a path relative to the
+output directory (the format extension is appended):
+
+    {stem}        input file name without its extension
+    {hash}        first 12 hex digits of the SHA-256 of the resolved input path
+    {timestamp}   claim time, YYYYmmdd-HHMMSS
+    {reldir}      input directory relative to the source root (mirrors the source tree);
+                  empty for inputs outside the root, which go directly into the output directory
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from process_owner import current_owner, owner_alive
+
+logger = logging.getLogger(__name__)
+
+# Named templates accepted wherever a template is expected
+NAMING_TEMPLATES = {
+    'default': '{stem}',
+    'hash': '{stem}-{hash}',
+    'timestamp': '{stem}-{timestamp}',
+    'mirror': '{reldir}/{stem}',
+}
+
+TEMPLATE_FIELDS = {'stem', 'hash', 'timestamp', 'reldir'}
+
+_SUFFIXED_NAME = re.compile(r'^(?P<base>.+)_(?P<number>\d+)$')
+
+# Directories whose index is kept in memory (least recently used ones are dropped)
+MAX_INDEXED_DIRECTORIES = 64
+
+# Contents of a placeholder: this prefix, then the owner "host:pid"
+PLACEHOLDER_PREFIX = b'secure-audio-converter claim '
+PLACEHOLDER_MAX_SIZE = len(PLACEHOLDER_PREFIX) + 511
+
+
+def _base_key(name: str) -> str:
+    """Name without its _N suffix (the key its collision suffixes are counted under)."""
+    stem, suffix = os.path.splitext(name)
+    match = _SUFFIXED_NAME.match(stem)
+    return match.group('base') + suffix if match else name
+
+
+class _DirectoryIndex:
+    """Names present in one directory and the highest _N suffix seen per base name."""
+
+    __slots__ = ('names', 'next_suffix', 'small', 'small_keys')
+
+    def __init__(self, directory: Path):
+        self.names: Set[str] = set()
+        self.next_suffix: Dict[str, int] = {}
+        # Files found small enough to be placeholders (possibly stale ones) and not
+        # checked yet, and how many there are per base key
+        self.small: Set[str] = set()
+        self.small_keys: Dict[str, int] = {}
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    self.add(entry.name)
+                    try:
+                        if entry.is_file(follow_symlinks=False) and entry.stat().st_size <= PLACEHOLDER_MAX_SIZE:
+                            self.small.add(entry.name)
+                            key = _base_key(entry.name)
+                            self.small_keys[key] = self.small_keys.get(key, 0) + 1
+                    except OSError:
+                        pass
+        except FileNotFoundError:
+            pass
+
+    def add(self, name: str):
+        self.names.add(name)
+        stem, suffix = os.path.splitext(name)
+        match = _SUFFIXED_NAME.match(stem)
+        if match:
+            key = match.group('base') + suffix
+            number = int(match.group('number'))
+            if number >= self.next_suffix.get(key, 1):
+                self.next_suffix[key] = number + 1
+
+    def checked(self, name: str):
+        """A small file was tried (claimed, or found to belong to a live owner)."""
+        if name in self.small:
+            self.small.discard(name)
+            key = _base_key(name)
+            if self.small_keys[key] > 1:
+                self.small_keys[key] -= 1
+            else:
+                del self.small_keys[key]
+
+
+class OutputNamer:
+    """Renders output names from a template and claims them with exclusive creation."""
+
+    def __init__(self, template: str = 'default', source_root: Optional[str] = None,
+                 index: bool = True):
+        """
+        Args:
+            template: A NAMING_TEMPLATES name or a template string (see module docstring)
+            source_root: Directory that {reldir} is relative to; inputs outside it
+                are placed directly in the output directory
+            index: Keep an in-memory index of each output directory (one scandir per
+                directory) instead of probing candidate names one by one
+
+        Raises:
+            ValueError: If the template uses an unknown field
+        """
+        self.template = NAMING_TEMPLATES.get(template, template)
+        fields = set(re.findall(r'{(\w*)', self.template))
+        unknown = fields - TEMPLATE_FIELDS
+        if unknown or not fields:
+            raise ValueError(f"Invalid naming template {template!r}. "
+                             f"Use one of {', '.join(NAMING_TEMPLATES)} or the fields "
+                             f"{', '.join(sorted(TEMPLATE_FIELDS))}")
+        self.source_root = Path(source_root).resolve() if source_root else None
+        self.use_index = index
+        self._lock = threading.Lock()
+        self._indexes: 'OrderedDict[Path, _DirectoryIndex]' = OrderedDict()
+        self._owner = current_owner()
+        # Placeholders created by this namer whose outputs are still being written
+        self._claimed: Set[Path] = set()
+
+    def render(self, input_path: Path, output_directory: Path, output_format: str) -> Path:
+        """Output path for an input before collision handling (kept inside output_directory)."""
+        reldir = ''
+        if self.source_root is not None:
+            try:
+                reldir = str(input_path.parent.relative_to(self.source_root))
+            except ValueError:
+                pass
+        template = self.template
+        if not reldir or reldir == '.':
+            # No subdirectory: drop the separator instead of rendering an absolute '/stem'
+            template = template.replace('{reldir}/', '').replace('{reldir}' + os.sep, '')
+        name = template.format(
+            stem=input_path.stem,
+            hash=hashlib.sha256(str(input_path).encode('utf-8')).hexdigest()[:12],
+            timestamp=time.strftime('%Y%m%d-%H%M%S'),
+            reldir=reldir,
+        )
+        output_path = (output_directory / (name + output_format)).resolve()
+        if output_directory not in output_path.parents:
+            raise ValueError(f"Output name escapes the output directory: {name}")
+        return output_path
+
+    def claim(self, input_path: Path, output_directory: Path, output_format: str,
+              replace: Optional[str] = None) -> Path:
+        """
+        Pick a free output path for an input and reserve it.
+
+        Args:
+            input_path: Resolved input path
+            output_directory: Resolved output directory
+            output_format: Output extension (e.g. '.mp3')
+            replace: Earlier output of this input to reuse (overwritten in place)
+                when it lies in the output directory and is not claimed already
+
+        Returns:
+            Path: The claimed path (a placeholder unless it is `replace`)
+        """
+        if replace is not None:
+            replace_path = Path(replace).resolve()
+            if output_directory in replace_path.parents and replace_path.suffix == output_format:
+                with self._lock:
+                    if replace_path not in self._claimed:
+                        self._claimed.add(replace_path)
+                        return replace_path
+
+        output_path = self.render(input_path, output_directory, output_format)
+        directory = output_path.parent
+        directory.mkdir(parents=True, exist_ok=True)
+        base, extension = output_path.stem, output_path.suffix
+        key = base + extension
+
+        with self._lock:
+            index = self._index(directory)
+            candidate = key
+            # Names that may be stale placeholders are tried again, so start from _1 when there are any
+            rescan = index is not None and key in index.small_keys
+            number = index.next_suffix.get(key, 1) if index is not None and not rescan else 1
+            while True:
+                if index is None or candidate not in index.names or candidate in index.small:
+                    path = directory / candidate
+                    # Only names that were placeholders before this process looked can be stale
+                    stale_candidate = index is None or candidate in index.small
+                    if self._create(path) or (stale_candidate and self._reclaim(path)):
+                        break
+                    if index is not None:
+                        index.add(candidate)
+                        index.checked(candidate)
+                candidate = f"{base}_{number}{extension}"
+                number += 1
+            if index is not None:
+                index.add(candidate)
+                index.checked(candidate)
+                if candidate != key:
+                    index.next_suffix[key] = max(number, index.next_suffix.get(key, 1))
+            claimed = directory / candidate
+            self._claimed.add(claimed)
+
+        if candidate != key:
+            logger.warning(f"Output file already exists: {directory / key}")
+            logger.info(f"Using alternative filename: {candidate}")
+        return claimed
+
+    def release(self, output_path: Path):
+        """Release a claim once its output is finished (or its placeholder was removed)."""
+        removed = not output_path.exists()
+        with self._lock:
+            self._claimed.discard(output_path)
+            index = self._indexes.get(output_path.parent)
+            if removed and index is not None:
+                index.names.discard(output_path.name)
+
+    def _index(self, directory: Path) -> Optional[_DirectoryIndex]:
+        if not self.use_index:
+            return None
+        index = self._indexes.get(directory)
+        if index is None:
+            index = self._indexes[directory] = _DirectoryIndex(directory)
+            while len(self._indexes) > MAX_INDEXED_DIRECTORIES:
+                self._indexes.popitem(last=False)
+        else:
+            self._indexes.move_to_end(directory)
+        return index
+
+    def _create(self, path: Path) -> bool:
+        """Create a placeholder exclusively. Returns False if the name is taken."""
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        try:
+            os.write(fd, PLACEHOLDER_PREFIX + self._owner.encode('utf-8'))
+        finally:
+            os.close(fd)
+        return True
+
+    def _reclaim(self, path: Path) -> bool:
+        """Take over a name whose placeholder was left behind by a dead process."""
+        owner = _placeholder_owner(path)
+        if owner is None or owner_alive(owner):
+            return False
+        # Move the stale placeholder aside first: only one process can move it,
+        # and whoever did checks it moved the placeholder it inspected
+        aside = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.stale")
+        try:
+            os.rename(path, aside)
+        except OSError:
+            return False
+        if _placeholder_owner(aside) != owner:
+            # Another process reclaimed the name in between: put its placeholder back
+            try:
+                os.link(aside, path)
+            except OSError:
+                pass
+            aside.unlink(missing_ok=True)
+            return False
+        aside.unlink(missing_ok=True)
+        logger.info(f"Reclaiming {path.name}, left unfinished by process {owner}")
+        return self._create(path)
+
+
+def _placeholder_owner(path: Path) -> Optional[str]:
+    """Owner recorded in a placeholder, or None if the file is not one of our placeholders."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(PLACEHOLDER_MAX_SIZE + 1)
+    except OSError:
+        return None
+    if not data.startswith(PLACEHOLDER_PREFIX) or len(data) > PLACEHOLDER_MAX_SIZE:
+        return None
+    return data[len(PLACEHOLDER_PREFIX):].decode('utf-8', 'replace')
@@ -0,0 +1,38 @@
+"""
+Owner tags of processes holding a resource across processes.
+
+Resources shared through the filesystem (claimed jobs in the job queue,
+claimed output names) record the process that holds them as an owner tag,
+"host:pid" optionally followed by ":<anything>". When the holder may have
+died, owner_alive() tells whether the resource can be taken over.
+"""
+
+import os
+import socket
+
+
+def current_owner() -> str:
+    """Owner tag ("host:pid") of this process."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def owner_alive(owner: str) -> bool:
+    """
+    Check whether the process named by an owner tag ("host:pid[:...]") still exists.
+
+    Only processes on this host can be checked (and only on POSIX); any other
+    owner is assumed to be alive.
+    """
+    host, _, rest = owner.partition(':')
+    pid = rest.partition(':')[0]
+    # os.kill(pid, 0) would terminate the process on Windows
+    if host != socket.gethostname() or os.name == 'nt' or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to another user
+        return True
+    return True
@@ -0,0 +1,278 @@
+"""
+Segment-parallel MP3 encoding for long inputs.
+
+A long input is split into N time ranges whose boundaries fall on MP3 frame
+boundaries. Each range is decoded and encoded by its own ffmpeg process, with
+a few frames of overlap on either side so the encoder is primed with the real
+neighbouring audio. Because every segment's sample timeline is counted from
+the start of the input (asetpts=N/SR/TB), frame k of every segment lines up
+with frame k of a single-pass encode. The bit reservoir is disabled so each
+frame is self-contained, which lets the frames belonging to each range be
+spliced together byte for byte: no gaps and no duplicated frames at the joins.
+
+Each segment seeks in the input to a whole second a little before its range
+(a whole second is an exact sample position at any sample rate), so it only
+decodes its own part of the input plus that margin. Samples are counted from
+the seek point, and the range is trimmed relative to it.
+
+The joined stream is remuxed without LAME gapless info, so decoders keep the
+encoder's leading priming samples (576) instead of trimming them.
+"""
+
+import logging
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, List, NamedTuple, Optional
+
+from ffmpeg_runner import JobGroup, run_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+# Sample rates libmp3lame can encode natively
+MP3_SAMPLE_RATES = (44100, 48000, 32000, 22050, 24000, 16000, 11025, 12000, 8000)
+
+# Frames of overlap encoded (and discarded) on each side of a segment
+OVERLAP_FRAMES = 8
+
+# Seconds decoded before a segment's first sample (lets the resampler settle)
+SEEK_MARGIN = 2
+
+# Layer III bitrate tables (kbps) indexed by the header's bitrate index
+_MPEG1_BITRATES = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+_MPEG2_BITRATES = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+
+# Sample rates by MPEG version bits (3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5)
+_HEADER_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+
+
+class SegmentPlan(NamedTuple):
+    """Sample ranges for one segment (all counts at the output sample rate)."""
+    index: int
+    encode_start: int            # First sample fed to the encoder
+    encode_end: Optional[int]    # Sample after the last one fed (None = end of input)
+    skip_frames: int             # Leading overlap frames to discard
+    keep_frames: Optional[int]   # Frames to keep (None = all remaining)
+    duration: float              # Seconds of audio this segment encodes
+
+
+def output_sample_rate(source_rate: Optional[int]) -> int:
+    """Pick the MP3 sample rate for a source (resampling unsupported rates to 44.1kHz)."""
+    return source_rate if source_rate in MP3_SAMPLE_RATES else 44100
+
+
+def frame_samples(sample_rate: int) -> int:
+    """Samples per MP3 frame (MPEG-1 uses 1152, MPEG-2/2.5 use 576)."""
+    return 1152 if sample_rate >= 32000 else 576
+
+
+def plan_segments(duration: float, sample_rate: int, count: int) -> List[SegmentPlan]:
+    """
+    Split an input into frame-aligned segments.
+
+    Args:
+        duration: Input duration in seconds
+        sample_rate: Output sample rate
+        count: Number of segments
+
+    Returns:
+        List[SegmentPlan]: One plan per segment, in order
+    """
+    frame = frame_samples(sample_rate)
+    total_frames = int(duration * sample_rate) // frame
+    count = max(1, min(count, total_frames // (OVERLAP_FRAMES * 4) or 1))
+    overlap = OVERLAP_FRAMES * frame
+
+    # Frame-aligned boundaries; the last segment runs to the end of the input
+    boundaries = [(total_frames * i // count) * frame for i in range(count)]
+
+    plans = []
+    for i, start in enumerate(boundaries):
+        encode_start = max(0, start - overlap)
+        last = (i == count - 1)
+        end = None if last else boundaries[i + 1]
+        plans.append(SegmentPlan(
+            index=i,
+            encode_start=encode_start,
+            encode_end=None if last else end + overlap,
+            skip_frames=(start - encode_start) // frame,
+            keep_frames=None if last else (end - start) // frame,
+            duration=((end if end is not None else int(duration * sample_rate)) - encode_start) / sample_rate,
+        ))
+    return plans
+
+
+def _mp3_frame_length(header: bytes) -> int:
+    """Length in bytes of the MP3 frame starting with this 4-byte header."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        raise ValueError("Lost MP3 frame sync")
+
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        raise ValueError("Unsupported MP3 frame header")
+
+    bitrates = _MPEG1_BITRATES if version == 3 else _MPEG2_BITRATES
+    bitrate = bitrates[bitrate_index] * 1000
+    sample_rate = _HEADER_SAMPLE_RATES[version][rate_index]
+    coefficient = 144 if version == 3 else 72
+    return coefficient * bitrate // sample_rate + padding
+
+
+def copy_mp3_frames(source: Path, destination: BinaryIO, skip: int, keep: Optional[int]) -> int:
+    """
+    Copy a range of frames from a headerless MP3 stream.
+
+    Args:
+        source: MP3 file containing only audio frames
+        destination: Open binary file to append frames to
+        skip: Number of leading frames to drop
+        keep: Number of frames to copy after the skipped ones (None = all)
+
+    Returns:
+        int: Number of frames copied
+    """
+    copied = 0
+    index = 0
+    with open(source, 'rb') as f:
+        while keep is None or copied < keep:
+            header = f.read(4)
+            if len(header) < 4:
+                break
+            body = f.read(_mp3_frame_length(header) - 4)
+            if index >= skip:
+                destination.write(header)
+                destination.write(body)
+                copied += 1
+            index += 1
+    return copied
+
+
+def _segment_command(ffmpeg_path: str, input_path: Path, segment_path: Path, plan: SegmentPlan,
+                     sample_rate: int, encode_options: List[str]) -> List[str]:
+    """Build the ffmpeg command that encodes one segment."""
+    # Input-side seek: decoding starts at exactly seek_seconds, not at the start of the input
+    seek_seconds = max(0, plan.encode_start // sample_rate - SEEK_MARGIN)
+    seek_sample = seek_seconds * sample_rate
+    trim = f"start_sample={plan.encode_start - seek_sample}"
+    if plan.encode_end is not None:
+        trim += f":end_sample={plan.encode_end - seek_sample}"
+    audio_filter = (f"aresample={sample_rate},asetpts=N/SR/TB,"
+                    f"atrim={trim},asetpts=PTS-STARTPTS")
+    seek = ['-ss', str(seek_seconds)] if seek_seconds else []
+    return [
+        ffmpeg_path,
+        *seek,
+        '-i', str(input_path),
+        '-vn',
+        '-map', '0:a:0',
+        '-af', audio_filter,
+        *encode_options,
+        '-ar', str(sample_rate),
+        '-reservoir', '0',        # Self-contained frames, safe to splice
+        '-write_xing', '0',       # No info frame in the middle of the joined stream
+        '-id3v2_version', '0',
+        '-map_metadata', '-1',
+        '-f', 'mp3',
+        '-y', str(segment_path),
+    ]
+
+
+def encode_segmented(ffmpeg_path: str, input_path: Path, output_path: Path,
+                     encode_options: List[str], duration: float, source_sample_rate: Optional[int],
+                     segment_count: int, progress_callback=None, timeout: Optional[float] = None,
+                     group: Optional[JobGroup] = None) -> subprocess.CompletedProcess:
+    """
+    Encode a long input to MP3 by encoding frame-aligned segments in parallel.
+
+    Args:
+        ffmpeg_path: Path to the ffmpeg executable
+        input_path: Validated input file
+        output_path: Final MP3 path
+        encode_options: Codec options (e.g. libmp3lame, bitrate, quality)
+        duration: Probed input duration in seconds
+        source_sample_rate: Probed input sample rate
+        segment_count: Number of segments (and parallel ffmpeg processes)
+        progress_callback: Optional callback for progress updates
+        timeout: Fixed time limit per ffmpeg process in seconds (default: derived
+            from each segment's duration and encode speed)
+        group: Optional JobGroup through which the segment encodes can be cancelled
+
+    Returns:
+        subprocess.CompletedProcess: Result of the failing step, or of the final remux
+    """
+    sample_rate = output_sample_rate(source_sample_rate)
+    plans = plan_segments(duration, sample_rate, segment_count)
+    logger.info(f"Encoding {input_path.name} as {len(plans)} parallel segments at {sample_rate}Hz")
+
+    # Aggregate per-segment progress, weighted by segment length
+    total_duration = sum(plan.duration for plan in plans) or 1.0
+    segment_progress = [0.0] * len(plans)
+    progress_lock = threading.Lock()
+
+    def report(index: int, progress: float):
+        if not progress_callback:
+            return
+        with progress_lock:
+            segment_progress[index] = max(segment_progress[index], progress)
+            overall = sum(p * plan.duration for p, plan in zip(segment_progress, plans)) / total_duration
+            # Leave headroom for the join step
+            progress_callback(f"Encoding {len(plans)} segments... {overall:.1f}%", overall * 0.95)
+
+    with tempfile.TemporaryDirectory(prefix='.segments-', dir=output_path.parent) as temp_dir:
+        segment_paths = [Path(temp_dir) / f"segment_{plan.index:03d}.mp3" for plan in plans]
+
+        def encode_one(plan: SegmentPlan) -> subprocess.CompletedProcess:
+            cmd = _segment_command(ffmpeg_path, input_path, segment_paths[plan.index], plan,
+                                   sample_rate, encode_options)
+            return run_ffmpeg(
+                cmd,
+                duration=plan.duration,
+                progress_callback=lambda message, progress: report(plan.index, progress),
+                timeout=timeout,
+                group=group
+            )
+
+        with ThreadPoolExecutor(max_workers=len(plans), thread_name_prefix="segment") as executor:
+            results = list(executor.map(encode_one, plans))
+
+        for plan, result in zip(plans, results):
+            if result.returncode != 0:
+                logger.error(f"Segment {plan.index} failed (code {result.returncode})")
+                return result
+
+        if progress_callback:
+            progress_callback("Joining segments...", 95)
+
+        # Splice the frames that belong to each segment's own range
+        joined_path = Path(temp_dir) / "joined.mp3"
+        with open(joined_path, 'wb') as joined:
+            for plan, segment_path in zip(plans, segment_paths):
+                copied = copy_mp3_frames(segment_path, joined, plan.skip_frames, plan.keep_frames)
+                if plan.keep_frames is not None and copied != plan.keep_frames:
+                    message = (f"Segment {plan.index} produced {copied} frames, "
+                               f"expected {plan.keep_frames}")
+                    logger.error(message)
+                    return subprocess.CompletedProcess([], 1, '', message)
+
+        # Remux once to add a seekable info header and the source's metadata
+        remux_cmd = [
+            ffmpeg_path,
+            '-i', str(joined_path),
+            '-i', str(input_path),
+            '-map', '0:a',
+            '-map_metadata', '1',
+            '-acodec', 'copy',
+            '-y', str(output_path),
+        ]
+        return run_ffmpeg(remux_cmd, duration=duration, timeout=timeout, group=group)
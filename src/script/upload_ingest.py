@@ -0,0 +1,64 @@
+"""
+Upload ingestion: copy uploaded files to disk in fixed-size chunks.
+
+Each upload is read once, a chunk at a time, into a file in the work
+directory while its SHA-256 is computed from the same chunks. The file
+can then be converted from disk (seekable, so MP4s with the index at the
+end need no extra spooling), and the precomputed hash is passed on so the
+converter does not read the input again to hash it. Memory use per upload
+is one chunk, whatever the file size.
+"""
+
+import hashlib
+import logging
+from pathlib import Path
+from typing import BinaryIO, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bytes copied (and hashed) per read
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class SpooledUpload(NamedTuple):
+    """An upload saved to disk."""
+    path: Path
+    size: int
+    sha256: str
+
+
+def spool_upload(source: BinaryIO, destination: Path, max_size: Optional[int] = None,
+                 chunk_size: int = UPLOAD_CHUNK_SIZE) -> SpooledUpload:
+    """
+    Copy a readable upload to a file, hashing it in the same pass.
+
+    Args:
+        source: Readable binary stream (read from its current position)
+        destination: File to create
+        max_size: Reject uploads larger than this many bytes
+        chunk_size: Bytes per read
+
+    Returns:
+        SpooledUpload: Path, size and SHA-256 of the saved file
+
+    Raises:
+        ValueError: If the upload exceeds max_size (nothing is left on disk)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(destination, 'wb') as f:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise ValueError(f"File too large. Maximum size: {max_size / (1024*1024):.1f}MB")
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+    logger.info(f"Saved upload to {destination} ({size / (1024*1024):.2f}MB)")
+    return SpooledUpload(Path(destination), size, digest.hexdigest())
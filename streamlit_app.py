@@ -4,13 +4,13 @@ Converts MP4 video files to MP3 or WAV audio format with security measures.
 """
 
 import streamlit as st
-import tempfile
 import os
-import zipfile
+import shutil
+import tempfile
 from pathlib import Path
 import logging
-from io import BytesIO
 import time
+import uuid
 
 # Configure page
 st.set_page_config(
@@ -26,7 +26,19 @@ script_dir = Path(__file__).parent / "src" / "script"
 sys.path.insert(0, str(script_dir))
 
 from converter_core import SecureAudioConverter
-from config import setup_logging, APP_NAME, APP_VERSION, QUALITY_PRESETS, BITRATE_OPTIONS
+from conversion_cache import ConversionCache
+from media_probe import ProbeCache
+from download_archive import write_zip
+from upload_ingest import spool_upload
+from conversion_scheduler import ConversionScheduler, SchedulerFull, TaskGroup, DONE
+from config import (setup_logging, APP_NAME, APP_VERSION, QUALITY_PRESETS, BITRATE_OPTIONS,
+                    RESULT_CACHE_DIR, RESULT_CACHE_MAX_SIZE_MB, RESULT_CACHE_TTL,
+                    PROBE_CACHE_FILE, PROBE_CACHE_MAX_ENTRIES, SESSION_WORKSPACE_TTL)
+
+# Converted outputs live on disk, in one workspace directory per session
+WORKSPACE_ROOT = Path(tempfile.gettempdir()) / "secure-audio-converter-sessions"
+ARCHIVE_NAME = "converted_audio_files.zip"
+ARCHIVE_CHOICE = "📦 All files (ZIP)"
 
 # Setup logging for Streamlit
 @st.cache_resource
@@ -46,7 +58,11 @@ logger = setup_streamlit_logging()
 def get_converter():
     """Get or create the audio converter instance."""
     try:
-        return SecureAudioConverter()
+        # Outputs are cached on disk for every session of this server (and across restarts)
+        cache = ConversionCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_SIZE_MB * 1024 * 1024,
+                                ttl=RESULT_CACHE_TTL)
+        probe_cache = ProbeCache(PROBE_CACHE_FILE, PROBE_CACHE_MAX_ENTRIES)
+        return SecureAudioConverter(cache=cache, probe_cache=probe_cache)
     except Exception as e:
         error_msg = str(e)
         if "FFmpeg not found" in error_msg:
@@ -68,35 +84,58 @@ def get_converter():
         
         return None
 
-def create_download_link(file_path, filename):
-    """Create a download link for the converted file."""
-    with open(file_path, "rb") as f:
-        data = f.read()
-    
-    st.download_button(
-        label=f"📥 Download {filename}",
-        data=data,
-        file_name=filename,
-        mime="audio/mpeg" if filename.endswith('.mp3') else "audio/wav"
+# One worker pool for every session of this server process
+@st.cache_resource
+def get_scheduler():
+    """Get or create the shared conversion scheduler (None without a working converter)."""
+    converter = get_converter()
+    if converter is None:
+        return None
+    # Each worker gets its own converter so cancelling one task never stops another;
+    # they share the conversion and probe caches
+    return ConversionScheduler(
+        lambda: SecureAudioConverter(cache=converter.cache, probe_cache=converter.probe_cache)
     )
 
-def create_zip_download(file_paths, filenames):
-    """Create a ZIP file download for multiple files."""
-    zip_buffer = BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for file_path, filename in zip(file_paths, filenames):
-            if os.path.exists(file_path):
-                zip_file.write(file_path, filename)
+def get_session_id():
+    """Identifier of this browser session (the unit of fairness in the scheduler)."""
+    if 'session_id' not in st.session_state:
+        st.session_state['session_id'] = uuid.uuid4().hex
+    return st.session_state['session_id']
+
+def output_mime(filename):
+    """MIME type of a converted file."""
+    return "audio/mpeg" if filename.endswith('.mp3') else "audio/wav"
+
+def new_session_workspace():
+    """Replace this session's workspace directory with an empty one."""
+    previous = st.session_state.get('workspace')
+    if previous:
+        shutil.rmtree(previous, ignore_errors=True)
     
-    zip_buffer.seek(0)
+    # Sessions that ended without cleaning up leave their workspace behind
+    WORKSPACE_ROOT.mkdir(parents=True, exist_ok=True)
+    cutoff = time.time() - SESSION_WORKSPACE_TTL
+    for entry in os.scandir(WORKSPACE_ROOT):
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            pass
     
-    st.download_button(
-        label="📦 Download All Files (ZIP)",
-        data=zip_buffer.getvalue(),
-        file_name="converted_audio_files.zip",
-        mime="application/zip"
-    )
+    workspace = Path(tempfile.mkdtemp(dir=WORKSPACE_ROOT))
+    st.session_state['workspace'] = str(workspace)
+    st.session_state.pop('archive_path', None)
+    return workspace
+
+def get_session_archive(converted_files):
+    """ZIP of the session's outputs, built once on disk."""
+    archive_path = st.session_state.get('archive_path')
+    if not archive_path or not os.path.exists(archive_path):
+        archive_path = os.path.join(st.session_state['workspace'], ARCHIVE_NAME)
+        write_zip(((f['path'], f['filename']) for f in converted_files), archive_path)
+        st.session_state['archive_path'] = archive_path
+    return archive_path
 
 def main():
     """Main Streamlit application."""
@@ -198,6 +237,9 @@ def main():
         st.success(f"✅ FFmpeg Ready")
         if hasattr(converter, 'ffmpeg_path'):
             st.text(f"Path: {converter.ffmpeg_path}")
+        stats = get_scheduler().stats()
+        st.text(f"Workers busy: {stats['running']}/{stats['workers']}, "
+                f"files waiting: {stats['queued']}")
     
     # Show FFmpeg status (remove old line)
     # st.sidebar.success(f"✅ FFmpeg found: {converter.ffmpeg_path}")
@@ -213,7 +255,8 @@ def main():
             "Choose video files to convert",
             type=['mp4', 'm4v', 'mov', 'avi', 'mkv', 'mp3', 'wav', 'm4a', 'aac', 'flac'],
             accept_multiple_files=True,
-            help="Upload MP4, M4V, MOV, AVI, MKV, MP3, WAV, M4A, AAC, or FLAC files (max 500MB each)"
+            help="Upload MP4, M4V, MOV, AVI, MKV, MP3, WAV, M4A, AAC, or FLAC files (max 500MB each)",
+            key=f"uploader_{st.session_state.get('uploader_generation', 0)}"
         )
         
         if uploaded_files:
@@ -225,9 +268,30 @@ def main():
                     file_size = file.size / (1024 * 1024)  # Convert to MB
                     st.write(f"{i}. **{file.name}** ({file_size:.1f} MB)")
             
-            # Convert button
-            if st.button("🎯 Start Conversion", type="primary", use_container_width=True):
-                convert_files(uploaded_files, converter, output_format, quality, bitrate)
+            # Convert button (one background job per session at a time)
+            job = st.session_state.get('conversion_job')
+            running = job is not None and not job['group'].finished
+            if st.button("🎯 Start Conversion", type="primary", use_container_width=True,
+                         disabled=running):
+                start_conversion(uploaded_files, get_scheduler(), output_format, quality, bitrate)
+        
+        # The job survives reruns: poll it while it runs, then show its results
+        job = st.session_state.get('conversion_job')
+        if job is not None and time.time() > job.get('expires_at', float('inf')):
+            st.session_state.pop('conversion_job')
+            st.session_state.pop('converted_files', None)
+            st.info("The converted files have expired. Please convert them again.")
+            job = None
+        if job is not None:
+            if not job['group'].finished:
+                show_job_progress(get_scheduler())
+            else:
+                collect_results()
+                show_job_results()
+        
+        # Outputs of the last conversion stay downloadable across reruns until they expire
+        if st.session_state.get('converted_files'):
+            show_downloads(st.session_state['converted_files'])
     
     with col2:
         st.header("ℹ️ Instructions")
@@ -248,139 +312,240 @@ def main():
         - 📦 Multiple files = ZIP download
         """)
 
-def convert_files(uploaded_files, converter, output_format, quality, bitrate):
-    """Convert uploaded files and provide download links."""
+def make_conversion_task(upload, output_dir, output_format, bitrate, quality):
+    """Scheduler task converting a spooled upload into output_dir (returns the output path)."""
+    def run(converter, task):
+        try:
+            # The hash computed while spooling spares the converter a second read of the input
+            result = converter.convert_file(
+                str(upload.path),
+                f".{output_format}",
+                str(output_dir),
+                bitrate,
+                quality,
+                progress_callback=task.progress,
+                input_hash=upload.sha256
+            )
+        finally:
+            upload.path.unlink(missing_ok=True)
+        if not result:
+            if task.cancel_requested:
+                return None
+            raise RuntimeError(result.error or "Conversion failed")
+        return result.output_path
+    return run
+
+def restore_cached_output(upload, output_path, output_format, bitrate, quality):
+    """Serve an upload from the shared result cache. Returns False on a miss."""
+    converter = get_converter()
+    key = ConversionCache.make_key(upload.sha256, f".{output_format}", bitrate, quality,
+                                   converter.get_ffmpeg_version(), converter.allow_stream_copy)
+    # Workspace files are never modified, so they can share their data with the cache entry
+    if not converter.cache.restore(key, f".{output_format}", output_path, link=True):
+        return False
+    upload.path.unlink(missing_ok=True)
+    return True
+
+def start_conversion(uploaded_files, scheduler, output_format, quality, bitrate):
+    """Save uploads to disk and queue them on the shared scheduler as this session's background job."""
+    workspace = new_session_workspace()
+    st.session_state.pop('converted_files', None)
+    input_dir = workspace / "inputs"
+    output_dir = workspace / "outputs"
+    input_dir.mkdir()
+    output_dir.mkdir()
+    planned = []
+    cached = []
+    errors = []
+    used_filenames = set()
     
-    # Create temporary directory for processing
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_path = Path(temp_dir)
-        
-        # Progress tracking
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        converted_files = []
-        conversion_results = []
-        
-        total_files = len(uploaded_files)
-        
-        for i, uploaded_file in enumerate(uploaded_files):
+    with st.spinner("Saving uploads..."):
+        for index, uploaded_file in enumerate(uploaded_files):
+            # Copy in fixed-size chunks, hashing on the way; then drop this reference to the upload buffer
             try:
-                # Update progress
-                progress = (i / total_files)
-                progress_bar.progress(progress)
-                status_text.text(f"Processing {uploaded_file.name}... ({i+1}/{total_files})")
-                
-                # Save uploaded file to temp directory
-                input_path = temp_path / uploaded_file.name
-                with open(input_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                
-                # Convert file
-                success = converter.convert_file(
-                    str(input_path),
-                    f".{output_format}",
-                    str(temp_path),
-                    bitrate,
-                    quality
-                )
-                
-                if success:
-                    # Find the output file
-                    output_filename = input_path.stem + f".{output_format}"
-                    output_path = temp_path / output_filename
-                    
-                    if output_path.exists():
-                        # Read the converted file
-                        with open(output_path, "rb") as f:
-                            converted_data = f.read()
-                        
-                        converted_files.append({
-                            'filename': output_filename,
-                            'data': converted_data,
-                            'size': len(converted_data)
-                        })
-                        conversion_results.append(True)
-                    else:
-                        conversion_results.append(False)
-                        st.error(f"❌ Output file not found for {uploaded_file.name}")
-                else:
-                    conversion_results.append(False)
-                    st.error(f"❌ Conversion failed for {uploaded_file.name}")
-                    
-            except Exception as e:
-                conversion_results.append(False)
-                st.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
-        
-        # Final progress update
-        progress_bar.progress(1.0)
-        
-        # Show results
-        successful = sum(conversion_results)
-        status_text.text(f"✅ Conversion complete: {successful}/{total_files} files converted")
-        
-        if converted_files:
-            st.success(f"🎉 Successfully converted {len(converted_files)} file(s)!")
+                uploaded_file.seek(0)
+                upload = spool_upload(uploaded_file, input_dir / f"{index}{Path(uploaded_file.name).suffix.lower()}",
+                                      SecureAudioConverter.MAX_FILE_SIZE)
+            except (OSError, ValueError) as e:
+                errors.append(f"❌ Error processing {uploaded_file.name}: {str(e)}")
+                continue
+            finally:
+                uploaded_file.close()
             
-            # Show download section
-            st.header("📥 Download Converted Files")
+            # Keep download names unique when uploads share a stem
+            stem = Path(uploaded_file.name).stem
+            output_filename = f"{stem}.{output_format}"
+            counter = 1
+            while output_filename in used_filenames:
+                output_filename = f"{stem}_{counter}.{output_format}"
+                counter += 1
+            used_filenames.add(output_filename)
             
-            if len(converted_files) == 1:
-                # Single file download
-                file_info = converted_files[0]
-                file_size = file_info['size'] / (1024 * 1024)  # Convert to MB
-                
-                st.write(f"**{file_info['filename']}** ({file_size:.1f} MB)")
-                
-                st.download_button(
-                    label=f"📥 Download {file_info['filename']}",
-                    data=file_info['data'],
-                    file_name=file_info['filename'],
-                    mime="audio/mpeg" if file_info['filename'].endswith('.mp3') else "audio/wav",
-                    use_container_width=True
-                )
+            # Repeat conversions (same content and settings, from any session) skip the queue
+            output_path = output_dir / f"{index}.{output_format}"
+            if restore_cached_output(upload, output_path, output_format, bitrate, quality):
+                cached.append({
+                    'filename': output_filename,
+                    'path': str(output_path),
+                    'size': os.path.getsize(output_path)
+                })
             else:
-                # Multiple files - show individual downloads and ZIP option
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.subheader("Individual Downloads")
-                    for file_info in converted_files:
-                        file_size = file_info['size'] / (1024 * 1024)
-                        st.write(f"**{file_info['filename']}** ({file_size:.1f} MB)")
-                        
-                        st.download_button(
-                            label=f"📥 {file_info['filename']}",
-                            data=file_info['data'],
-                            file_name=file_info['filename'],
-                            mime="audio/mpeg" if file_info['filename'].endswith('.mp3') else "audio/wav",
-                            key=f"download_{file_info['filename']}"
-                        )
-                
-                with col2:
-                    st.subheader("Bulk Download")
-                    
-                    # Create ZIP file
-                    zip_buffer = BytesIO()
-                    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                        for file_info in converted_files:
-                            zip_file.writestr(file_info['filename'], file_info['data'])
-                    
-                    zip_buffer.seek(0)
-                    total_size = sum(f['size'] for f in converted_files) / (1024 * 1024)
-                    
-                    st.write(f"**All files** ({total_size:.1f} MB total)")
-                    st.download_button(
-                        label="📦 Download All (ZIP)",
-                        data=zip_buffer.getvalue(),
-                        file_name="converted_audio_files.zip",
-                        mime="application/zip",
-                        use_container_width=True
-                    )
+                planned.append((uploaded_file.name, output_filename, upload))
+    
+    if not planned and not cached:
+        for error in errors:
+            st.error(error)
+        return
+    try:
+        tasks = scheduler.submit_batch(get_session_id(), [
+            (make_conversion_task(upload, output_dir, output_format, bitrate, quality), name)
+            for name, _, upload in planned
+        ]) if planned else []
+    except SchedulerFull as e:
+        shutil.rmtree(input_dir, ignore_errors=True)
+        st.error(f"⏳ The server is busy ({e}). Please try again in a minute.")
+        return
+    
+    # The job runs on the scheduler's threads; reruns only poll it
+    st.session_state['conversion_job'] = {
+        'group': TaskGroup(tasks),
+        'outputs': [(name, output_filename) for name, output_filename, _ in planned],
+        'cached': cached,
+        'errors': errors,
+        'collected': False,
+    }
+    
+    # A new uploader widget lets Streamlit release the uploaded files it still holds in memory
+    st.session_state['uploader_generation'] = st.session_state.get('uploader_generation', 0) + 1
+    st.rerun()
+
+@st.fragment(run_every=1.0)
+def show_job_progress(scheduler):
+    """Progress of the session's background job, refreshed every second without a full rerun."""
+    job = st.session_state.get('conversion_job')
+    if job is None:
+        return
+    group = job['group']
+    # Read once: the last task can finish at any moment on a worker thread
+    current = group.current()
+    if current is None:
+        # Rerun the whole page so the results and downloads are rendered
+        st.rerun()
+    
+    total_files = len(group.tasks)
+    finished = group.finished_count
+    st.progress(group.fraction())
+    position = scheduler.position(current)
+    if position:
+        st.text(f"⏳ Waiting for a free worker: {current.label} is number {position} "
+                f"in the queue ({finished}/{total_files} done)")
+    else:
+        st.text(f"Processing {current.label}... ({finished + 1}/{total_files}) {current.message}")
+    st.caption("You can keep using the page; the conversion continues in the background.")
+    
+    if st.button("⏹️ Cancel Conversion", key="cancel_conversion"):
+        scheduler.cancel_session(get_session_id())
+
+def collect_results():
+    """Turn the session's finished job into downloadable results (once)."""
+    job = st.session_state['conversion_job']
+    if job['collected']:
+        return
+    job['collected'] = True
+    
+    converted_files = list(job['cached'])
+    errors = job['errors']  # Uploads that could not be saved, then failed conversions
+    for task, (name, output_filename) in zip(job['group'].tasks, job['outputs']):
+        if task.state == DONE:
+            converted_files.append({
+                'filename': output_filename,
+                'path': task.result,
+                'size': os.path.getsize(task.result)
+            })
+        else:
+            errors.append(f"❌ Conversion failed for {name}: {task.error}")
+
+    # Downloads stay available for SESSION_WORKSPACE_TTL from now
+    os.utime(st.session_state['workspace'])
+    job['expires_at'] = time.time() + SESSION_WORKSPACE_TTL
+    if converted_files:
+        st.session_state['converted_files'] = converted_files
+
+def show_job_results():
+    """Outcome of the session's last finished job."""
+    job = st.session_state['conversion_job']
+    converted = len(st.session_state.get('converted_files') or [])
+    total_files = converted + len(job['errors'])
+    
+    for error in job['errors']:
+        st.error(error)
+    if converted:
+        st.success(f"🎉 Successfully converted {converted}/{total_files} file(s)! "
+                   f"Downloads are available until {time.strftime('%H:%M', time.localtime(job['expires_at']))}.")
+        if job['cached']:
+            st.caption(f"♻️ {len(job['cached'])} file(s) were served from the cache of earlier conversions.")
+    else:
+        st.error("❌ No files were converted successfully. Please check the logs and try again.")
+        show_footer()
+
+def show_downloads(converted_files):
+    """Download section for the last conversion; files are read from disk only when offered."""
+    if not all(os.path.exists(f['path']) for f in converted_files):
+        st.session_state.pop('converted_files', None)
+        st.info("The converted files have expired. Please convert them again.")
+        return
+    
+    st.header("📥 Download Converted Files")
+    
+    if len(converted_files) == 1:
+        # Single file download
+        file_info = converted_files[0]
+        file_size = file_info['size'] / (1024 * 1024)  # Convert to MB
+        
+        st.write(f"**{file_info['filename']}** ({file_size:.1f} MB)")
+        
+        with open(file_info['path'], 'rb') as f:
+            st.download_button(
+                label=f"📥 Download {file_info['filename']}",
+                data=f,
+                file_name=file_info['filename'],
+                mime=output_mime(file_info['filename']),
+                use_container_width=True
+            )
+    else:
+        total_size = sum(f['size'] for f in converted_files) / (1024 * 1024)
+        st.write(f"**{len(converted_files)} files** ({total_size:.1f} MB total)")
+        with st.expander("📋 Converted Files"):
+            for file_info in converted_files:
+                file_size = file_info['size'] / (1024 * 1024)
+                st.write(f"**{file_info['filename']}** ({file_size:.1f} MB)")
+        
+        # Offer one payload at a time (a download button holds its data in memory):
+        # a single file by default, the whole set as a ZIP only once it is picked
+        choice = st.selectbox(
+            "File to download",
+            [f['filename'] for f in converted_files] + [ARCHIVE_CHOICE],
+            key="download_choice"
+        )
+        if choice == ARCHIVE_CHOICE:
+            path, filename, mime = get_session_archive(converted_files), ARCHIVE_NAME, "application/zip"
         else:
-            st.error("❌ No files were converted successfully. Please check the logs and try again.")
+            file_info = next(f for f in converted_files if f['filename'] == choice)
+            path, filename, mime = file_info['path'], file_info['filename'], output_mime(file_info['filename'])
+        
+        with open(path, 'rb') as f:
+            st.download_button(
+                label=f"📥 Download {filename}",
+                data=f,
+                file_name=filename,
+                mime=mime,
+                use_container_width=True
+            )
+    
+    show_footer()
 
-    # Footer with Stefan's signature
+def show_footer():
+    """Footer with Stefan's signature."""
     st.markdown("---")
     st.markdown(
         "<div style='text-align: right; color: #aac86c; padding: 20px;'>"
@@ -0,0 +1,17 @@
+"""Shared pytest setup: the converter modules import each other from src/script."""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "script"))
+
+
+@pytest.fixture
+def dead_pid():
+    """PID of a process that has already exited."""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
@@ -0,0 +1,90 @@
+"""Tests for the on-disk conversion cache."""
+
+import os
+import time
+
+import pytest
+
+from conversion_cache import ConversionCache
+
+
+def make_key(name, stream_copy=True):
+    return ConversionCache.make_key(name, ".mp3", "192k", "high", "7.0", stream_copy)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "out.mp3"
+    path.write_bytes(b"\0" * 1000)
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ConversionCache(str(tmp_path / "cache"), max_size_bytes=3000)
+
+
+def count_scans(cache, monkeypatch):
+    scans = []
+    entries = cache._entries
+
+    def counting_entries():
+        scans.append(1)
+        return entries()
+
+    monkeypatch.setattr(cache, "_entries", counting_entries)
+    return scans
+
+
+def test_key_depends_on_codec_mode():
+    assert make_key("input") != make_key("input", stream_copy=False)
+    assert make_key("input") == make_key("input")
+
+
+def test_restore(cache, source, tmp_path):
+    cache.put(make_key("a"), ".mp3", source)
+    destination = tmp_path / "restored.mp3"
+    assert cache.restore(make_key("a"), ".mp3", destination)
+    assert destination.read_bytes() == source.read_bytes()
+    assert not cache.restore(make_key("b"), ".mp3", tmp_path / "missing.mp3")
+
+
+def test_least_recently_used_entries_are_evicted(cache, source):
+    now = time.time()
+    for age, name in enumerate("abc"):
+        entry = cache.put(make_key(name), ".mp3", source)
+        os.utime(entry, (now - 100 + age, now - 100 + age))
+    cache.get(make_key("a"), ".mp3")  # Refreshes a: b is now the oldest
+    cache.put(make_key("d"), ".mp3", source)
+    present = [name for name in "abcd" if cache.get(make_key(name), ".mp3")]
+    assert present == ["a", "c", "d"]
+    assert cache.stats()["size_bytes"] == 3000
+
+
+def test_put_scans_only_over_the_limit(cache, source, monkeypatch):
+    scans = count_scans(cache, monkeypatch)
+    cache.put(make_key("a"), ".mp3", source)
+    assert len(scans) == 1  # First put counts the existing entries
+    cache.put(make_key("b"), ".mp3", source)
+    cache.put(make_key("c"), ".mp3", source)
+    cache.put(make_key("c"), ".mp3", source)  # Replacing an entry does not grow the total
+    assert len(scans) == 1
+    cache.put(make_key("d"), ".mp3", source)
+    assert len(scans) == 2
+    assert cache.stats()["entries"] == 3
+
+
+def test_put_rescans_periodically(cache, source, monkeypatch):
+    scans = count_scans(cache, monkeypatch)
+    cache.put(make_key("a"), ".mp3", source)
+    cache._scanned_at -= ConversionCache.RESCAN_INTERVAL + 1
+    cache.put(make_key("b"), ".mp3", source)
+    assert len(scans) == 2
+
+
+def test_expired_entries(tmp_path, source):
+    cache = ConversionCache(str(tmp_path / "cache"), max_size_bytes=3000, ttl=60)
+    entry = cache.put(make_key("a"), ".mp3", source)
+    os.utime(entry, (time.time() - 120, time.time() - 120))
+    assert cache.get(make_key("a"), ".mp3") is None
+    assert not entry.exists()
@@ -0,0 +1,123 @@
+"""Tests for the fair conversion scheduler."""
+
+import threading
+
+import pytest
+
+from conversion_scheduler import CANCELLED, DONE, FAILED, ConversionScheduler, SchedulerFull
+
+
+class FakeConverter:
+    """Stands in for a worker's converter (no ffmpeg needed)."""
+
+    def cancel(self):
+        pass
+
+    def reset_cancel(self):
+        pass
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = ConversionScheduler(FakeConverter, max_workers=1, max_queued=10,
+                                    max_queued_per_session=4)
+    yield scheduler
+    scheduler.close()
+
+
+@pytest.fixture
+def blocked(scheduler):
+    """Occupy the only worker until the returned event is set."""
+    started, release = threading.Event(), threading.Event()
+
+    def block(converter, task):
+        started.set()
+        release.wait(10)
+        return True
+
+    task = scheduler.submit("blocker", block)
+    assert started.wait(10)
+    yield release
+    release.set()
+    task.wait(10)
+
+
+def recorder(order, label):
+    def run(converter, task):
+        order.append(label)
+        return label
+    return run
+
+
+def submit(scheduler, session_id, order, labels):
+    return scheduler.submit_batch(session_id, [(recorder(order, label), label) for label in labels])
+
+
+def test_round_robin_order_and_positions(scheduler, blocked):
+    order = []
+    a = submit(scheduler, "A", order, ["a1", "a2", "a3"])
+    b = submit(scheduler, "B", order, ["b1", "b2"])
+    c = submit(scheduler, "C", order, ["c1"])
+    expected = ["a1", "b1", "c1", "a2", "b2", "a3"]
+    tasks = {task.label: task for task in a + b + c}
+    assert [scheduler.position(tasks[label]) for label in expected] == [1, 2, 3, 4, 5, 6]
+
+    blocked.set()
+    for task in tasks.values():
+        assert task.wait(10)
+    assert order == expected
+    assert all(task.state == DONE and task.result == task.label for task in tasks.values())
+    assert scheduler.position(tasks["a1"]) == 0
+
+
+def test_cancelled_task_leaves_the_order(scheduler, blocked):
+    order = []
+    a = submit(scheduler, "A", order, ["a1", "a2"])
+    b = submit(scheduler, "B", order, ["b1"])
+    scheduler.cancel(a[0])
+    assert a[0].state == CANCELLED and scheduler.position(a[0]) == 0
+    assert [scheduler.position(task) for task in (a[1], b[0])] == [1, 2]
+
+    blocked.set()
+    assert a[1].wait(10) and b[0].wait(10)
+    assert order == ["a2", "b1"]
+
+
+def test_cancel_session(scheduler, blocked):
+    order = []
+    a = submit(scheduler, "A", order, ["a1", "a2"])
+    b = submit(scheduler, "B", order, ["b1"])
+    scheduler.cancel_session("A")
+    assert all(task.state == CANCELLED for task in a)
+    assert scheduler.position(b[0]) == 1
+    assert scheduler.stats()["queued"] == 1
+
+
+def test_batches_are_admitted_all_or_none(scheduler, blocked):
+    order = []
+    submit(scheduler, "A", order, ["a1", "a2", "a3"])
+    with pytest.raises(SchedulerFull):
+        submit(scheduler, "A", order, ["a4", "a5"])
+    assert scheduler.stats()["queued"] == 3
+    submit(scheduler, "A", order, ["a4"])
+    submit(scheduler, "B", order, ["b1", "b2", "b3", "b4"])
+    with pytest.raises(SchedulerFull):
+        submit(scheduler, "C", order, ["c1", "c2", "c3"])
+    assert scheduler.stats()["queued"] == 8
+
+
+def test_failed_and_empty_results(scheduler):
+    def fail(converter, task):
+        raise RuntimeError("boom")
+
+    failed = scheduler.submit("A", fail)
+    empty = scheduler.submit("A", lambda converter, task: None)
+    assert failed.wait(10) and empty.wait(10)
+    assert (failed.state, failed.error) == (FAILED, "boom")
+    assert (empty.state, empty.error) == (FAILED, "Conversion failed")
+
+
+def test_closed_scheduler_rejects_work(scheduler):
+    scheduler.close()
+    with pytest.raises(SchedulerFull):
+        scheduler.submit("A", lambda converter, task: True)
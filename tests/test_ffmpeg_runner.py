@@ -0,0 +1,142 @@
+"""Tests for parsing ffmpeg's progress output and bounding its log capture."""
+
+import time
+
+import pytest
+
+from ffmpeg_runner import _PROGRESS_LINE, ProgressParser, StderrBuffer, TimeLimit
+
+
+def feed(parser, block):
+    """Feed a block of lines and return the snapshots it produced."""
+    snapshots = [parser.feed(line) for line in block.strip().splitlines()]
+    return [snapshot for snapshot in snapshots if snapshot is not None]
+
+
+def test_snapshot_per_block():
+    parser = ProgressParser(duration=20)
+    snapshots = feed(parser, """
+        out_time_us=5000000
+        speed=2.5x
+        progress=continue
+        out_time_us=10000000
+        speed=N/A
+        progress=continue
+    """)
+    assert [s.out_time for s in snapshots] == [5.0, 10.0]
+    first, second = snapshots
+    assert (first.percent, first.speed, first.eta, first.finished) == (25.0, 2.5, 6.0, False)
+    assert second.speed is None and second.eta is None
+
+
+def test_padded_values():
+    """ffmpeg pads some values (bitrate=%6.1fkbits/s, speed=%4.3gx)."""
+    block = """
+        bitrate= 128.0kbits/s
+        out_time_us=30000000
+        speed=  15x
+        progress=continue
+    """
+    assert all(_PROGRESS_LINE.match(line.strip()) for line in block.strip().splitlines())
+    snapshot, = feed(ProgressParser(duration=60), block)
+    assert (snapshot.speed, snapshot.eta) == (15.0, 2.0)
+
+
+def test_log_lines_are_not_progress():
+    assert not _PROGRESS_LINE.match("[mp3 @ 0x55d0] Estimating duration from bitrate")
+    assert not _PROGRESS_LINE.match("Error opening input file pipe:0.")
+
+
+def test_lines_before_progress_produce_nothing():
+    parser = ProgressParser()
+    assert parser.feed("out_time_us=1000000\n") is None
+    assert parser.feed("not a progress line\n") is None
+    assert parser.feed("progress=continue\n").out_time == 1.0
+
+
+@pytest.mark.parametrize("line, seconds", [
+    ("out_time_ms=1500000", 1.5),  # microseconds despite the name
+    ("out_time=00:01:02.500000", 62.5),
+    ("out_time=01:00:00.000000", 3600.0),
+])
+def test_out_time_formats(line, seconds):
+    parser = ProgressParser()
+    parser.feed(line)
+    assert parser.feed("progress=continue").out_time == seconds
+
+
+def test_unknown_position_keeps_the_last_one():
+    parser = ProgressParser(duration=10)
+    feed(parser, "out_time_us=4000000\nprogress=continue")
+    snapshot, = feed(parser, "out_time_us=N/A\nout_time=N/A\nprogress=continue")
+    assert snapshot.out_time == 4.0
+
+
+def test_percent_without_duration():
+    snapshot, = feed(ProgressParser(), "out_time_us=3000000\nprogress=continue")
+    assert snapshot.percent is None
+    assert snapshot.describe().startswith("Converting... 0:00:03 processed")
+
+
+def test_percent_stays_below_100_until_the_end():
+    parser = ProgressParser(duration=10)
+    running, = feed(parser, "out_time_us=12000000\nprogress=continue")
+    assert running.percent == 99.9
+    end, = feed(parser, "out_time_us=10000000\nprogress=end")
+    assert end.finished and end.percent == 100.0 and end.eta == 0.0
+
+
+def lines(count, start=1, text="frame"):
+    return [f"{text} {number}\n" for number in range(start, start + count)]
+
+
+def test_stderr_buffer_keeps_everything_when_short():
+    buffer = StderrBuffer(tail_lines=5, error_lines=2)
+    for line in lines(3):
+        buffer.append(line)
+    assert buffer.getvalue() == "frame 1\nframe 2\nframe 3\n"
+    assert buffer.line_count == 3
+
+
+def test_stderr_buffer_keeps_the_tail():
+    buffer = StderrBuffer(tail_lines=3, error_lines=2)
+    for line in lines(10):
+        buffer.append(line)
+    assert buffer.getvalue() == "[... 7 line(s) omitted ...]\nframe 8\nframe 9\nframe 10\n"
+    assert buffer.line_count == 10
+
+
+def test_stderr_buffer_keeps_errors_that_scroll_out():
+    buffer = StderrBuffer(tail_lines=3, error_lines=2)
+    for line in lines(1) + ["Error opening input file\n"] + lines(8, start=3):
+        buffer.append(line)
+    assert buffer.getvalue() == ("[... 1 line(s) omitted ...]\n"
+                                 "Error opening input file\n"
+                                 "[... 5 line(s) omitted ...]\n"
+                                 "frame 8\nframe 9\nframe 10\n")
+
+
+def test_stderr_buffer_bounds_error_lines():
+    buffer = StderrBuffer(tail_lines=2, error_lines=2)
+    for line in lines(6, text="Invalid data in packet") + lines(2, start=7):
+        buffer.append(line)
+    assert buffer.getvalue() == ("[... 4 line(s) omitted ...]\n"
+                                 "Invalid data in packet 5\nInvalid data in packet 6\n"
+                                 "frame 7\nframe 8\n")
+
+
+def test_stderr_buffer_terminates_lines():
+    buffer = StderrBuffer()
+    buffer.append("no newline")
+    assert buffer.getvalue() == "no newline\n"
+
+
+def test_time_limit_ignores_time_spent_waiting_for_input():
+    limit = TimeLimit(stall_timeout=0.2)
+    limit.input_wait()
+    time.sleep(0.3)
+    assert limit.exceeded() is None and limit.remaining() > 0
+    limit.input_received()
+    assert limit.exceeded() is None
+    time.sleep(0.3)
+    assert limit.exceeded() == 'stalled'
@@ -0,0 +1,134 @@
+"""Tests for the SQLite job queue: claims, results and lease recovery."""
+
+import socket
+import time
+
+import pytest
+
+from job_store import DONE, FAILED, PENDING, RUNNING, JobStore
+
+FILES = ["a.wav", "b.wav", "c.wav"]
+PARAMS = {"formats": [".mp3"], "output_dir": None, "bitrate": "192k", "quality": "high"}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+@pytest.fixture
+def store(db_path):
+    store = JobStore(db_path)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def other(db_path):
+    """A second store on the same database (another converter process)."""
+    store = JobStore(db_path)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def batch_id(store, tmp_path):
+    files = [str(tmp_path / name) for name in FILES]
+    batch_id = JobStore.make_batch_id(files, PARAMS)
+    store.enqueue(batch_id, files, PARAMS)
+    return batch_id
+
+
+def states(store, batch_id):
+    return [job["state"] for job in store.jobs(batch_id)]
+
+
+def test_claims_in_input_order(store, batch_id):
+    positions = []
+    for _ in FILES:
+        job = store.claim(batch_id)
+        positions.append(job.position)
+        assert job.params == PARAMS and job.attempts == 1
+        store.complete(job.id, success=job.position != 1, error="boom")
+    assert positions == [0, 1, 2]
+    assert store.claim(batch_id) is None
+    assert store.results(batch_id) == [True, False, True]
+    assert [job["success"] for job in store.jobs(batch_id)] == [True, False, True]
+    assert store.counts(batch_id) == {DONE: 2, FAILED: 1}
+    assert store.jobs(batch_id)[1]["error"] == "boom"
+
+
+def test_batch_id_depends_on_inputs_and_params(tmp_path):
+    files = [str(tmp_path / name) for name in FILES]
+    assert JobStore.make_batch_id(files, PARAMS) == JobStore.make_batch_id(list(files), dict(PARAMS))
+    assert JobStore.make_batch_id(files, PARAMS) != JobStore.make_batch_id(files[:2], PARAMS)
+    assert JobStore.make_batch_id(files, PARAMS) != JobStore.make_batch_id(files, {**PARAMS, "bitrate": "320k"})
+
+
+def test_enqueue_is_idempotent(store, batch_id, tmp_path):
+    store.complete(store.claim(batch_id).id, success=True)
+    store.enqueue(batch_id, [str(tmp_path / name) for name in FILES], PARAMS)
+    assert states(store, batch_id) == [DONE, PENDING, PENDING]
+
+
+def test_failed_jobs_are_retried_until_max_attempts(db_path, tmp_path):
+    store = JobStore(db_path, max_attempts=2)
+    files = [str(tmp_path / "a.wav")]
+    batch_id = JobStore.make_batch_id(files, PARAMS)
+    try:
+        for attempt in (1, 2):
+            store.enqueue(batch_id, files, PARAMS)
+            job = store.claim(batch_id)
+            assert job.attempts == attempt
+            store.complete(job.id, success=False)
+        store.enqueue(batch_id, files, PARAMS)
+        assert store.claim(batch_id) is None
+        assert states(store, batch_id) == [FAILED]
+    finally:
+        store.close()
+
+
+def test_release_does_not_count_the_attempt(store, batch_id):
+    job = store.claim(batch_id)
+    store.release(job.id)
+    again = store.claim(batch_id)
+    assert again.id == job.id and again.attempts == 1
+
+
+def test_stores_never_claim_the_same_job(store, other, batch_id):
+    claimed = [store.claim(batch_id), other.claim(batch_id), store.claim(batch_id)]
+    assert sorted(job.position for job in claimed) == [0, 1, 2]
+    assert other.claim(batch_id) is None
+
+
+def test_live_lease_is_kept(store, other, batch_id):
+    job = store.claim(batch_id)
+    store.heartbeat()
+    assert other.claim(batch_id).id != job.id
+
+
+def test_expired_lease_is_recovered(store, other, batch_id):
+    job = store.claim(batch_id)
+    store._conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?",
+                        (time.time() - store.lease_timeout - 1, job.id))
+    recovered = other.claim(batch_id)
+    assert recovered.id == job.id and recovered.attempts == 2
+    # The previous owner lost the job: its late result is ignored
+    store.complete(job.id, success=False, error="late")
+    assert store.jobs(batch_id)[0]["state"] == RUNNING
+    other.complete(recovered.id, success=True)
+    assert store.results(batch_id)[0] is True
+
+
+def test_dead_owner_is_recovered(store, other, batch_id, dead_pid):
+    job = store.claim(batch_id)
+    store._conn.execute("UPDATE jobs SET owner = ? WHERE id = ?",
+                        (f"{socket.gethostname()}:{dead_pid}:00000000", job.id))
+    assert other.claim(batch_id).id == job.id
+
+
+def test_owner_on_another_host_is_assumed_alive(store, other, batch_id, dead_pid):
+    job = store.claim(batch_id)
+    store._conn.execute("UPDATE jobs SET owner = ? WHERE id = ?",
+                        (f"not-{socket.gethostname()}:{dead_pid}:00000000", job.id))
+    assert other.claim(batch_id).id != job.id
@@ -0,0 +1,95 @@
+"""Tests for the incremental-batch output manifest."""
+
+import hashlib
+import os
+
+import pytest
+
+from output_manifest import OutputManifest
+
+
+def sha256(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+@pytest.fixture
+def converted(tmp_path):
+    """An input, its output, and a manifest recording the conversion."""
+    source = tmp_path / "in.wav"
+    source.write_bytes(b"input data")
+    output = tmp_path / "out" / "in.mp3"
+    output.parent.mkdir()
+    output.write_bytes(b"output data")
+    manifest = OutputManifest.for_output_dir(str(output.parent))
+    params = OutputManifest.make_params([".mp3"], str(output.parent), "192k", "high")
+    manifest.record(source, params, source.stat(), sha256(source), {".mp3": str(output)})
+    yield manifest, source, output, params
+    manifest.close()
+
+
+def test_unchanged_input_is_current(converted):
+    manifest, source, output, params = converted
+    entry = manifest.get(source, params)
+    assert entry.outputs == {".mp3": str(output)}
+    assert manifest.is_current(source, params, entry)
+
+
+def test_other_params_have_no_entry(converted):
+    manifest, source, output, params = converted
+    other = OutputManifest.make_params([".mp3"], str(output.parent), "320k", "high")
+    assert manifest.get(source, other) is None
+    assert manifest.outputs_of(source) == {".mp3": str(output)}
+
+
+def test_missing_output_is_not_current(converted):
+    manifest, source, output, params = converted
+    output.unlink()
+    assert not manifest.is_current(source, params, manifest.get(source, params))
+
+
+def test_resized_output_is_not_current(converted):
+    manifest, source, output, params = converted
+    output.write_bytes(b"truncated")
+    assert not manifest.is_current(source, params, manifest.get(source, params))
+
+
+def test_modified_input_is_not_current(converted):
+    manifest, source, output, params = converted
+    source.write_bytes(b"new input data")
+    assert not manifest.is_current(source, params, manifest.get(source, params), sha256)
+
+
+def test_touched_input_needs_check_hash(converted):
+    manifest, source, output, params = converted
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not manifest.is_current(source, params, manifest.get(source, params), sha256)
+
+
+def test_touched_input_with_same_hash_is_current(converted):
+    manifest, source, output, params = converted
+    manifest.check_hash = True
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert manifest.is_current(source, params, manifest.get(source, params), sha256)
+    # The new mtime was recorded, so the next check needs no hash
+    assert manifest.get(source, params).input_mtime_ns == stat.st_mtime_ns + 10**9
+    assert manifest.is_current(source, params, manifest.get(source, params))
+
+
+def test_same_size_edit_is_caught_by_hash(converted):
+    manifest, source, output, params = converted
+    manifest.check_hash = True
+    stat = source.stat()
+    source.write_bytes(b"INPUT DATA")
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not manifest.is_current(source, params, manifest.get(source, params), sha256)
+
+
+def test_manifest_persists(converted):
+    manifest, source, output, params = converted
+    reopened = OutputManifest.for_output_dir(str(output.parent))
+    try:
+        assert reopened.is_current(source, params, reopened.get(source, params))
+    finally:
+        reopened.close()
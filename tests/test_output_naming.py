@@ -0,0 +1,152 @@
+"""Tests for output name templates, collision handling and claims."""
+
+import os
+import socket
+
+import pytest
+
+from output_naming import PLACEHOLDER_PREFIX, OutputNamer
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    source = tmp_path / "source"
+    output = tmp_path / "output"
+    (source / "sub").mkdir(parents=True)
+    output.mkdir()
+    return source.resolve(), output.resolve()
+
+
+def write_output(path, size=4096):
+    """A finished output (larger than any placeholder)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"\0" * size)
+
+
+@pytest.mark.parametrize("index", [True, False])
+def test_default_template_claims_suffixes(dirs, index):
+    source, output = dirs
+    namer = OutputNamer(index=index)
+    names = [namer.claim(source / "a.wav", output, ".mp3").name for _ in range(3)]
+    assert names == ["a.mp3", "a_1.mp3", "a_2.mp3"]
+
+
+def test_existing_outputs_are_not_overwritten(dirs):
+    source, output = dirs
+    write_output(output / "a.mp3")
+    write_output(output / "a_4.mp3")
+    namer = OutputNamer()
+    assert namer.claim(source / "a.wav", output, ".mp3").name == "a_5.mp3"
+    assert (output / "a.mp3").stat().st_size == 4096
+
+
+def test_formats_do_not_collide(dirs):
+    source, output = dirs
+    namer = OutputNamer()
+    assert namer.claim(source / "a.wav", output, ".mp3").name == "a.mp3"
+    assert namer.claim(source / "a.wav", output, ".wav").name == "a.wav"
+
+
+def test_hash_template_distinguishes_inputs(dirs):
+    source, output = dirs
+    namer = OutputNamer("hash")
+    first = namer.render(source / "a.wav", output, ".mp3")
+    second = namer.render(source / "sub" / "a.wav", output, ".mp3")
+    assert first != second
+    stem, digest = first.stem.rsplit("-", 1)
+    assert stem == "a" and len(digest) == 12
+
+
+def test_custom_template(dirs):
+    source, output = dirs
+    namer = OutputNamer("converted-{stem}")
+    assert namer.claim(source / "a.wav", output, ".mp3") == output / "converted-a.mp3"
+
+
+@pytest.mark.parametrize("template", ["{name}", "plain", "{stem}-{bogus}"])
+def test_invalid_template(template):
+    with pytest.raises(ValueError):
+        OutputNamer(template)
+
+
+def test_template_cannot_escape_output_directory(dirs):
+    source, output = dirs
+    with pytest.raises(ValueError):
+        OutputNamer("../{stem}").render(source / "a.wav", output, ".mp3")
+
+
+def test_mirror_recreates_source_tree(dirs):
+    source, output = dirs
+    namer = OutputNamer("mirror", source_root=str(source))
+    claimed = namer.claim(source / "sub" / "a.wav", output, ".mp3")
+    assert claimed == output / "sub" / "a.mp3"
+    assert claimed.exists()
+
+
+def test_mirror_input_at_root(dirs):
+    source, output = dirs
+    namer = OutputNamer("mirror", source_root=str(source))
+    assert namer.render(source / "a.wav", output, ".mp3") == output / "a.mp3"
+
+
+def test_mirror_input_outside_root(dirs, tmp_path):
+    source, output = dirs
+    namer = OutputNamer("mirror", source_root=str(source))
+    assert namer.render(tmp_path / "elsewhere.wav", output, ".mp3") == output / "elsewhere.mp3"
+
+
+def test_mirror_without_source_root(dirs):
+    source, output = dirs
+    namer = OutputNamer("mirror")
+    assert namer.claim(source / "sub" / "a.wav", output, ".mp3") == output / "a.mp3"
+
+
+def test_mirror_collisions_are_per_directory(dirs):
+    source, output = dirs
+    namer = OutputNamer("mirror", source_root=str(source))
+    assert namer.claim(source / "a.wav", output, ".mp3") == output / "a.mp3"
+    assert namer.claim(source / "sub" / "a.wav", output, ".mp3") == output / "sub" / "a.mp3"
+    assert namer.claim(source / "sub" / "a.wav", output, ".mp3") == output / "sub" / "a_1.mp3"
+
+
+def test_replace_reuses_earlier_output_once(dirs):
+    source, output = dirs
+    write_output(output / "a.mp3")
+    namer = OutputNamer()
+    replace = str(output / "a.mp3")
+    assert namer.claim(source / "a.wav", output, ".mp3", replace=replace) == output / "a.mp3"
+    # Already claimed: a second conversion gets its own name
+    assert namer.claim(source / "a.wav", output, ".mp3", replace=replace) == output / "a_1.mp3"
+
+
+def test_released_name_is_free_again(dirs):
+    source, output = dirs
+    namer = OutputNamer()
+    claimed = namer.claim(source / "a.wav", output, ".mp3")
+    claimed.unlink()
+    namer.release(claimed)
+    assert namer.claim(source / "a.wav", output, ".mp3") == claimed
+
+
+def test_stale_placeholder_is_reclaimed(dirs, dead_pid):
+    source, output = dirs
+    (output / "a.mp3").write_bytes(PLACEHOLDER_PREFIX + f"{socket.gethostname()}:{dead_pid}".encode())
+    claimed = OutputNamer().claim(source / "a.wav", output, ".mp3")
+    assert claimed == output / "a.mp3"
+    assert (output / "a.mp3").read_bytes() == PLACEHOLDER_PREFIX + f"{socket.gethostname()}:{os.getpid()}".encode()
+    assert [p.name for p in output.iterdir()] == ["a.mp3"]
+
+
+def test_live_placeholder_is_kept(dirs):
+    source, output = dirs
+    placeholder = PLACEHOLDER_PREFIX + f"{socket.gethostname()}:{os.getpid()}".encode()
+    (output / "a.mp3").write_bytes(placeholder)
+    assert OutputNamer().claim(source / "a.wav", output, ".mp3") == output / "a_1.mp3"
+    assert (output / "a.mp3").read_bytes() == placeholder
+
+
+def test_small_file_that_is_not_a_placeholder_is_kept(dirs):
+    source, output = dirs
+    (output / "a.mp3").write_bytes(b"tiny")
+    assert OutputNamer().claim(source / "a.wav", output, ".mp3") == output / "a_1.mp3"
+    assert (output / "a.mp3").read_bytes() == b"tiny"